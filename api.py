@@ -0,0 +1,460 @@
+# api.py
+"""
+Service HTTP local autour du pipeline de formatage, pour les systèmes qui
+déposent des fichiers sans passer par l'interface Streamlit.
+
+    python api.py [--host 127.0.0.1] [--port 8502] [--workers 2]
+
+Routes (réponses JSON, sauf le téléchargement du résultat) :
+    POST   /analyze?filename=…          mapping automatique + rapport d'analyse (échantillon)
+                                        (paramètre `template` : gabarit de sortie)
+    POST   /jobs?filename=…&format=csv  dépôt d'un fichier → {"job": id}
+                                        (`pipeline=1` : lecture / formatage / écriture en
+                                        pipeline par blocs, métriques d'étages dans l'état)
+    GET    /jobs/<id>                   état (queued, running, done, failed) et statistiques
+    GET    /jobs/<id>/result            fichier formaté (csv, xlsx ou parquet ; csv compressé si
+                                        `compression=gzip|zstd|zip` au dépôt)
+    GET    /jobs/<id>/issues            journal structuré (offset, limit, level, category)
+    GET    /jobs/<id>/report            rapport d'analyse des données
+    DELETE /jobs/<id>                   suppression du job et de ses fichiers
+
+Le fichier source est le corps brut de la requête (Content-Length ou
+chunked) ; `mapping`, `value_maps` et `options` sont passés en JSON dans
+l'URL. Un dépôt compressé (gzip, zip, zstd) est reconnu à sa signature et
+décompressé au fil de la lecture. Les corps sont recopiés par blocs vers un fichier temporaire et les
+résultats servis depuis le disque : un gros fichier ne transite jamais en
+entier dans la mémoire du service HTTP. Les jobs passent par l'ordonnanceur
+borné de l'interface (`jobs.JobScheduler`) et expirent JOB_TTL_SECONDS après
+leur fin.
+"""
+from __future__ import annotations
+import argparse, json, os, re, shutil, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+from batch import map_sample, read_mapped, resolve_mapping
+from core import (read_table, generate_data_quality_report, process, issues_frame, to_excel_bytes, write_csv,
+                  detect_compression, strip_compression_suffix, load_shared_resources)
+from jobs import JobScheduler
+from pipeline import run_pipeline
+from schema import template_version
+
+API_HOST = os.environ.get("IMPORT_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("IMPORT_API_PORT", "8502"))
+API_WORKERS = int(os.environ.get("IMPORT_API_WORKERS", "2"))
+MAX_UPLOAD_BYTES = int(os.environ.get("IMPORT_API_MAX_MB", "512")) * 1024 * 1024
+MAX_PENDING_JOBS = 32       # jobs en file ou en cours au-delà desquels un dépôt est refusé (503)
+JOB_TTL_SECONDS = 3600      # durée de conservation d'un job terminé
+CHUNK_BYTES = 1024 * 1024
+ANALYZE_ROWS = 500          # lignes lues pour /analyze
+ISSUES_PAGE = 1000          # taille de page par défaut du journal (maximum : 10 fois plus)
+
+def _write_excel(df: pd.DataFrame, path: str) -> None:
+    with open(path, 'wb') as f:
+        f.write(to_excel_bytes(df))
+
+# Format de sortie → (type MIME, écriture du DataFrame dans un fichier)
+OUTPUT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", write_csv),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", _write_excel),
+    "parquet": ("application/vnd.apache.parquet",
+                lambda df, path: df.to_parquet(path, index=False, compression='zstd')),
+}
+# Compression du résultat CSV → (suffixe, type MIME)
+RESULT_COMPRESSIONS = {"gzip": (".gz", "application/gzip"), "zstd": (".zst", "application/zstd"),
+                       "zip": (".zip", "application/zip")}
+COMPRESSED_UPLOAD_RATIO = 8   # facteur de décompression supposé pour estimer la mémoire d'un job
+
+# Options de process() acceptées dans le paramètre `options`
+PROCESS_OPTIONS = frozenset({
+    'correct_dates', 'uppercase_names', 'user_type_map', 'auto_civility', 'auto_user_type', 'strict',
+    'civil_fallback', 'default_user_type_when_missing', 'require_user_type_choice', 'check_postal', 'check_sirene', 'template',
+})
+
+class ApiError(Exception):
+    """Erreur renvoyée au client avec son code HTTP"""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _json_default(value):
+    # Scalaires numpy / pandas des rapports
+    return value.item() if hasattr(value, 'item') else str(value)
+
+def result_name(out_fmt: str, compression: str | None = None) -> str:
+    """Nom du fichier résultat dans le répertoire du job"""
+    return f"result.{out_fmt}" + (RESULT_COMPRESSIONS[compression][0] if compression else "")
+
+def run_job(source: str, filename: str, job_dir: str, out_fmt: str, saved_mapping: dict | None,
+            value_maps: dict | None, options: dict, compression: str | None = None,
+            pipelined: bool = False) -> dict:
+    """
+    Lit, mappe et formate un fichier déposé ; résultat, journal et rapport écrits dans `job_dir`.
+    `pipelined` : lecture, formatage et écriture recouverts par blocs (pipeline.py),
+    rapport d'analyse établi sur l'échantillon de mapping.
+    """
+    target = os.path.join(job_dir, result_name(out_fmt, compression))
+    extra = {}
+    if pipelined:
+        try:
+            sample, mapping = map_sample(lambda: open(source, 'rb'), filename, saved_mapping, options.get('template'))
+            res = run_pipeline(lambda: open(source, 'rb'), filename, target, out_fmt, compression,
+                               mapping=mapping, value_maps=value_maps, **options)
+        finally:
+            os.remove(source)
+        report = generate_data_quality_report(sample, mapping)
+        report['summary']['total_rows'] = res['stats']['total_rows']
+        stats, errors, warnings = res['stats'], res['errors'], res['warnings']
+        extra['pipeline'] = {'metrics': res['metrics'], 'bottleneck': res['bottleneck'], 'seconds': res['seconds']}
+    else:
+        try:
+            df, mapping, width = read_mapped(lambda: open(source, 'rb'), filename, saved_mapping,
+                                             options.get('template'))
+        finally:
+            os.remove(source)
+        report = generate_data_quality_report(df, mapping, total_columns=width)
+        out_df, stats, errors, warnings = process(df, mapping, value_maps=value_maps, **options)
+        del df
+        if compression:
+            stem = os.path.splitext(strip_compression_suffix(os.path.basename(filename)))[0] or "fichier"
+            write_csv(out_df, target, compression, member=f"{stem}_formate.csv")
+        else:
+            OUTPUT_FORMATS[out_fmt][1](out_df, target)
+        del out_df
+    issues_frame(errors, warnings).to_parquet(os.path.join(job_dir, "issues.parquet"), index=False)
+    with open(os.path.join(job_dir, "report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, default=_json_default)
+    return {'stats': stats, 'mapping': mapping, 'errors': len(errors), 'warnings': len(warnings), **extra}
+
+class ImportService:
+    """
+    Jobs déposés via l'API : un répertoire de travail par job, exécution par
+    un JobScheduler dédié (`workers` traitements simultanés).
+    """
+
+    def __init__(self, workers: int = API_WORKERS, work_dir: str | None = None,
+                 ttl: float = JOB_TTL_SECONDS, max_pending: int = MAX_PENDING_JOBS):
+        # Expiration gérée ici (`expire`), avec le répertoire du job : pas de purge côté ordonnanceur
+        self.scheduler = JobScheduler(max_workers=workers, per_user_limit=workers, ttl=None)
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="import_api_")
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._jobs = {}   # id -> {'dir', 'filename', 'format', 'compression', 'created'}
+
+    def new_upload(self) -> str:
+        """Chemin d'un fichier temporaire pour recevoir un corps de requête"""
+        fd, path = tempfile.mkstemp(prefix="upload_", dir=self.work_dir)
+        os.close(fd)
+        return path
+
+    def submit(self, source: str, filename: str, out_fmt: str, mapping: dict | None,
+               value_maps: dict | None, options: dict, user: str = "api",
+               compression: str | None = None, pipelined: bool = False) -> int:
+        self.expire()
+        snapshot = self.scheduler.snapshot()
+        if snapshot['queued'] + snapshot['running'] >= self.max_pending:
+            raise ApiError(503, "File d'attente pleine, réessayez plus tard")
+        job_dir = tempfile.mkdtemp(prefix="job_", dir=self.work_dir)
+        with open(source, 'rb') as f:
+            ratio = COMPRESSED_UPLOAD_RATIO if detect_compression(f) else 1
+        job_id = self.scheduler.submit(user, run_job, source, filename, job_dir, out_fmt, mapping,
+                                       value_maps, options, compression, pipelined,
+                                       est_bytes=10 * ratio * os.path.getsize(source))
+        with self._lock:
+            self._jobs[job_id] = {'dir': job_dir, 'filename': filename, 'format': out_fmt,
+                                  'compression': compression, 'created': time.time()}
+        return job_id
+
+    def job(self, job_id: int) -> tuple[dict, dict]:
+        """(entrée du job, état dans l'ordonnanceur) ; ApiError 404 si inconnu"""
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        status = self.scheduler.status(job_id) if entry else None
+        if status is None:
+            raise ApiError(404, f"Job {job_id} inconnu")
+        return entry, status
+
+    def finished_file(self, job_id: int, name: str) -> str:
+        """Chemin d'un fichier produit par un job terminé (409 si pas encore prêt)"""
+        entry, status = self.job(job_id)
+        if status['state'] != 'done':
+            raise ApiError(409, f"Job {job_id} non terminé (état : {status['state']})")
+        return os.path.join(entry['dir'], name)
+
+    def delete(self, job_id: int) -> None:
+        _, status = self.job(job_id)
+        if status['state'] not in ('done', 'failed'):
+            raise ApiError(409, f"Job {job_id} en cours, suppression impossible")
+        with self._lock:
+            entry = self._jobs.pop(job_id, None)
+        self.scheduler.forget(job_id)
+        if entry:
+            shutil.rmtree(entry['dir'], ignore_errors=True)
+
+    def expire(self) -> None:
+        """
+        Supprime les jobs terminés depuis plus de `ttl` secondes. Compté depuis
+        la fin du job et non son dépôt : un job resté longtemps en file garde
+        son résultat `ttl` secondes.
+        """
+        now = time.time()
+        with self._lock:
+            job_ids = list(self._jobs)
+        for job_id in job_ids:
+            status = self.scheduler.status(job_id)
+            if status and status['finished'] is not None and now - status['finished'] > self.ttl:
+                try:
+                    self.delete(job_id)
+                except ApiError:
+                    pass  # supprimé entre-temps par une autre requête
+
+    def close(self) -> None:
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+def _json_param(query: dict, name: str):
+    raw = query.get(name, [None])[0]
+    if not raw:
+        return None
+    try:
+        value = json.loads(raw)
+    except ValueError as e:
+        raise ApiError(400, f"Paramètre '{name}' : JSON invalide ({e})")
+    if not isinstance(value, dict):
+        raise ApiError(400, f"Paramètre '{name}' : objet JSON attendu")
+    return value
+
+def _check_template(template: str | None) -> None:
+    try:
+        template_version(template)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "ImportUtilisateur/1.0"
+    service: ImportService = None   # fixé par make_server
+
+    ROUTES = [
+        ("POST", re.compile(r"/analyze"), "analyze"),
+        ("POST", re.compile(r"/jobs"), "submit"),
+        ("GET", re.compile(r"/jobs/(\d+)"), "status"),
+        ("GET", re.compile(r"/jobs/(\d+)/result"), "result"),
+        ("GET", re.compile(r"/jobs/(\d+)/issues"), "issues"),
+        ("GET", re.compile(r"/jobs/(\d+)/report"), "report"),
+        ("DELETE", re.compile(r"/jobs/(\d+)"), "delete"),
+    ]
+
+    def do_GET(self): self._dispatch("GET")
+    def do_POST(self): self._dispatch("POST")
+    def do_DELETE(self): self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        pass  # pas de journal d'accès sur stderr
+
+    def _dispatch(self, method: str) -> None:
+        url = urlsplit(self.path)
+        self.query = parse_qs(url.query)
+        self.body_read = method != "POST"
+        try:
+            for route_method, pattern, name in self.ROUTES:
+                match = pattern.fullmatch(url.path.rstrip("/"))
+                if match and route_method == method:
+                    getattr(self, f"route_{name}")(*(int(g) for g in match.groups()))
+                    return
+            raise ApiError(404, f"Route inconnue : {method} {url.path}")
+        except ApiError as e:
+            self._fail(e.status, str(e))
+        except Exception as e:
+            self._fail(500, f"Erreur interne : {e}")
+
+    def _fail(self, status: int, message: str) -> None:
+        # Corps non (entièrement) lu : la connexion ne peut pas servir une autre requête
+        if not self.body_read:
+            self.close_connection = True
+        self._send_json({'error': message}, status)
+
+    # ---------- Corps de requête / réponse ----------
+    def _receive_body(self, path: str) -> int:
+        """Recopie le corps de la requête dans `path` par blocs ; renvoie sa taille"""
+        chunked = self.headers.get('Transfer-Encoding', '').lower() == 'chunked'
+        if not chunked:
+            if self.headers.get('Content-Length') is None:
+                raise ApiError(411, "Content-Length ou Transfer-Encoding: chunked requis")
+            length = int(self.headers['Content-Length'])
+            if length > MAX_UPLOAD_BYTES:
+                raise ApiError(413, f"Fichier trop volumineux (max {MAX_UPLOAD_BYTES // 2**20} Mo)")
+        total = 0
+        with open(path, 'wb') as out:
+            while True:
+                if chunked:
+                    size = int(self.rfile.readline().split(b';')[0].strip() or b"0", 16)
+                    if size == 0:
+                        while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                            pass  # en-têtes de fin
+                        break
+                else:
+                    size = length - total
+                    if size == 0:
+                        break
+                while size:
+                    block = self.rfile.read(min(size, CHUNK_BYTES))
+                    if not block:
+                        raise ApiError(400, "Corps de requête incomplet")
+                    out.write(block)
+                    size -= len(block)
+                    total += len(block)
+                    if total > MAX_UPLOAD_BYTES:
+                        raise ApiError(413, f"Fichier trop volumineux (max {MAX_UPLOAD_BYTES // 2**20} Mo)")
+                if chunked:
+                    self.rfile.readline()  # CRLF de fin de bloc
+        self.body_read = True
+        return total
+
+    def _upload(self) -> tuple[str, str]:
+        """(chemin du fichier reçu, nom du fichier d'après le paramètre `filename`)"""
+        filename = os.path.basename(self.query.get('filename', [""])[0])
+        if not filename:
+            raise ApiError(400, "Paramètre 'filename' requis (l'extension détermine le format)")
+        path = self.service.new_upload()
+        try:
+            if not self._receive_body(path):
+                raise ApiError(400, "Fichier vide")
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, filename
+
+    def _send_json(self, payload, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path: str, content_type: str, download_name: str | None = None) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        if download_name:
+            self.send_header('Content-Disposition', f'attachment; filename="{download_name}"')
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_BYTES)
+
+    # ---------- Routes ----------
+    def route_analyze(self) -> None:
+        template = self.query.get('template', [None])[0]
+        _check_template(template)
+        path, filename = self._upload()
+        try:
+            with open(path, 'rb') as f:
+                df = read_table(f, filename, nrows=ANALYZE_ROWS, engine="pyarrow")
+        except Exception as e:
+            raise ApiError(422, f"Lecture impossible : {e}")
+        finally:
+            os.remove(path)
+        mapping = resolve_mapping(df, _json_param(self.query, 'mapping'), template)
+        self._send_json({'columns': [str(c) for c in df.columns], 'mapping': mapping,
+                         'report': generate_data_quality_report(df, mapping)})
+
+    def route_submit(self) -> None:
+        out_fmt = self.query.get('format', ["csv"])[0]
+        if out_fmt not in OUTPUT_FORMATS:
+            raise ApiError(400, f"Format '{out_fmt}' inconnu ({', '.join(OUTPUT_FORMATS)})")
+        compression = self.query.get('compression', [None])[0] or None
+        if compression and (compression not in RESULT_COMPRESSIONS or out_fmt != "csv"):
+            raise ApiError(400, f"Compression '{compression}' : {', '.join(RESULT_COMPRESSIONS)} "
+                                f"(format csv uniquement, xlsx et parquet sont déjà compressés)")
+        pipelined = self.query.get('pipeline', ["0"])[0].lower() in ("1", "true", "oui")
+        if pipelined and out_fmt not in ("csv", "parquet"):
+            raise ApiError(400, "Mode pipeline : format csv ou parquet uniquement")
+        mapping = _json_param(self.query, 'mapping')
+        value_maps = _json_param(self.query, 'value_maps')
+        options = _json_param(self.query, 'options') or {}
+        unknown = set(options) - PROCESS_OPTIONS
+        if unknown:
+            raise ApiError(400, f"Options inconnues : {', '.join(sorted(unknown))}")
+        _check_template(options.get('template'))
+        path, filename = self._upload()
+        try:
+            job_id = self.service.submit(path, filename, out_fmt, mapping, value_maps, options,
+                                         user=self.client_address[0], compression=compression,
+                                         pipelined=pipelined)
+        except BaseException:
+            os.remove(path)
+            raise
+        self._send_json({'job': job_id, 'state': 'queued'}, 202)
+
+    def route_status(self, job_id: int) -> None:
+        entry, status = self.service.job(job_id)
+        payload = {'job': job_id, 'state': status['state'], 'position': status['position'],
+                   'filename': entry['filename'], 'format': entry['format']}
+        if status['state'] == 'done':
+            payload.update(status['result'])
+        elif status['state'] == 'failed':
+            payload['error'] = str(status['error'])
+        self._send_json(payload)
+
+    def route_result(self, job_id: int) -> None:
+        entry, _ = self.service.job(job_id)
+        out_fmt, compression = entry['format'], entry['compression']
+        path = self.service.finished_file(job_id, result_name(out_fmt, compression))
+        stem = os.path.splitext(strip_compression_suffix(entry['filename']))[0] or "fichier"
+        if compression:
+            suffix, content_type = RESULT_COMPRESSIONS[compression]
+            name = f"{stem}_formate" + (suffix if compression == "zip" else f".{out_fmt}{suffix}")
+            self._send_file(path, content_type, name)
+        else:
+            self._send_file(path, OUTPUT_FORMATS[out_fmt][0], f"{stem}_formate.{out_fmt}")
+
+    def route_issues(self, job_id: int) -> None:
+        frame = pd.read_parquet(self.service.finished_file(job_id, "issues.parquet"))
+        level = self.query.get('level', [None])[0]
+        if level:
+            frame = frame[frame['niveau'] == {'error': 'Erreur', 'warning': 'Avertissement'}.get(level, level)]
+        category = self.query.get('category', [None])[0]
+        if category:
+            frame = frame[frame['catégorie'] == category]
+        try:
+            offset = max(int(self.query.get('offset', ["0"])[0]), 0)
+            limit = min(max(int(self.query.get('limit', [str(ISSUES_PAGE)])[0]), 0), 10 * ISSUES_PAGE)
+        except ValueError:
+            raise ApiError(400, "offset et limit doivent être des entiers")
+        page = frame.iloc[offset:offset + limit]
+        self._send_json({'total': len(frame), 'offset': offset, 'issues': page.to_dict(orient='records')})
+
+    def route_report(self, job_id: int) -> None:
+        self._send_file(self.service.finished_file(job_id, "report.json"), 'application/json; charset=utf-8')
+
+    def route_delete(self, job_id: int) -> None:
+        self.service.delete(job_id)
+        self._send_json({'job': job_id, 'deleted': True})
+
+def make_server(service: ImportService | None = None, host: str = API_HOST, port: int = API_PORT) -> ThreadingHTTPServer:
+    """Serveur prêt à lancer (`serve_forever`) ; port 0 = port libre choisi par le système"""
+    handler = type("BoundApiHandler", (ApiHandler,), {'service': service or ImportService()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Service HTTP local d'import utilisateur")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    args = parser.parse_args()
+    load_shared_resources()
+    service = ImportService(workers=args.workers)
+    server = make_server(service, args.host, args.port)
+    print(f"Service d'import sur http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -1,13 +1,27 @@
 # app.py
 import streamlit as st
 import pandas as pd
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import json, os, time
+import result_cache
+from jobs import JobScheduler
+from batch import BATCH_WORKERS, new_progress, run_batch
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from core import (
-    read_table, auto_map, process,
-    to_csv_bytes, to_excel_bytes,
+    read_table, auto_map, process, source_columns, strip_compression_suffix,
+    to_csv_bytes, to_excel_bytes, to_parquet_bytes,
     suggest_civilite, suggest_oui_non, suggest_country_code,
-    clean_phone_number, detect_date_format, 
-    analyze_column_values, generate_data_quality_report
+    clean_phone_number, detect_date_format, profile_date_column,
+    analyze_column_values, generate_data_quality_report,
+    build_analysis_sample, build_column_index, issues_frame, issue_index, issue_page, flagged_rows,
+    load_shared_resources, validate, ColumnCache, template_plan, write_review_workbook
 )
+from schema import template_names
+
+# Compression du CSV téléchargé → (méthode, suffixe, type MIME) ; écrite en une passe
+CSV_COMPRESSIONS = {"Aucune": None, "gzip": ("gzip", ".gz", "application/gzip"),
+                    "zstd": ("zstd", ".zst", "application/zstd"), "zip": ("zip", ".zip", "application/zip")}
 
 st.set_page_config(page_title="Import Utilisateur", page_icon="📦", layout="wide")
 st.title("📦 Import Utilisateur")
@@ -20,14 +34,24 @@ with st.sidebar:
     uppercase_names = st.checkbox("Noms en MAJUSCULES", value=True)
     auto_civility   = st.checkbox("Déduire civilité (si vide) depuis le prénom", value=True)
     auto_user_type  = st.checkbox("Déduire type utilisateur si ambigu/absent", value=True)
-    strict          = st.toggle("Mode strict (erreurs bloquantes)", value=False)
+    check_postal    = st.checkbox("Vérifier codes postaux / villes", value=True)
+    check_sirene    = st.checkbox("Vérifier les SIRET (extrait SIRENE)", value=True,
+                                  help="Sans effet si aucun extrait SIRENE n'est installé (sirene.py)")
+    strict          = st.toggle("Mode strict (erreurs bloquantes)", value=False,
+                                help="Les pays corrigés par rapprochement approximatif sont alors rejetés")
     civil_fallback  = st.selectbox("Si civilité introuvable →", ["(laisser vide)", "M.", "Mme"], index=0)
     missing_type_mode = st.radio(
         "Si type utilisateur manquant →",
         ["Me demander", "Forcer 1 (Diplômé)", "Forcer 5 (Étudiant)", "Laisser vide"],
         horizontal=False
     )
-    out_fmt         = st.radio("Format de sortie", ["CSV", "Excel"], horizontal=True)
+    out_fmt         = st.radio("Format de sortie", ["CSV", "Excel", "Parquet"], horizontal=True)
+    csv_compression = st.selectbox("Compression du CSV", list(CSV_COMPRESSIONS), index=0) \
+        if out_fmt == "CSV" else "Aucune"
+    # Gabarits déclarés dans templates/ : le choix n'apparaît que s'il y en a plusieurs
+    templates = template_names()
+    template = st.selectbox("Gabarit de sortie", templates, format_func=lambda n: template_plan(n)['label']) \
+        if len(templates) > 1 else templates[0]
     
     # Nouvelle section d'aide
     st.divider()
@@ -59,61 +83,195 @@ with st.sidebar:
         ❌ Décochez celles à ignorer
         """)
 
-uploaded = st.file_uploader("Déposez un fichier (.csv / .xlsx)", type=["csv", "xlsx", "xls"])
+# ---- Ressources partagées par toutes les sessions du serveur
+@st.cache_resource
+def shared_resources() -> dict:
+    """Prénoms, détecteur de genre, tables pays : chargés une fois par processus"""
+    return load_shared_resources()
+
+@st.cache_resource
+def job_scheduler() -> JobScheduler:
+    """File d'attente bornée des traitements lourds (2 en parallèle, 1 par utilisateur)"""
+    return JobScheduler(max_workers=2, per_user_limit=1)
+
+def session_user() -> str:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
+
+shared_resources()
+
+# Traduction des choix "type manquant"
+default_user_type_when_missing = None
+require_user_type_choice = False
+if missing_type_mode == "Forcer 1 (Diplômé)":
+    default_user_type_when_missing = "1"
+elif missing_type_mode == "Forcer 5 (Étudiant)":
+    default_user_type_when_missing = "5"
+elif missing_type_mode == "Me demander":
+    require_user_type_choice = True
+
+INPUT_TYPES = ["csv", "xlsx", "xls", "parquet", "feather", "arrow", "gz", "zip", "zst"]
+# Extensions des sorties, par format choisi dans la barre latérale
+OUTPUT_EXTENSIONS = {"CSV": "csv", "Excel": "xlsx", "Parquet": "parquet"}
+
+# ---- Traitement par lot : plusieurs fichiers, mapping automatique (ou enregistré), archive zip
+mode = st.radio("Mode", ["Fichier unique", "Lot de fichiers"], horizontal=True, label_visibility="collapsed")
+if mode == "Lot de fichiers":
+    uploads = st.file_uploader("Déposez les fichiers (.csv / .xlsx / .parquet)", type=INPUT_TYPES,
+                               accept_multiple_files=True)
+    saved_upload = st.file_uploader("Mapping enregistré (JSON, optionnel)", type=["json"],
+                                    help="Exporté depuis l'onglet Mapping du mode fichier unique ; "
+                                         "complète le mapping automatique de chaque fichier")
+    output = st.radio("Sortie", ["Un fichier formaté par entrée (zip)", "Un fichier combiné (CSV, zip)"],
+                      horizontal=True)
+    combined = output.startswith("Un fichier combiné")
+    if require_user_type_choice:
+        st.caption("En lot, un fichier sans type utilisateur échoue : choisissez un fallback dans la barre latérale.")
+
+    if uploads and st.button("Traiter le lot", type="primary"):
+        try:
+            saved_mapping = json.load(saved_upload) if saved_upload else None
+        except ValueError as e:
+            st.error(f"Mapping enregistré illisible : {e}")
+            st.stop()
+        if st.session_state.get("batch") and st.session_state.batch.get("archive"):
+            try:
+                os.remove(st.session_state.batch["archive"])
+            except OSError:
+                pass
+        files = [(u.name, u.getvalue()) for u in uploads]
+        batch_options = dict(
+            correct_dates=correct_dates, uppercase_names=uppercase_names, auto_civility=auto_civility,
+            auto_user_type=auto_user_type, strict=strict,
+            civil_fallback=(civil_fallback if civil_fallback in ("M.","Mme") else ""),
+            default_user_type_when_missing=default_user_type_when_missing,
+            require_user_type_choice=require_user_type_choice, check_postal=check_postal,
+            check_sirene=check_sirene, template=template,
+        )
+        progress = new_progress([name for name, _ in files])
+        # Pic mémoire estimé : chaque worker traite un fichier à la fois
+        est_bytes = 10 * BATCH_WORKERS * max(len(data) for _, data in files)
+        job = job_scheduler().submit(
+            session_user(), run_batch, files, batch_options, OUTPUT_EXTENSIONS[out_fmt],
+            combined, saved_mapping, progress, est_bytes=est_bytes
+        )
+        st.session_state.batch = {'job': job, 'progress': progress, 'archive': None}
+
+    batch = st.session_state.get("batch")
+    if batch:
+        progress_df = pd.DataFrame(batch['progress'])
+        finished = progress_df['État'].isin(['terminé', 'échec']).sum()
+        st.progress(finished / len(progress_df), f"{finished} / {len(progress_df)} fichiers traités")
+        st.dataframe(progress_df, hide_index=True, use_container_width=True)
+        if batch['job'] is not None:
+            status = job_scheduler().status(batch['job'])
+            if status is None:
+                batch['job'] = None
+            elif status['state'] in ("queued", "running"):
+                if status['state'] == "queued":
+                    st.info(f"⏳ Lot en file d'attente — position {status['position']}")
+                time.sleep(1)
+                st.rerun()
+            else:
+                if status['state'] == "done":
+                    batch['archive'] = status['result']
+                else:
+                    st.error(str(status['error']))
+                job_scheduler().forget(batch['job'])
+                batch['job'] = None
+        if batch['archive'] and os.path.exists(batch['archive']):
+            with open(batch['archive'], 'rb') as f:
+                st.download_button("Télécharger l'archive (zip)", f, "import_lot.zip", "application/zip",
+                                   use_container_width=True)
+    st.stop()
+
+uploaded = st.file_uploader("Déposez un fichier (.csv / .xlsx / .parquet)", type=INPUT_TYPES)
 if not uploaded:
     st.info("En attente d'un fichier…")
     st.stop()
 
-# ---- Lecture + aperçu
-try:
-    df = read_table(uploaded, uploaded.name)
-except Exception as e:
-    st.error(f"Lecture impossible : {e}")
-    st.stop()
+# ---- Lecture en deux temps : en-têtes + échantillon, puis fichier complet en arrière-plan,
+# réduit aux colonnes utiles au mapping (`source_columns`) dès que celui-ci est connu
+PREVIEW_ROWS = 500
+
+@st.cache_resource
+def background_loader() -> ThreadPoolExecutor:
+    """Pool partagé pour parser les fichiers complets sans bloquer l'affichage"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="read_table")
+
+file_id = getattr(uploaded, "file_id", None) or f"{uploaded.name}:{uploaded.size}"
+if st.session_state.get("loaded_file") != file_id:
+    data = uploaded.getvalue()
+    try:
+        st.session_state.preview_df = read_table(BytesIO(data), uploaded.name, nrows=PREVIEW_ROWS,
+                                                   engine="pyarrow")
+    except Exception as e:
+        st.error(f"Lecture impossible : {e}")
+        st.stop()
+    st.session_state.full_df_future = None
+    st.session_state.full_columns = None
+    st.session_state.loaded_file = file_id
+    st.session_state.dry_report = None
+    # Profil des colonnes (en-têtes + contenu) : calculé une fois par fichier pour l'auto-mapping
+    st.session_state.column_index = build_column_index(st.session_state.preview_df)
 
-st.success(f"Fichier chargé : **{uploaded.name}** — {df.shape[0]} lignes × {df.shape[1]} colonnes")
+def start_full_read(mapping: dict) -> None:
+    """
+    Lance la lecture complète, projetée sur les colonnes du mapping ; relancée
+    seulement si le mapping édité demande une colonne non encore lue.
+    Excel est lu en entier (openpyxl parse toutes les cellules, même hors `usecols`).
+    """
+    if strip_compression_suffix(uploaded.name).lower().endswith(('.xlsx', '.xls')):
+        columns = None
+    else:
+        columns = source_columns(st.session_state.preview_df, mapping)
+    loaded = st.session_state.full_columns
+    if st.session_state.full_df_future is not None and (loaded is None or set(columns or ()) <= set(loaded)):
+        return
+    if st.session_state.full_df_future is not None:
+        st.session_state.full_df_future.cancel()
+    st.session_state.full_df_future = background_loader().submit(
+        read_table, BytesIO(uploaded.getvalue()), uploaded.name, engine="pyarrow", columns=columns)
+    st.session_state.full_columns = columns
+
+def get_full_df() -> pd.DataFrame:
+    """Attend (si besoin) la fin de la lecture complète du fichier (colonnes du mapping)"""
+    future = st.session_state.full_df_future
+    if not future.done():
+        with st.spinner("Lecture complète du fichier…"):
+            return future.result()
+    return future.result()
+
+# L'échantillon suffit au mapping, à l'analyse et à l'aperçu
+df = st.session_state.preview_df
+
+full_future = st.session_state.full_df_future
+if full_future is not None and full_future.done() and full_future.exception() is None:
+    n_rows = len(full_future.result())
+    st.success(f"Fichier chargé : **{uploaded.name}** — {n_rows} lignes × {df.shape[1]} colonnes")
+else:
+    st.success(f"Fichier chargé : **{uploaded.name}** — {df.shape[1]} colonnes (lecture complète en cours…)")
 
 tab_map, tab_result, tab_log = st.tabs(["Mapping", "Résultat", "Journal"])
 
 if "res" not in st.session_state: st.session_state.res = None
 if "user_type_map" not in st.session_state: st.session_state.user_type_map = {}
 
-# Fonction helper pour appliquer les suggestions automatiques
-def apply_automatic_suggestions(df, mapping, session_state):
-    """Applique les suggestions automatiques validées par l'utilisateur"""
-    df_copy = df.copy()
-    
-    for template_col, source_col in mapping.items():
-        if source_col in df.columns:
-            # Pour la civilité, combiner les suggestions de différents niveaux
-            if template_col == 'Civilité (M. / Mme)':
-                value_mapping = {}
-                
-                # Récupérer les suggestions haute confiance
-                high_key = f"suggestions_{template_col}_high"
-                if high_key in session_state:
-                    value_mapping.update(session_state[high_key])
-                
-                # Récupérer les suggestions moyenne confiance
-                medium_key = f"suggestions_{template_col}_medium"
-                if medium_key in session_state:
-                    value_mapping.update(session_state[medium_key])
-                
-                if value_mapping:
-                    df_copy[source_col] = df_copy[source_col].replace(value_mapping)
-            else:
-                # Traitement normal pour les autres colonnes
-                suggestions_key = f"suggestions_{template_col}"
-                if suggestions_key in session_state:
-                    value_mapping = session_state[suggestions_key]
-                    if value_mapping:
-                        df_copy[source_col] = df_copy[source_col].replace(value_mapping)
-    
-    return df_copy
+def collect_value_maps(mapping, session_state) -> dict:
+    """Rassemble les suggestions validées par l'utilisateur, par colonne template"""
+    value_maps = {}
+    for template_col in mapping:
+        value_mapping = {}
+        # Civilité : suggestions haute puis moyenne confiance
+        for suffix in ("", "_high", "_medium"):
+            value_mapping.update(session_state.get(f"suggestions_{template_col}{suffix}") or {})
+        if value_mapping:
+            value_maps[template_col] = value_mapping
+    return value_maps
 
 with tab_map:
     st.subheader("1) Mapping des colonnes")
-    mapping = auto_map(df)
+    mapping = auto_map(df, template, st.session_state.column_index)
 
     # Éditeur de mapping (sans presets)
     template_cols = list(set(list(mapping.keys())))
@@ -131,24 +289,38 @@ with tab_map:
     )
     mapping = {row["Colonne template"]: row["Colonne source"]
                for _, row in edited.iterrows() if row["Colonne source"] != "(aucune)"}
+    start_full_read(mapping)
+    st.download_button("Enregistrer ce mapping (JSON)", json.dumps(mapping, ensure_ascii=False, indent=1),
+                       "mapping.json", "application/json", help="Réutilisable en mode « Lot de fichiers »")
 
     # ---- NOUVELLE SECTION : Analyse automatique des données ----
     st.divider()
     st.subheader("📊 Analyse automatique des données")
 
+    # Échantillon représentatif partagé par tous les analyseurs : d'abord l'aperçu,
+    # affiné sur le fichier complet dès que sa lecture en arrière-plan est terminée
+    full_future = st.session_state.full_df_future
+    if full_future.done() and full_future.exception() is not None:
+        st.error(f"Lecture impossible : {full_future.exception()}")
+        st.stop()
+    full_df = full_future.result() if full_future.done() else None
+    analysis_df = df if full_df is None else full_df
+    sample_for = (file_id, st.session_state.full_columns if full_df is not None else "aperçu")
+    if st.session_state.get("analysis_sample_for") != sample_for:
+        st.session_state.analysis_sample = build_analysis_sample(analysis_df)
+        st.session_state.analysis_sample_for = sample_for
+    analysis_sample = st.session_state.analysis_sample
+
     # Générer le rapport de qualité
-    quality_report = generate_data_quality_report(df, mapping)
+    quality_report = generate_data_quality_report(analysis_df, mapping, sample=analysis_sample,
+                                                  total_columns=len(df.columns))
+    if full_df is None:
+        st.caption(f"Analyse provisoire sur les {len(df)} premières lignes, affinée à la fin de la lecture complète…")
 
-    # Afficher le score de qualité avec une métrique colorée
     col1, col2, col3 = st.columns(3)
     with col1:
-        score = quality_report['quality_score']
-        if score >= 80:
-            st.success(f"**Score de qualité : {score}/100** ✅")
-        elif score >= 60:
-            st.warning(f"**Score de qualité : {score}/100** ⚠️")
-        else:
-            st.error(f"**Score de qualité : {score}/100** ❌")
+        st.metric("Lignes analysées",
+                  f"{quality_report['summary']['sampled_rows']} / {quality_report['summary']['total_rows']}")
 
     with col2:
         st.metric("Colonnes mappées", quality_report['summary']['mapped_columns'])
@@ -174,9 +346,13 @@ with tab_map:
                 with col2:
                     st.write("→")
                 with col3:
+                    fuzzy = sugg.get('confidence') == 'medium'
+                    label = f"Convertir en '{sugg['suggested']}'"
+                    if fuzzy:
+                        label += f" (approché, score {sugg['score']:.0%})"
                     apply = st.checkbox(
-                        f"Convertir en '{sugg['suggested']}'",
-                        value=True,  # Coché par défaut
+                        label,
+                        value=not fuzzy,  # Coché par défaut sauf correspondance approchée
                         key=f"sugg_{col_name}_{sugg['original']}"
                     )
                     if apply:
@@ -194,10 +370,15 @@ with tab_map:
     date_columns = [col for col in mapping.values() if col in df.columns and 'date' in col.lower()]
     if date_columns:
         for col in date_columns:
-            sample_dates = df[col].dropna().head(10).tolist()
-            if sample_dates:
-                detected_format = detect_date_format(sample_dates)
-                st.info(f"**{col}** : Format détecté → {detected_format}")
+            profile = profile_date_column(analysis_sample['rows'][col])
+            if profile['label']:
+                msg = f"**{col}** : Format détecté → {profile['label']} (confiance : {profile['confidence']:.0%})"
+                if profile['confidence'] < 1 and len(profile['ambiguous_rows']):
+                    st.warning(f"{msg} — {len(profile['ambiguous_rows'])} dates ambiguës jour/mois dans l'échantillon")
+                else:
+                    st.info(msg)
+            elif profile['total']:
+                st.info(f"**{col}** : Format détecté → Format non détecté")
     else:
         st.write("Aucune colonne de date détectée")
 
@@ -207,7 +388,8 @@ with tab_map:
     key_type = "Type d'utilisateur* (Diplômé [1] / Etudiant [5])"
     if key_type in mapping and mapping[key_type] in df.columns:
         col_type = mapping[key_type]
-        vals = df[col_type].dropna().astype(str).str.strip().unique().tolist()
+        # Toutes les valeurs distinctes sont nécessaires : fichier complet (aperçu en attendant)
+        vals = analysis_df[col_type].dropna().astype(str).str.strip().unique().tolist()
         vals = [v for v in vals if v not in ("1","5","")]
         if vals:
             cols = st.columns(min(3, len(vals)))
@@ -229,63 +411,179 @@ with tab_map:
     st.subheader("3) Aperçu source (10 lignes)")
     st.dataframe(df.head(10), use_container_width=True)
 
+    with st.expander("🔎 Vérifier seulement (sans produire le fichier)"):
+        d1, d2, d3 = st.columns(3)
+        dry_max_errors = d1.number_input("Arrêter après N erreurs", min_value=0, value=0, step=10, help="0 = sans limite")
+        dry_max_rate = d2.number_input("Taux d'erreur max (%)", min_value=0, max_value=100, value=0, step=5,
+                                       help="0 = sans limite")
+        dry_rate_rows = d3.number_input("…sur les K premières lignes", min_value=10, value=1000, step=100)
+        dry_run = st.button("Vérifier le fichier")
+
     run = st.button("Lancer le traitement", type="primary")
 
-# Traduction des choix "type manquant"
-default_user_type_when_missing = None
-require_user_type_choice = False
-if missing_type_mode == "Forcer 1 (Diplômé)":
-    default_user_type_when_missing = "1"
-elif missing_type_mode == "Forcer 5 (Étudiant)":
-    default_user_type_when_missing = "5"
-elif missing_type_mode == "Me demander":
-    require_user_type_choice = True
+process_options = dict(
+    correct_dates=correct_dates,
+    uppercase_names=uppercase_names,
+    user_type_map=st.session_state.user_type_map,
+    auto_civility=auto_civility,
+    auto_user_type=auto_user_type,
+    strict=strict,
+    civil_fallback=(civil_fallback if civil_fallback in ("M.","Mme") else ""),
+    default_user_type_when_missing=default_user_type_when_missing,
+    require_user_type_choice=require_user_type_choice,
+    check_postal=check_postal,
+    check_sirene=check_sirene,
+    template=template,
+)
+
+def cached_process(key, df, mapping, value_maps, options, column_cache=None):
+    """
+    process() avec cache disque ; exécuté par l'ordonnanceur, hors session.
+    Le cache de colonnes de la session évite de tout recalculer quand une seule option change.
+    """
+    res = result_cache.get(key)
+    if res is None:
+        res = process(df, mapping, value_maps=value_maps, column_cache=column_cache, **options)
+        result_cache.put(key, res)
+    return res
+
+REVIEW_FILE = "review.xlsx"   # classeur de revue, annexé à l'entrée du cache de résultats
+
+def reviewed_process(key, df, mapping, value_maps, options, column_cache=None):
+    """
+    Résultat et classeur de revue d'un même appel de process() : les cellules
+    annotées correspondent exactement au DataFrame écrit. Exécuté par l'ordonnanceur.
+    """
+    data = result_cache.get_file(key, REVIEW_FILE)
+    res = result_cache.get(key) if data is not None else None
+    if res is None:
+        review = {}
+        res = process(df, mapping, value_maps=value_maps, column_cache=column_cache, review=review, **options)
+        bio = BytesIO()
+        write_review_workbook(res[0], review['marks'], bio)
+        data = bio.getvalue()
+        result_cache.put(key, res)
+        result_cache.put_file(key, REVIEW_FILE, data)
+    return res, data
+
+def submit_process(df, mapping, review=False, **options):
+    """
+    Place un traitement dans la file partagée (clé de cache calculée côté session) ;
+    `review` : produit aussi le classeur de revue (job suivi dans `review_job`).
+    """
+    if st.session_state.get("file_hash_id") != file_id:
+        st.session_state.file_hash = result_cache.file_digest(uploaded.getvalue())
+        st.session_state.file_hash_id = file_id
+    value_maps = collect_value_maps(mapping, st.session_state)
+    key = result_cache.cache_key(st.session_state.file_hash, mapping, value_maps, options)
+    # Pic mémoire estimé : entrée + sortie (46 colonnes texte) + journal
+    est_bytes = 3 * int(df.memory_usage(deep=True).sum())
+    if "column_cache" not in st.session_state:
+        st.session_state.column_cache = ColumnCache()
+    job = job_scheduler().submit(
+        session_user(), reviewed_process if review else cached_process, key, df, mapping, value_maps, options,
+        st.session_state.column_cache, est_bytes=est_bytes
+    )
+    if review:
+        st.session_state.review_job = job
+    else:
+        st.session_state.job = job
 
 if run:
     try:
-        # Appliquer d'abord les suggestions automatiques
-        df_with_suggestions = apply_automatic_suggestions(df, mapping, st.session_state)
-        
-        out_df, stats, errors, warnings = process(
-            df_with_suggestions,  # Utiliser le df avec les suggestions appliquées
-            mapping,
-            correct_dates=correct_dates,
-            uppercase_names=uppercase_names,
-            user_type_map=st.session_state.user_type_map,
-            auto_civility=auto_civility,
-            auto_user_type=auto_user_type,
-            strict=strict,
-            civil_fallback=(civil_fallback if civil_fallback in ("M.","Mme") else ""),
-            default_user_type_when_missing=default_user_type_when_missing,
-            require_user_type_choice=require_user_type_choice
-        )
-        st.session_state.res = (out_df, stats, errors, warnings)
-    except ValueError as e:
+        submit_process(get_full_df(), mapping, **process_options)
+    except Exception as e:
+        st.error(str(e))
+
+# ---- Vérification seule : stats, décompte par catégorie et échantillon de messages
+if dry_run:
+    st.session_state.dry_job = job_scheduler().submit(
+        session_user(), validate, get_full_df(), mapping,
+        max_errors=dry_max_errors or None, max_error_rate=(dry_max_rate / 100) or None,
+        rate_rows=int(dry_rate_rows), value_maps=collect_value_maps(mapping, st.session_state), **process_options
+    )
+if st.session_state.get("dry_job"):
+    status = job_scheduler().status(st.session_state.dry_job)
+    if status is None:
+        st.session_state.dry_job = None
+    elif status['state'] in ("queued", "running"):
+        st.info("🔎 Vérification en cours…")
+        time.sleep(1)
+        st.rerun()
+    else:
+        job_scheduler().forget(st.session_state.dry_job)
+        st.session_state.dry_job = None
+        st.session_state.dry_report = status['result'] if status['state'] == "done" else None
+        if status['error']:
+            st.error(str(status['error']))
+if st.session_state.get("dry_report"):
+    report = st.session_state.dry_report
+    with tab_map:
+        st.divider()
+        st.subheader("🔎 Résultat de la vérification")
+        if report['stopped']:
+            st.error(f"Fichier rejeté après {report['rows_checked']} lignes : {report['stopped']}")
+        elif (report['counts']['niveau'] == 'Erreur').any():
+            st.warning(f"{report['rows_checked']} lignes vérifiées : des erreurs bloqueront l'import")
+        else:
+            st.success(f"{report['rows_checked']} lignes vérifiées : fichier importable")
+        st.dataframe(report['counts'], hide_index=True, use_container_width=True)
+        for level, messages in report['samples'].items():
+            if messages:
+                st.caption(f"Exemples ({level.lower()}s)")
+                st.code("\n".join(messages), language=None)
+
+# ---- Suivi du job en cours (file d'attente partagée)
+if st.session_state.get("job"):
+    status = job_scheduler().status(st.session_state.job)
+    if status is None:
+        st.session_state.job = None
+    elif status['state'] in ("queued", "running"):
+        if status['state'] == "queued":
+            st.info(f"⏳ Traitement en file d'attente — position {status['position']}")
+        else:
+            st.info("⚙️ Traitement en cours…")
+        time.sleep(1)
+        st.rerun()
+    elif status['state'] == "done":
+        st.session_state.res = status['result']
+        job_scheduler().forget(st.session_state.job)
+        st.session_state.job = None
+    else:
+        e = status['error']
         if "TYPE_UTILISATEUR_MANQUANT" in str(e):
             st.warning("Des lignes n'ont pas de **Type utilisateur**. Choisissez un fallback :")
             choice = st.radio("Compléter les types manquants par :", ["1 (Diplômé)", "5 (Étudiant)"], horizontal=True)
             if st.button("Appliquer et relancer"):
                 fallback = "1" if choice.startswith("1") else "5"
-                # Appliquer d'abord les suggestions automatiques
-                df_with_suggestions = apply_automatic_suggestions(df, mapping, st.session_state)
-                
-                out_df, stats, errors, warnings = process(
-                    df_with_suggestions,
-                    mapping,
-                    correct_dates=correct_dates,
-                    uppercase_names=uppercase_names,
-                    user_type_map=st.session_state.user_type_map,
-                    auto_civility=auto_civility,
-                    auto_user_type=auto_user_type,
-                    strict=strict,
-                    civil_fallback=(civil_fallback if civil_fallback in ("M.","Mme") else ""),
-                    default_user_type_when_missing=fallback,
-                    require_user_type_choice=False
-                )
-                st.session_state.res = (out_df, stats, errors, warnings)
+                job_scheduler().forget(st.session_state.job)
+                submit_process(get_full_df(), mapping, **{
+                    **process_options,
+                    "default_user_type_when_missing": fallback,
+                    "require_user_type_choice": False,
+                })
+                st.rerun()
         else:
             st.error(str(e))
 
+# ---- Suivi du classeur de revue : son résultat remplace celui affiché
+if st.session_state.get("review_job"):
+    status = job_scheduler().status(st.session_state.review_job)
+    if status is None:
+        st.session_state.review_job = None
+    elif status['state'] in ("queued", "running"):
+        st.info("📝 Préparation du classeur de revue…")
+        time.sleep(1)
+        st.rerun()
+    else:
+        job_scheduler().forget(st.session_state.review_job)
+        st.session_state.review_job = None
+        if status['state'] == "done":
+            st.session_state.res, workbook = status['result']
+            st.session_state.review_export = (st.session_state.res, workbook)
+        else:
+            st.error(str(status['error']))
+
 if st.session_state.res:
     out_df, stats, errors, warnings = st.session_state.res
 
@@ -358,70 +656,94 @@ if st.session_state.res:
         st.dataframe(out_df.head(30), use_container_width=True)
 
         st.divider()
-        if out_fmt == "CSV":
+        if out_fmt == "CSV" and CSV_COMPRESSIONS[csv_compression]:
+            compression, suffix, mime = CSV_COMPRESSIONS[csv_compression]
+            st.download_button(f"Télécharger CSV ({csv_compression})", to_csv_bytes(out_df, compression),
+                               f"import_formate.csv{suffix}" if compression != "zip" else "import_formate.zip",
+                               mime, use_container_width=True)
+        elif out_fmt == "CSV":
             st.download_button("Télécharger CSV", to_csv_bytes(out_df), "import_formate.csv", "text/csv", use_container_width=True)
+        elif out_fmt == "Parquet":
+            st.download_button("Télécharger Parquet", to_parquet_bytes(out_df), "import_formate.parquet",
+                               "application/vnd.apache.parquet", use_container_width=True)
         else:
             st.download_button("Télécharger Excel", to_excel_bytes(out_df), "import_formate.xlsx",
                                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
 
+        # Classeur de revue : cellules corrigées / déduites / invalides colorées et commentées
+        # Mapping et options courants : le résultat affiché est remplacé par celui du classeur
+        if st.button("Préparer le classeur de revue (Excel annoté)"):
+            try:
+                submit_process(get_full_df(), mapping, review=True, **process_options)
+                st.rerun()
+            except Exception as e:
+                st.error(str(e))
+        review_export = st.session_state.get("review_export")
+        if review_export and review_export[0] is st.session_state.res:
+            st.download_button("Télécharger le classeur de revue", review_export[1], "import_revue.xlsx",
+                               "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+
     with tab_log:
-        if warnings:
-            with st.expander(f"⚠️ Avertissements ({len(warnings)})", expanded=False):
-                # Grouper les avertissements par type
-                warning_types = {}
-                for w in warnings:
-                    if "Civilité déduite" in w:
-                        warning_types.setdefault("Civilités déduites", []).append(w)
-                    elif "Type manquant" in w:
-                        warning_types.setdefault("Types manquants", []).append(w)
-                    elif "Email suspect" in w:
-                        warning_types.setdefault("Emails suspects", []).append(w)
-                    elif "Téléphone suspect" in w:
-                        warning_types.setdefault("Téléphones suspects", []).append(w)
-                    elif "Date invalide" in w:
-                        warning_types.setdefault("Dates invalides", []).append(w)
-                    else:
-                        warning_types.setdefault("Autres", []).append(w)
-                
-                # Afficher par catégorie
-                for category, msgs in warning_types.items():
-                    st.write(f"**{category} ({len(msgs)})**")
-                    # Limiter l'affichage si trop de messages
-                    if len(msgs) > 10:
-                        st.write("\n".join(f"• {m}" for m in msgs[:10]))
-                        st.write(f"... et {len(msgs) - 10} autres")
-                    else:
-                        st.write("\n".join(f"• {m}" for m in msgs))
-                    st.write("")  # Espace entre catégories
-                    
-        if errors:
-            with st.expander(f"❌ Erreurs ({len(errors)})", expanded=True):
-                # Grouper les erreurs par type
-                error_types = {}
-                for e in errors:
-                    if "Prénom/Nom manquant" in e:
-                        error_types.setdefault("Données obligatoires manquantes", []).append(e)
-                    elif "TYPE_UTILISATEUR_MANQUANT" in e:
-                        error_types.setdefault("Type utilisateur manquant", []).append(e)
-                    elif "Date invalide" in e:
-                        error_types.setdefault("Dates invalides", []).append(e)
-                    elif "Email invalide" in e:
-                        error_types.setdefault("Emails invalides", []).append(e)
-                    else:
-                        error_types.setdefault("Autres erreurs", []).append(e)
-                
-                # Afficher par catégorie
-                for category, msgs in error_types.items():
-                    st.write(f"**{category} ({len(msgs)})**")
-                    # Limiter l'affichage si trop de messages
-                    if len(msgs) > 10:
-                        st.write("\n".join(f"• {m}" for m in msgs[:10]))
-                        st.write(f"... et {len(msgs) - 10} autres")
-                    else:
-                        st.write("\n".join(f"• {m}" for m in msgs))
-                    st.write("")  # Espace entre catégories
+        # Journal structuré, construit une fois par résultat
+        if st.session_state.get("issues_for") is not st.session_state.res:
+            st.session_state.flagged_export = None
+            st.session_state.issues = issues_frame(errors, warnings)
+            st.session_state.issues_index = issue_index(st.session_state.issues)
+            st.session_state.issues_for = st.session_state.res
+        issues = st.session_state.issues
+        index = st.session_state.issues_index
+
+        if not len(issues):
+            st.success("Aucune erreur ni avertissement.")
+        else:
+            counts = {cat: end - start for cat, (start, end) in index.items()}
+            st.write(" · ".join(f"**{cat}** ({n})" for cat, n in counts.items()))
+
+            f1, f2, f3, f4 = st.columns([3, 2, 1, 1])
+            with f1:
+                categories = st.multiselect("Catégories", list(index), default=list(index))
+            with f2:
+                fields = sorted({field for field in issues.loc[[index[c][0] for c in index], 'champ'] if field})
+                field = st.selectbox("Champ", ["(tous)"] + fields)
+            with f3:
+                row_min = st.number_input("Ligne min", min_value=0, value=0, step=1)
+            with f4:
+                row_max = st.number_input("Ligne max", min_value=0, value=0, step=1, help="0 = sans limite")
+
+            if field != "(tous)":
+                categories = [c for c in categories if issues.at[index[c][0], 'champ'] == field]
+
+            page_size = 50
+            total = issue_page(issues, index, categories, row_min or None, row_max or None, page_size=0)[1]
+            n_pages = max(1, -(-total // page_size))
+            page = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+            page_df, total = issue_page(issues, index, categories, row_min or None, row_max or None,
+                                        page - 1, page_size)
+            st.caption(f"{total} messages correspondant aux filtres")
+            st.dataframe(page_df, hide_index=True, use_container_width=True)
+
+            # Export des lignes source rejetées / signalées (préparé à la demande)
+            st.divider()
+            scope = st.radio("Lignes source à exporter", ["Rejetées (erreurs)", "Signalées (erreurs + avertissements)"],
+                             horizontal=True)
+            levels = ('Erreur',) if scope.startswith("Rejetées") else ('Erreur', 'Avertissement')
+            if st.button("Préparer l'export des lignes"):
+                # Lignes source complètes : toutes les colonnes, pas seulement celles du mapping
+                with st.spinner("Lecture du fichier source…"):
+                    source = read_table(BytesIO(uploaded.getvalue()), uploaded.name, engine="pyarrow")
+                st.session_state.flagged_export = (levels, to_csv_bytes(flagged_rows(source, issues, levels)))
+            export = st.session_state.get("flagged_export")
+            if export and export[0] == levels and st.session_state.get("issues_for") is st.session_state.res:
+                st.download_button("Télécharger les lignes (CSV)", export[1],
+                                   "lignes_rejetees.csv" if levels == ('Erreur',) else "lignes_signalees.csv",
+                                   "text/csv", use_container_width=True)
 else:
     with tab_result:
         st.info("Lancez le traitement depuis l'onglet **Mapping**.")
     with tab_log:
         st.info("Le journal s'affichera après un traitement.")
+
+# ---- Analyse provisoire (aperçu) : nouvelle exécution dès la fin de la lecture complète
+if not st.session_state.full_df_future.done():
+    time.sleep(1)
+    st.rerun()
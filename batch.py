@@ -0,0 +1,161 @@
+# batch.py
+"""
+Traitement par lot : plusieurs fichiers lus, mappés et formatés en parallèle.
+
+Les fichiers sont répartis sur un pool de threads, qui partage avec le
+reste du serveur les ressources en lecture seule (détecteur de genre,
+référentiels). Chaque sortie est écrite dans l'archive zip (sur disque) dès
+qu'elle est prête puis libérée, de sorte que la mémoire reste bornée par le
+nombre de workers et non par le nombre de fichiers.
+"""
+from __future__ import annotations
+import os, tempfile, time, zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+import pandas as pd
+import result_cache
+from core import (read_table, auto_map, process, source_columns, strip_compression_suffix,
+                  to_csv_bytes, to_excel_bytes, to_parquet_bytes)
+
+BATCH_WORKERS = int(os.environ.get("IMPORT_BATCH_WORKERS", min(4, os.cpu_count() or 1)))
+COMBINED_NAME = "import_combine.csv"
+REPORT_NAME = "rapport_lot.csv"
+MAPPING_ROWS = 500   # lignes lues pour établir le mapping, avant la lecture projetée
+
+def resolve_mapping(df: pd.DataFrame, saved: dict | None = None, template: str | None = None) -> dict:
+    """Mapping automatique, corrigé par un mapping enregistré {colonne template: colonne source}"""
+    mapping = auto_map(df, template)
+    for template_col, source_col in (saved or {}).items():
+        if source_col in df.columns:
+            mapping[template_col] = source_col
+    return mapping
+
+def map_sample(open_source, name: str, saved: dict | None = None, template: str | None = None,
+               nrows: int | None = MAPPING_ROWS) -> tuple[pd.DataFrame, dict]:
+    """En-têtes + `nrows` premières lignes (tout le fichier si None), mapping établi sur les MAPPING_ROWS premières"""
+    with open_source() as f:
+        sample = read_table(f, name, nrows=nrows, engine="pyarrow")
+    return sample, resolve_mapping(sample.head(MAPPING_ROWS), saved, template)
+
+def read_mapped(open_source, name: str, saved: dict | None = None,
+                template: str | None = None) -> tuple[pd.DataFrame, dict, int]:
+    """
+    Lecture en deux temps : en-têtes + échantillon pour le mapping, puis le
+    fichier complet réduit aux colonnes utiles (`source_columns`). Sur un
+    export large, les colonnes non mappées ne sont jamais converties.
+    Excel est lu une seule fois (openpyxl parse toutes les cellules, même hors
+    `usecols`) puis projeté en mémoire. `open_source()` renvoie un flux neuf
+    à chaque lecture. Renvoie (données, mapping, nombre de colonnes du fichier).
+    """
+    excel = name.lower().endswith(('.xlsx', '.xls'))
+    sample, mapping = map_sample(open_source, name, saved, template, None if excel else MAPPING_ROWS)
+    width = len(sample.columns)
+    columns = source_columns(sample.head(MAPPING_ROWS), mapping)
+    if excel:
+        return sample[columns], mapping, width
+    with open_source() as f:
+        df = read_table(f, name, engine="pyarrow", columns=columns)
+    return df, mapping, width
+
+def format_file(name: str, data: bytes, options: dict, saved_mapping: dict | None,
+                out_fmt: str, combined: bool) -> dict:
+    """Lit, mappe et formate un fichier (exécuté dans un thread du pool)"""
+    df, mapping, _ = read_mapped(lambda: BytesIO(data), name, saved_mapping, options.get('template'))
+    key = result_cache.cache_key(result_cache.file_digest(data), mapping, None, options)
+    res = result_cache.get(key)
+    if res is None:
+        res = process(df, mapping, **options)
+        result_cache.put(key, res)
+    out_df, stats, errors, warnings = res
+    if combined:
+        # En-tête (avec BOM) écrit une seule fois par l'appelant, puis les corps à la suite
+        header = to_csv_bytes(out_df.iloc[:0])
+        payload = out_df.to_csv(index=False, header=False).encode('utf-8')
+    else:
+        header = b""
+        payload = {"csv": to_csv_bytes, "xlsx": to_excel_bytes, "parquet": to_parquet_bytes}[out_fmt](out_df)
+    return {'header': header, 'payload': payload, 'rows': stats['total_rows'],
+            'mapped': len(mapping), 'errors': len(errors), 'warnings': len(warnings)}
+
+def _entry_names(names: list[str], out_fmt: str) -> list[str]:
+    """Noms des fichiers de sortie dans l'archive, dédoublonnés"""
+    used, result = set(), []
+    for name in names:
+        stem = os.path.splitext(strip_compression_suffix(os.path.basename(name)))[0] or "fichier"
+        candidate, n = f"{stem}_formate.{out_fmt}", 2
+        while candidate in used:
+            candidate, n = f"{stem}_formate_{n}.{out_fmt}", n + 1
+        used.add(candidate)
+        result.append(candidate)
+    return result
+
+def new_progress(names: list[str]) -> list[dict]:
+    """Tableau de suivi (une ligne par fichier), mis à jour par run_batch"""
+    return [{'Fichier': name, 'État': 'en attente', 'Lignes': None, 'Colonnes mappées': None,
+             'Erreurs': None, 'Avertissements': None, 'Durée (s)': None, 'Détail': ''}
+            for name in names]
+
+def run_batch(files: list[tuple[str, bytes]], options: dict, out_fmt: str = "csv",
+              combined: bool = False, saved_mapping: dict | None = None,
+              progress: list[dict] | None = None, workers: int = BATCH_WORKERS) -> str:
+    """
+    Formate une liste de fichiers [(nom, contenu)] et renvoie le chemin de l'archive zip :
+    un fichier formaté par entrée, ou un CSV combiné (dans l'ordre des entrées).
+    Un fichier en échec n'interrompt pas le lot ; il est signalé dans `progress`
+    et dans le rapport joint à l'archive.
+    """
+    progress = progress if progress is not None else new_progress([n for n, _ in files])
+    entries = _entry_names([n for n, _ in files], out_fmt)
+    fd, archive = tempfile.mkstemp(prefix="lot_", suffix=".zip")
+    os.close(fd)
+    workers = max(1, min(workers, len(files)))
+    pending, next_idx = {}, 0   # sorties combinées arrivées en avance
+    header_written = False
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf, \
+         ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        combined_out = zf.open(COMBINED_NAME, "w", force_zip64=True) if combined else None
+        queue = iter(enumerate(files))
+        running = {}
+
+        def submit_next() -> None:
+            # Pas plus de fichiers soumis que de workers : l'état « en cours » est exact
+            # et les sorties en attente d'archivage restent bornées
+            for i, (name, data) in queue:
+                running[pool.submit(format_file, name, data, options, saved_mapping, out_fmt, combined)] = (i, time.perf_counter())
+                progress[i]['État'] = 'en cours'
+                return
+
+        for _ in range(workers):
+            submit_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, t0 = running.pop(future)
+                submit_next()
+                row = progress[i]
+                row['Durée (s)'] = round(time.perf_counter() - t0, 1)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    row.update({'État': 'échec', 'Détail': str(e)[:200]})
+                    result = None
+                else:
+                    row.update({'État': 'terminé', 'Lignes': result['rows'], 'Colonnes mappées': result['mapped'],
+                                'Erreurs': result['errors'], 'Avertissements': result['warnings']})
+                    if not combined:
+                        zf.writestr(entries[i], result['payload'])
+                        result = None  # sortie libérée dès qu'elle est archivée
+                if combined:
+                    pending[i] = result
+                    while next_idx in pending:
+                        part = pending.pop(next_idx)
+                        if part is not None:
+                            if not header_written:
+                                combined_out.write(part['header'])
+                                header_written = True
+                            combined_out.write(part['payload'])
+                        next_idx += 1
+        if combined_out is not None:
+            combined_out.close()
+        zf.writestr(REPORT_NAME, to_csv_bytes(pd.DataFrame(progress)))
+    return archive
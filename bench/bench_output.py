@@ -0,0 +1,37 @@
+# bench/bench_output.py
+"""
+Durée et mémoire de process() sur un gros fichier : pic de RSS au-delà de
+l'état après lecture et chargement des ressources, taille du DataFrame
+produit. Pour comparer avec une version antérieure :
+
+    git worktree add /tmp/avant <commit>
+    python bench/bench_output.py --tree /tmp/avant
+    python bench/bench_output.py [--rows 300000]
+
+Une mesure par processus : le pic de RSS (ru_maxrss) ne redescend jamais.
+"""
+from __future__ import annotations
+import argparse, gc, resource, time
+from data import use_tree, users_csv
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--tree", help="autre copie du dépôt à mesurer (comparaison de versions)")
+    args = parser.parse_args()
+    use_tree(args.tree)
+    import core
+
+    with open(users_csv(args.rows), 'rb') as f:
+        df = core.read_table(f, 'users.csv', engine='pyarrow')
+    mapping = core.auto_map(df)
+    core.load_shared_resources()
+    gc.collect()
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.perf_counter()
+    out, stats, errors, warnings = core.process(df, mapping)
+    elapsed = time.perf_counter() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{args.tree or 'arbre courant'} : {len(out)} lignes  {elapsed:.1f} s  "
+          f"pic +{(peak - base) / 1024:.0f} Mo  sortie {out.memory_usage(deep=True).sum() / 1e6:.0f} Mo  "
+          f"({len(errors)} erreurs, {len(warnings)} avertissements)")
@@ -0,0 +1,48 @@
+# bench/bench_readers.py
+"""
+Lecture et écriture d'un export CSV large : moteur C, lecteur pyarrow de
+pandas (dtype=str), lecteur pyarrow.csv tout-texte de read_table, Parquet et
+Feather, puis exports Parquet et CSV.
+
+    python bench/bench_readers.py [--rows 300000]
+"""
+from __future__ import annotations
+import argparse, io, os, time
+from data import use_tree, users_csv
+
+def measure(label: str, fn, size: int | None = None):
+    t = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t
+    rate = f"  {size / elapsed / 1e6:6.0f} Mo/s" if size else ""
+    print(f"{label:28s} {elapsed:6.2f} s{rate}")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--tree", help="autre copie du dépôt à mesurer (comparaison de versions)")
+    args = parser.parse_args()
+    use_tree(args.tree)
+    import pandas as pd
+    import core
+
+    path = users_csv(args.rows)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    print(f"{os.path.basename(path)} : {len(raw) / 1e6:.0f} Mo, {args.rows} lignes")
+    measure("moteur C", lambda: core.read_table(io.BytesIO(raw), 'users.csv'), len(raw))
+    wrong = measure("pandas pyarrow dtype=str", lambda: pd.read_csv(io.BytesIO(raw), sep=';', dtype=str,
+                                                                    engine='pyarrow'), len(raw))
+    df = measure("pyarrow.csv tout texte", lambda: core.read_table(io.BytesIO(raw), 'users.csv',
+                                                                 engine='pyarrow'), len(raw))
+    # pandas + pyarrow convertit d'abord en nombres : 0612345678 → '612345678.0'
+    print(f"  Mobile lu par pandas/pyarrow : {wrong['Mobile'].dropna().iloc[0]!r}, "
+          f"par read_table : {df['Mobile'].dropna().iloc[0]!r}")
+    parquet = measure("to_parquet (zstd)", lambda: core.to_parquet_bytes(df))
+    buf = io.BytesIO()
+    df.to_feather(buf)
+    feather = buf.getvalue()
+    measure(f"read_parquet ({len(parquet) / 1e6:.1f} Mo)", lambda: core.read_table(io.BytesIO(parquet), 'u.parquet'))
+    measure(f"read_feather ({len(feather) / 1e6:.1f} Mo)", lambda: core.read_table(io.BytesIO(feather), 'u.feather'))
+    measure("to_csv_bytes", lambda: core.to_csv_bytes(df))
@@ -0,0 +1,52 @@
+# bench/bench_value_maps.py
+"""
+Coût des tables de traduction de valeurs (suggestions validées) :
+l'ancienne méthode (copie du DataFrame + Series.replace par colonne) contre
+compile_value_maps(), puis process() complet avec value_maps.
+
+    python bench/bench_value_maps.py [--rows 300000] [--process-rows 30000]
+"""
+from __future__ import annotations
+import argparse, time, tracemalloc
+from data import use_tree, users_csv
+
+VALUE_MAPS = {'Civilité (M. / Mme)': {'Monsieur': 'M.', 'madame': 'Mme'},
+              "A obtenu son diplôme ? (Oui [1] / Non [0])": {'oui': '1', 'non': '0'}}
+USER_TYPE_MAP = {'Etudiant': '5', 'Diplômé': '1'}
+
+def measure(label: str, fn):
+    """Durée et pic d'allocation Python (tracemalloc) d'un appel"""
+    tracemalloc.start()
+    t = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:32s} {elapsed:8.3f} s  pic {peak / 1e6:9.3f} Mo")
+    return result
+
+def replace_columns(df, mapping):
+    out = df.copy()
+    for template_col, table in VALUE_MAPS.items():
+        if template_col in mapping:
+            out[mapping[template_col]] = out[mapping[template_col]].replace(table)
+    return out
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--process-rows", type=int, default=30_000)
+    parser.add_argument("--tree", help="autre copie du dépôt à mesurer (comparaison de versions)")
+    args = parser.parse_args()
+    use_tree(args.tree)
+    import core
+
+    df = core.read_table(open(users_csv(args.rows), 'rb'), 'users.csv')
+    mapping = core.auto_map(df)
+    print(f"{len(df)} lignes x {len(df.columns)} colonnes, {len(VALUE_MAPS)} colonnes traduites")
+    measure("df.copy() + replace", lambda: replace_columns(df, mapping))
+    core.template_plan()   # gabarit compilé hors mesure
+    measure("compile_value_maps", lambda: core.compile_value_maps(VALUE_MAPS, USER_TYPE_MAP))
+    head = df.head(args.process_rows)
+    measure(f"process() {len(head)} lignes", lambda: core.process(head, mapping, user_type_map=USER_TYPE_MAP,
+                                                                   value_maps=VALUE_MAPS))
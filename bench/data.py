@@ -0,0 +1,43 @@
+# bench/data.py
+"""
+Fichiers d'entrée synthétiques des scripts de mesure : export utilisateurs
+de 34 colonnes séparées par `;` (14 colonnes utiles, 20 colonnes de
+remplissage), avec les défauts que le formatage doit corriger (civilités et
+types en toutes lettres, dates ambiguës, pays mal orthographiés, SIRET et
+téléphones invalides). 300 000 lignes ≈ 92 Mo.
+"""
+from __future__ import annotations
+import csv, os, random, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRSTNAMES = ['Jean', 'Marie', 'Kevin', 'Aylin', 'Dominique', 'Camille', 'Zorglub', 'Sophie', 'Luc']
+HEADER = (['Identifiant', 'Civilité', 'Prénom', 'Nom', 'Type', 'Date de naissance', 'Email', 'Code postal',
+           'Ville', 'Pays', 'Mobile', 'Entreprise', 'SIRET', 'Obtenu'] + [f'Champ{i}' for i in range(20)])
+
+def use_tree(path: str | None = None) -> None:
+    """Rend importables les modules du dépôt (ou d'une autre copie, pour comparer deux versions)"""
+    sys.path.insert(0, os.path.abspath(path or ROOT))
+
+def write_users_csv(path: str, rows: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f, delimiter=';')
+        w.writerow(HEADER)
+        for i in range(rows):
+            w.writerow([
+                i, rng.choice(['M', 'Mme', '', 'Monsieur', 'madame', 'F']), rng.choice(FIRSTNAMES), f'nom{i}',
+                rng.choice(['1', '5', 'Etudiant', 'Diplômé', 'alumni', '']),
+                rng.choice(['01/02/1990', '1990-03-04', '13/05/1985', '05/13/1985', '']),
+                rng.choice([f'a{i}@b.fr', 'bad', '']), rng.choice(['75001', '1000', '69003', '']),
+                rng.choice(['Paris', 'Lyon', 'Bourg-en-Bresse']), rng.choice(['France', 'FR', 'Belgique', 'Frnace', '']),
+                rng.choice(['0612345678', '+33612345678', '123', '']), rng.choice(['ACME', '']),
+                rng.choice(['73282932000074', '123', '']), rng.choice(['oui', 'non', '1', '']),
+            ] + ['x' * 10] * 20)
+    return path
+
+def users_csv(rows: int) -> str:
+    """Fichier de `rows` lignes dans le répertoire temporaire, généré une seule fois"""
+    path = os.path.join(tempfile.gettempdir(), f"bench_users_{rows}.csv")
+    if not os.path.exists(path):
+        write_users_csv(path, rows)
+    return path
@@ -1,140 +1,552 @@
 from __future__ import annotations
-import pandas as pd, numpy as np, re, json, unicodedata
+import gzip, io, os, zipfile
+import numpy as np, pandas as pd, re, unicodedata
 from io import BytesIO
 from datetime import datetime
+from contextlib import ExitStack, closing, contextmanager
+from functools import lru_cache
+
+# Les dépendances optionnelles (chardet, gender_guesser) et les modules de
+# référentiels (referentiels, fuzzy, schema, prenoms, sirene) ne sont importés
+# qu'au premier usage réel : l'import de ce module reste limité à pandas.
+# Budget vérifié par tests/test_import_time.py.
 
 # ---------- Template ----------
-TEMPLATE_COLUMNS = [
-    'Champ (Obligatoire) / (Optionnel) :',
-    'Identifiant utilisateurs*',
-    'Civilité (M. / Mme)',
-    'Prénom*',
-    "Nom de naissance / Nom d'état-civil*",
-    'Nom d\'usage / Nom marital',
-    "Type d'utilisateur* (Diplômé [1] / Etudiant [5])",
-    'Date de naissance (jj/mm/aaaa)',
-    'Email personnel 1',
-    'Email personnel 2',
-    'Données Académiques',
-    'Référence du diplôme (Code étape)',
-    'Mode de formation',
-    "Date d'intégration  (jj/mm/aaaa)",
-    "Date d'obtention du diplôme (jj/mm/aaaa)",
-    "A obtenu son diplôme ? (Oui [1] / Non [0])",
-    'Données Personnelles',
-    'Adresse personnelle',
-    'Adresse personnelle - Complément',
-    'Adresse personnelle – Complément 2',
-    'Adresse personnelle - Code postal',
-    'Adresse personnelle - Ville',
-    'Adresse personnelle - Pays (ISO - 2 lettres)',
-    'NPAI (Oui [1] / Non [0])',
-    'Téléphone fixe personnel',
-    'Téléphone mobile personnel',
-    'Nationalité',
-    'Données Professionelles',
-    'Situation actuelle',
-    'Titre du poste actuel',
-    'Type de contrat – Intitulé',
-    "Fonction dans l'entreprise",
-    'Entreprise - Nom',
-    "Entreprise - Secteur d'activité – Intitulé",
-    'Entreprise - Code SIRET',
-    'Entreprise - Site internet',
-    'Adresse professionnelle',
-    'Adresse professionnelle - Complément',
-    'Adresse professionnelle - Code postal',
-    'Adresse professionnelle - Ville',
-    'Adresse professionnelle - Pays (ISO - 2 lettres)',
-    'Téléphone fixe professionnel',
-    'Téléphone mobile professionnel',
-    'Email professionnel',
-    "Début de l'expérience (jj/mm/aaaa)",
-    "Fin de l'expérience (jj/mm/aaaa)"
-]
+# Gabarit par défaut (templates/import_utilisateur.json) ; les autres gabarits
+# sont choisis par le paramètre `template` de auto_map, process et validate.
+# TEMPLATE_COLUMNS et KEYWORDS sont calculés au premier accès (__getattr__).
+def _default_template() -> dict:
+    from schema import load_template, template_version
+    return load_template(template_version())
+
+def __getattr__(name: str):
+    if name == 'TEMPLATE_COLUMNS':
+        return [col['name'] for col in _default_template()['columns']]
+    if name == 'KEYWORDS':
+        # Mots-clés du gabarit par défaut, par colonne (déclarés dans le gabarit)
+        return {col['name']: col['keywords'] for col in _default_template()['columns'] if col['keywords']}
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ---------- Lecture robuste (CSV/XLSX/Parquet/Feather) ----------
+SNIFF_BYTES = 64 * 1024   # octets lus pour détecter encodage et séparateur
+CSV_SEPARATORS = [',',';','\t','|']
 
-# ---------- Lecture robuste (CSV/XLSX) ----------
 def _detect_encoding(file_obj) -> str:
     try:
         import chardet
         pos = file_obj.tell()
-        raw = file_obj.read()
+        raw = file_obj.read(SNIFF_BYTES)
         file_obj.seek(pos)
         res = chardet.detect(raw)
-        return res.get("encoding") or "utf-8"
+        enc = res.get("encoding") or "utf-8"
+        # Un début de fichier ASCII n'exclut pas des accents plus loin
+        return "utf-8" if enc.lower() == "ascii" else enc
     except Exception:
         return "utf-8"
 
-def read_table(upload, filename: str) -> pd.DataFrame:
-    name = filename.lower()
-    if name.endswith(('.xlsx', '.xls')):
-        return pd.read_excel(upload)
+def _sniff_csv(upload) -> tuple[str, str | None]:
+    """Détecte (encodage, séparateur) sur le début du fichier seulement."""
     enc = _detect_encoding(upload)
-    for sep in [',',';','\t','|']:
-        upload.seek(0)
+    pos = upload.tell()
+    head = upload.read(SNIFF_BYTES)
+    upload.seek(pos)
+    if isinstance(head, str):
+        head = head.encode(enc, errors='replace')
+    # Ne garder que des lignes complètes
+    if len(head) == SNIFF_BYTES and b'\n' in head:
+        head = head[:head.rindex(b'\n') + 1]
+    for sep in CSV_SEPARATORS:
         try:
-            df = pd.read_csv(upload, sep=sep, encoding=enc)
-            if df.shape[1] > 1:
-                return df
+            if pd.read_csv(BytesIO(head), sep=sep, encoding=enc, encoding_errors='replace').shape[1] > 1:
+                return enc, sep
         except Exception:
             pass
+    return enc, None
+
+# ---------- Fichiers compressés (gzip, zip, zstd) ----------
+# Signatures reconnues en tête de fichier, quelle que soit l'extension
+COMPRESSION_MAGIC = ((b'\x1f\x8b', 'gzip'), (b'\x28\xb5\x2f\xfd', 'zstd'), (b'PK\x03\x04', 'zip'))
+COMPRESSION_SUFFIXES = {'gzip': ('.gz', '.gzip'), 'zstd': ('.zst', '.zstd'), 'zip': ('.zip',)}
+DATA_SUFFIXES = ('.csv', '.txt', '.tsv', '.xlsx', '.xls', '.parquet', '.pq', '.feather', '.arrow')
+# Formats lus en accès direct (pas en flux) : décompressés en mémoire
+RANDOM_ACCESS_SUFFIXES = ('.xlsx', '.xls', '.parquet', '.pq', '.feather', '.arrow')
+STREAM_BUFFER = 1024 * 1024
+
+def detect_compression(upload) -> str | None:
+    """
+    Compression d'un flux d'après ses premiers octets ('gzip', 'zstd', 'zip'
+    ou None), position remise au début. Un classeur xlsx est une archive zip
+    (avec [Content_Types].xml) : il n'est pas considéré comme compressé.
+    """
     upload.seek(0)
-    return pd.read_csv(upload, sep=None, engine='python', encoding=enc)
-
-# ---------- Auto-mapping (scoring mots-clés) ----------
-KEYWORDS = {
-    'Identifiant utilisateurs*': ['identifiant','id','matricule','code'],
-    'Civilité (M. / Mme)': ['civilite','civilité','mr','mme','genre','titre'],
-    'Prénom*': ['prénom','prenom','firstname','first_name','first name'],
-    "Nom de naissance / Nom d'état-civil*": ['nom','lastname','last_name','last name','nom_famille'],
-    "Type d'utilisateur* (Diplômé [1] / Etudiant [5])": ['type','statut','categorie','catégorie','profil','rôle','role'],
-    'Date de naissance (jj/mm/aaaa)': ['naissance','birth','date_naissance','datenaissance'],
-    'Email personnel 1': ['email','mail','courriel','e-mail'],
-    'Email personnel 2': ['email 2','second email','email secondaire'],
-    'Référence du diplôme (Code étape)': ['diplome','diplôme','formation','code étape','référence diplôme'],
-    "Date d'obtention du diplôme (jj/mm/aaaa)": ['obtention','date diplome','date obtention','fin formation'],
-    "A obtenu son diplôme ? (Oui [1] / Non [0])": ['obtenu','validé','diplômé','réussi'],
-    'Adresse personnelle': ['adresse','rue','street','adresse 1','address'],
-    'Adresse personnelle - Code postal': ['code postal','cp','zip','postal'],
-    'Adresse personnelle - Ville': ['ville','city','commune'],
-    'Adresse personnelle - Pays (ISO - 2 lettres)': ['pays','country'],
-    'Téléphone mobile personnel': ['mobile','portable','gsm','cell'],
-    'Nationalité': ['nationalite','nationalité','citizenship'],
-    'Titre du poste actuel': ['poste','titre','fonction','job title'],
-    'Entreprise - Nom': ['entreprise','société','societe','company','employeur'],
-    'Email professionnel': ['email pro','mail pro','email professionnel']
-}
+    head = upload.read(4)
+    upload.seek(0)
+    kind = next((k for magic, k in COMPRESSION_MAGIC if head.startswith(magic)), None)
+    if kind == 'zip':
+        with zipfile.ZipFile(upload) as zf:
+            if '[Content_Types].xml' in zf.namelist():
+                kind = None
+        upload.seek(0)
+    return kind
 
-def auto_map(df: pd.DataFrame) -> dict:
-    cols = [str(c) for c in df.columns]
+def zip_member(zf: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """Fichier de données d'une archive : le plus volumineux des CSV/Excel/Parquet, hors métadonnées"""
+    members = [i for i in zf.infolist()
+               if not i.is_dir() and not i.filename.startswith('__MACOSX/')
+               and not os.path.basename(i.filename).startswith('.')
+               and i.filename.lower().endswith(DATA_SUFFIXES)]
+    if not members:
+        raise ValueError("Archive zip sans fichier CSV, Excel ou Parquet")
+    return max(members, key=lambda i: i.file_size)
+
+def strip_compression_suffix(filename: str) -> str:
+    """« clients.csv.gz » → « clients.csv »"""
+    lower = filename.lower()
+    for suffix in (s for suffixes in COMPRESSION_SUFFIXES.values() for s in suffixes):
+        if lower.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+class _Borrowed:
+    """
+    Dépôt prêté au lecteur zstd de pyarrow : fermer ce lecteur (à chaque
+    retour en arrière de `_Rewindable`) fermerait aussi le dépôt.
+    """
+    closed = False
+
+    def __init__(self, upload):
+        self._upload = upload
+
+    def __getattr__(self, name):
+        return getattr(self._upload, name)
+
+    def close(self) -> None:
+        pass
+
+class _Rewindable(io.RawIOBase):
+    """
+    Flux décompressé en lecture. Les lecteurs reviennent au début après avoir
+    sondé l'en-tête (encodage, séparateur) : seek en arrière relance la
+    décompression, seek en avant la poursuit, sans copie décompressée.
+    """
+
+    def __init__(self, open_stream):
+        self._open = open_stream
+        self._stream = open_stream()
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_END:
+            raise io.UnsupportedOperation("Flux compressé : taille inconnue avant décompression")
+        target = offset if whence == io.SEEK_SET else self._pos + offset
+        if target < self._pos:
+            self._stream.close()
+            self._stream, self._pos = self._open(), 0
+        while self._pos < target and self.read(min(target - self._pos, STREAM_BUFFER)):
+            pass
+        return self._pos
+
+    def close(self) -> None:
+        self._stream.close()
+        super().close()
+
+def open_compressed(upload, filename: str) -> tuple:
+    """
+    (flux décompressé, nom du fichier de données) pour un dépôt gzip, zstd ou
+    zip (membre choisi par `zip_member`) ; (upload, filename) sinon. Les CSV
+    sont décompressés au fil de la lecture, les formats en accès direct
+    (Excel, Parquet, Feather) en mémoire.
+    """
+    kind = detect_compression(upload)
+    if kind is None:
+        return upload, filename
+    if kind == 'zip':
+        zf = zipfile.ZipFile(upload)
+        info = zip_member(zf)
+        inner, open_stream = os.path.basename(info.filename), lambda: zf.open(info)
+    else:
+        inner = strip_compression_suffix(filename)
+
+        def open_stream():
+            upload.seek(0)
+            if kind == 'gzip':
+                return gzip.GzipFile(fileobj=upload, mode='rb')
+            import pyarrow as pa
+            return pa.CompressedInputStream(pa.PythonFile(_Borrowed(upload), mode='r'), 'zstd')
+    if inner.lower().endswith(RANDOM_ACCESS_SUFFIXES):
+        with open_stream() as f:
+            return BytesIO(f.read()), inner
+    return io.BufferedReader(_Rewindable(open_stream), STREAM_BUFFER), inner
+
+def _read_arrow_file(upload, name: str, nrows: int | None, columns: list | None = None) -> pd.DataFrame:
+    """
+    Parquet / Feather (Arrow IPC) ; avec `nrows`, seuls les premiers lots sont
+    décodés ; avec `columns`, seules ces colonnes (Parquet : seules lues sur disque).
+    """
+    import pyarrow as pa
+    if name.endswith(('.parquet', '.pq')):
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(upload)
+        if columns is not None:
+            wanted = set(columns)
+            columns = [c for c in pf.schema_arrow.names if c in wanted]
+        if nrows is None:
+            return pf.read(columns=columns).to_pandas()
+        batches = pf.iter_batches(batch_size=max(nrows, 1), columns=columns)
+        first = next(batches, None)
+        if first is not None:
+            return first.to_pandas()
+        schema = pf.schema_arrow
+        return (schema if columns is None else pa.schema([schema.field(c) for c in columns])).empty_table().to_pandas()
+    reader = pa.ipc.open_file(upload)
+    if nrows is None:
+        table = reader.read_all()
+    else:
+        batches, n = [], 0
+        for i in range(reader.num_record_batches):
+            if n >= nrows:
+                break
+            batches.append(reader.get_batch(i))
+            n += batches[-1].num_rows
+        table = pa.Table.from_batches(batches, schema=reader.schema).slice(0, nrows)
+    if columns is not None:
+        # Sélection avant la conversion pandas, qui est l'étape coûteuse
+        wanted = set(columns)
+        table = table.select([c for c in table.column_names if c in wanted])
+    return table.to_pandas()
+
+def _read_csv_arrow(upload, enc: str, sep: str, columns: list | None = None) -> pd.DataFrame:
+    """
+    Lecteur CSV pyarrow (multi-thread), toutes colonnes en texte : pas de zéros
+    perdus. Avec `columns`, les autres colonnes sont découpées mais jamais
+    converties ni matérialisées.
+    """
+    import pyarrow as pa, pyarrow.csv as pcsv
+    names = pd.read_csv(upload, sep=sep, encoding=enc, nrows=0).columns
+    if columns is not None:
+        wanted = set(columns)
+        names = [n for n in names if n in wanted]
+    upload.seek(0)
+    table = pcsv.read_csv(
+        upload,
+        read_options=pcsv.ReadOptions(encoding=enc),
+        parse_options=pcsv.ParseOptions(delimiter=sep),
+        convert_options=pcsv.ConvertOptions(column_types={n: pa.string() for n in names},
+                                            include_columns=list(names) if columns is not None else None,
+                                            strings_can_be_null=True),
+    )
+    return table.to_pandas()
+
+def read_table(upload, filename: str, nrows: int | None = None, engine: str = "c",
+               columns: list | None = None) -> pd.DataFrame:
+    """
+    Lit un CSV/Excel/Parquet/Feather. `nrows` limite la lecture aux premières
+    lignes (en-têtes + échantillon), sans parser le reste du fichier.
+    `engine='pyarrow'` lit les CSV avec le lecteur pyarrow, toutes colonnes en
+    texte (l'échantillon `nrows`, non pris en charge par pyarrow, est lu par
+    le moteur C avec les mêmes types).
+    `columns` restreint la lecture à ces colonnes (ordre du fichier, noms
+    absents ignorés) : voir `source_columns`, une fois le mapping connu.
+    Les dépôts compressés (gzip, zip, zstd) sont reconnus à leur signature
+    et décompressés au fil de la lecture (`open_compressed`).
+    """
+    upload, filename = open_compressed(upload, filename)
+    name = filename.lower()
+    usecols = None if columns is None else (lambda c, wanted=set(columns): c in wanted)
+    if name.endswith(('.xlsx', '.xls')):
+        return pd.read_excel(upload, nrows=nrows, usecols=usecols)
+    if name.endswith(('.parquet', '.pq', '.feather', '.arrow')):
+        return _read_arrow_file(upload, name, nrows, columns)
+    upload.seek(0)
+    enc, sep = _sniff_csv(upload)
+    upload.seek(0)
+    dtype = str if engine == "pyarrow" else None
+    if sep is None:
+        return pd.read_csv(upload, sep=None, engine='python', encoding=enc, nrows=nrows, dtype=dtype,
+                           usecols=usecols)
+    if engine == "pyarrow" and nrows is None:
+        try:
+            return _read_csv_arrow(upload, enc, sep, columns)
+        except Exception:
+            # Fichier que pyarrow refuse (UTF-8 invalide, lignes irrégulières…) : moteur C
+            upload.seek(0)
+    try:
+        return pd.read_csv(upload, sep=sep, encoding=enc, nrows=nrows, dtype=dtype, usecols=usecols)
+    except UnicodeDecodeError:
+        # Encodage mal deviné sur le début du fichier : repli Windows-1252
+        upload.seek(0)
+        return pd.read_csv(upload, sep=sep, encoding='cp1252', nrows=nrows, dtype=dtype, usecols=usecols)
+
+def _rebatch(batches, schema, chunk_rows: int):
+    """Lots Arrow de taille quelconque → DataFrames de `chunk_rows` lignes (le dernier plus court)"""
+    import pyarrow as pa
+    pending, size, first = [], 0, True
+    for batch in batches:
+        pending.append(batch)
+        size += batch.num_rows
+        while size >= chunk_rows:
+            table = pa.Table.from_batches(pending, schema=schema)
+            yield table.slice(0, chunk_rows).to_pandas()
+            rest, first = table.slice(chunk_rows), False
+            pending, size = rest.to_batches(), rest.num_rows
+    if size or first:
+        yield pa.Table.from_batches(pending, schema=schema).to_pandas()
+
+def iter_table(upload, filename: str, chunk_rows: int, columns: list | None = None):
+    """
+    Lit un fichier par blocs de `chunk_rows` lignes (DataFrames, index 0..n-1),
+    mêmes valeurs que `read_table(..., engine='pyarrow')`. CSV, Parquet et
+    Feather sont lus au fil des blocs ; Excel, sans lecteur en flux, est lu en
+    entier puis découpé.
+    """
+    upload, filename = open_compressed(upload, filename)
+    name = filename.lower()
+    wanted = None if columns is None else set(columns)
+    if name.endswith(('.xlsx', '.xls')):
+        df = read_table(upload, filename, columns=columns)
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].reset_index(drop=True)
+        return
+    if name.endswith(('.parquet', '.pq')):
+        import pyarrow as pa, pyarrow.parquet as pq
+        pf = pq.ParquetFile(upload)
+        names = pf.schema_arrow.names if wanted is None else [c for c in pf.schema_arrow.names if c in wanted]
+        schema = pa.schema([pf.schema_arrow.field(c) for c in names])
+        yield from _rebatch(pf.iter_batches(batch_size=chunk_rows, columns=names), schema, chunk_rows)
+        return
+    if name.endswith(('.feather', '.arrow')):
+        import pyarrow as pa
+        reader = pa.ipc.open_file(upload)
+        names = [c for c in reader.schema.names if wanted is None or c in wanted]
+        yield from _rebatch((reader.get_batch(i).select(names) for i in range(reader.num_record_batches)),
+                            pa.schema([reader.schema.field(c) for c in names]), chunk_rows)
+        return
+    upload.seek(0)
+    enc, sep = _sniff_csv(upload)
+    upload.seek(0)
+    if sep is not None:
+        import pyarrow as pa, pyarrow.csv as pcsv
+        names = pd.read_csv(upload, sep=sep, encoding=enc, nrows=0).columns
+        names = [n for n in names if wanted is None or n in wanted]
+        upload.seek(0)
+        try:
+            reader = pcsv.open_csv(
+                upload,
+                read_options=pcsv.ReadOptions(encoding=enc),
+                parse_options=pcsv.ParseOptions(delimiter=sep),
+                convert_options=pcsv.ConvertOptions(column_types={n: pa.string() for n in names},
+                                                    include_columns=names if wanted is not None else None,
+                                                    strings_can_be_null=True),
+            )
+        except Exception:
+            # Début de fichier refusé par pyarrow : moteur C par blocs, comme read_table
+            upload.seek(0)
+        else:
+            yield from _rebatch(reader, reader.schema, chunk_rows)
+            return
+    usecols = None if wanted is None else (lambda c: c in wanted)
+    with pd.read_csv(upload, sep=sep, engine='python' if sep is None else 'c', encoding=enc,
+                     dtype=str, usecols=usecols, chunksize=chunk_rows) as chunks:
+        for chunk in chunks:
+            yield chunk.reset_index(drop=True)
+
+def source_columns(sample: pd.DataFrame, mapping: dict) -> list:
+    """
+    Colonnes source à relire une fois le mapping connu (ordre du fichier) :
+    les colonnes mappées, plus les colonnes non mappées susceptibles de porter
+    des indices de civilité, lues par la déduction de civilité (ligne entière)
+    et par le rapport d'analyse : en-tête de genre, ou valeur « monsieur »,
+    « mme »… dans l'échantillon `sample` (en-têtes + premières lignes).
+    """
+    mapped = set(mapping.values())
+    hints = ROW_MALE_HINTS | ROW_FEMALE_HINTS
+    keep = []
+    for col in sample.columns:
+        if col in mapped or any(word in str(col).lower() for word in CIVILITY_HEADER_WORDS):
+            keep.append(col)
+            continue
+        values = sample[col].dropna()
+        if len(values) and values.astype(str).str.strip().str.lower().isin(hints).any():
+            keep.append(col)
+    return keep
+
+# ---------- Auto-mapping (en-têtes + contenu) ----------
+def auto_map(df: pd.DataFrame, template: str | None = None, index: dict | None = None) -> dict:
+    """
+    Propose {colonne template: colonne source}. Chaque colonne du gabarit est
+    notée contre les seules colonnes candidates de l'index (en-têtes partageant
+    un mot avec ses mots-clés, colonnes dont le contenu correspond à son
+    format) : le coût ne dépend plus du produit colonnes × mots-clés.
+    `index` : profil calculé une fois par fichier (`build_column_index`).
+    """
+    plan = template_plan(template)
+    index = index or build_column_index(df)
+    cols = index['columns']
     mapping, used = {}, set()
-    for t in TEMPLATE_COLUMNS:
+    for t in plan['names']:
         if t in cols:
-            mapping[t] = t; used.add(t)
-    for t, kws in KEYWORDS.items():
-        if t in mapping: 
+            mapping[t] = t; used.add(cols.index(t))
+    for spec in plan['columns']:
+        t = spec['name']
+        if not spec['keywords'] or t in mapping:
             continue
+        scores = _header_scores(spec['keywords'], index)
+        signal = FORMAT_SIGNALS.get(spec['format'])
+        # Sans en-tête exploitable (« Champ12 »), le contenu seul peut désigner la colonne
+        for pos in index['by_signal'].get(signal, ()):
+            if index['generic'][pos]:
+                scores.setdefault(pos, 0)
         best, score_best = None, 0
-        for col in cols:
-            if col in used: 
+        for pos in sorted(scores):
+            if pos in used:
                 continue
-            low = col.lower()
-            score = 0
-            for i, kw in enumerate(kws):
-                if low == kw: score = 100; break
-                if low.startswith(kw) or low.endswith(kw): score = max(score, 60-i)
-                if kw in low: score = max(score, 30-i)
+            score = scores[pos] + _content_score(index['signals'][pos], signal)
             if score > score_best:
-                best, score_best = col, score
-        if best:
-            mapping[t] = best; used.add(best)
-    if "Nom de naissance / Nom d'état-civil*" not in mapping and 'Prénom*' in mapping:
-        for col in cols:
-            if col in used: continue
-            if col.lower() in ['nom','name']:
-                mapping["Nom de naissance / Nom d'état-civil*"] = col; used.add(col); break
+                best, score_best = pos, score
+        if best is not None:
+            mapping[t] = cols[best]; used.add(best)
+    # Noms exacts de dernier recours (ex. « name » pour le nom de naissance, si le prénom est mappé)
+    for spec in plan['columns']:
+        fallback, t = spec['fallback_columns'], spec['name']
+        if not fallback or t in mapping or (fallback['if_mapped'] and fallback['if_mapped'] not in mapping):
+            continue
+        for pos, col in enumerate(cols):
+            if pos in used: continue
+            if col.lower() in fallback['names']:
+                mapping[t] = col; used.add(pos); break
     return mapping
 
+# ---------- Profils de colonnes (mapping par le contenu) ----------
+# Signal de contenu attendu pour chaque format de gabarit
+FORMAT_SIGNALS = {'email': 'email', 'date': 'date', 'phone': 'phone', 'siret': 'siret',
+                  'civility': 'civility', 'country': 'country', 'postal_code': 'postal',
+                  'boolean': 'boolean', 'firstname': 'firstname'}
+SIGNAL_MIN_RATIO = 0.6      # part des valeurs non vides à partir de laquelle un signal compte
+SIGNAL_STRONG_RATIO = 0.8   # au-delà, la colonne est réputée d'un autre format
+CONTENT_BONUS = 40          # points (× part) quand le contenu correspond au format attendu
+CONTENT_CONFLICT = 50       # points retirés quand le contenu signale nettement un autre format
+PROFILE_ROWS = 200          # lignes tirées pour profiler le contenu des colonnes
+PHONE_RE = r'(?:\+|00)\d{9,14}|0\d{9}'
+HEADER_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# En-têtes sans information (« Champ12 », « Column 3 », « Unnamed: 4 », vide)
+GENERIC_HEADER_RE = re.compile(r"(?:champ|col|colonne|column|field|var|variable|unnamed|sans titre|untitled)?[\s_:#.\-]*\d*")
+
+def _header_tokens(name) -> tuple:
+    from fuzzy import fold
+    return tuple(HEADER_TOKEN_RE.findall(fold(name)))
+
+def build_column_index(df: pd.DataFrame, budget: int | None = None, sample: dict | None = None) -> dict:
+    """
+    Profil des colonnes source, calculé une fois par fichier :
+    - index inversé mot d'en-tête normalisé → positions de colonnes ;
+    - part des valeurs non vides de chaque colonne qui ressemblent à un
+      e-mail, une date, un téléphone, un SIRET, une civilité, un pays, un
+      code postal, un booléen ou un prénom connu.
+    Les valeurs échantillonnées de toutes les colonnes sont empilées en une
+    seule série : chaque signal est une passe vectorisée, quelle que soit la
+    largeur du fichier.
+    """
+    if sample is not None:
+        rows = sample['rows']
+    else:
+        budget = budget or PROFILE_ROWS
+        rows = df if len(df) <= budget else df.sample(n=budget, random_state=0).sort_index()
+    cols = [str(c) for c in df.columns]
+    tokens = [_header_tokens(c) for c in cols]
+    postings = {}
+    for pos, toks in enumerate(tokens):
+        for tok in set(toks):
+            postings.setdefault(tok, []).append(pos)
+
+    n = len(rows)
+    values = pd.Series(rows.to_numpy(dtype=object).T.ravel(), dtype=object)   # colonne par colonne
+    owner = np.repeat(np.arange(len(cols)), n)
+    s = values.where(values.notna(), "").astype(str).str.strip()
+    filled = (s != "").to_numpy()
+    s, owner = s[filled].reset_index(drop=True), owner[filled]
+    low = s.str.lower()
+    digits = s.str.replace(r"[\s.\-()/]", "", regex=True)
+    siret = digits.str.fullmatch(r"\d{14}")
+    if siret.any():
+        siret[siret] = digits[siret].map(_luhn_ok).astype(bool)
+    names = s.str.fullmatch(r"[^\W\d_]+(?:[ '\-][^\W\d_]+)?")
+    if names.any():
+        uniques = pd.unique(low[names])
+        import prenoms
+        female, male = prenoms.lookup([prenoms.fold_name(u) for u in uniques])
+        known = set(uniques[(female + male) > 0])
+        names[names] = low[names].isin(known)
+    flags = pd.DataFrame({
+        'email': s.str.fullmatch(EMAIL_RE.pattern, case=False),
+        'date': s.str.match(DATE_PARTS_RE),
+        'phone': digits.str.fullmatch(PHONE_RE),
+        'siret': siret,
+        'civility': low.isin(CLEAR_MALE | CLEAR_FEMALE | FEMALE_HINTS | MALE_HINTS),
+        'country': s.str.upper().isin(_COUNTRY_ALIASES) | s.str.fullmatch(r"[A-Z]{2}"),
+        'postal': digits.str.fullmatch(r"\d{5}"),
+        'boolean': low.isin(OUI_PATTERNS | NON_PATTERNS),
+        'firstname': names,
+    }).fillna(False).astype(bool)
+    ratios = flags.groupby(owner).mean().reindex(range(len(cols)), fill_value=0.0)
+    signals = [{k: v for k, v in r.items() if v >= SIGNAL_MIN_RATIO} for r in ratios.to_dict('records')]
+    by_signal = {}
+    for pos, found in enumerate(signals):
+        for sig in found:
+            by_signal.setdefault(sig, []).append(pos)
+    from fuzzy import fold
+    return {'columns': cols, 'folded': [fold(c) for c in cols], 'tokens': tokens, 'postings': postings,
+            'signals': signals, 'by_signal': by_signal,
+            'generic': [bool(GENERIC_HEADER_RE.fullmatch(f)) for f in (fold(c) for c in cols)]}
+
+def _header_scores(keywords: list, index: dict) -> dict:
+    """
+    Note des en-têtes candidats (position → score) : égalité normalisée 100,
+    mots-clés en début ou fin d'en-tête 60 - rang, mots-clés présents 30 - rang.
+    """
+    from fuzzy import fold
+    scores = {}
+    for i, kw in enumerate(keywords):
+        kt = _header_tokens(kw)
+        if not kt:
+            continue
+        candidates = set(index['postings'].get(kt[0], ()))
+        for tok in kt[1:]:
+            candidates &= set(index['postings'].get(tok, ()))
+        folded_kw = fold(kw)
+        for pos in candidates:
+            ht = index['tokens'][pos]
+            if index['folded'][pos] == folded_kw:
+                score = 100
+            elif ht[:len(kt)] == kt or ht[-len(kt):] == kt:
+                score = 60 - i
+            else:
+                score = 30 - i
+            scores[pos] = max(scores.get(pos, 0), score)
+    return scores
+
+def _content_score(found: dict, signal: str | None) -> float:
+    """Bonus si le contenu correspond au format attendu, malus s'il en signale nettement un autre"""
+    if signal in found:
+        return CONTENT_BONUS * found[signal]
+    if any(r >= SIGNAL_STRONG_RATIO for r in found.values()):
+        return -CONTENT_CONFLICT
+    return 0
+
 # ---------- Base de prénoms étendue pour une meilleure détection ----------
 
 # Prénoms féminins français courants (étendu)
@@ -142,7 +554,7 @@ FEMALE_FIRSTNAMES_FR = {
     # Classiques
     "marie", "jeanne", "francoise", "monique", "catherine", "nathalie", "isabelle", 
     "sylvie", "martine", "christine", "nicole", "brigitte", "anne", "annie",
-    "jacqueline", "michele", "danielle", "dominique_f", "valerie", "sophie",
+    "jacqueline", "michele", "danielle", "valerie", "sophie",
     
     # Modernes
     "julie", "aurelie", "emilie", "camille", "pauline", "marine", "marion",
@@ -188,7 +600,7 @@ MALE_FIRSTNAMES_FR = {
     "jonathan", "kevin", "bryan", "brandon", "dylan", "jordan",
     "fabrice", "cedric", "ludovic", "jerome", "gregory", "yannick",
     "bruno", "thierry", "didier", "serge", "marc", "yves", "denis",
-    "dominique_m", "francis", "guy", "herve", "joel", "lionel",
+    "francis", "guy", "herve", "joel", "lionel",
     "maurice", "norbert", "pascal", "regis", "sylvain", "xavier",
     
     # Prénoms composés courants
@@ -196,12 +608,42 @@ MALE_FIRSTNAMES_FR = {
     "jean-luc", "jean-michel", "pierre-yves", "marie-joseph"
 }
 
+# Indices contradictoires recherchés dans les autres colonnes de la ligne
+ROW_MALE_HINTS = frozenset({"monsieur", "m.", "m", "mr", "homme"})
+ROW_FEMALE_HINTS = frozenset({"madame", "mme", "mlle", "mademoiselle", "femme"})
+# Mots d'en-tête d'une colonne non mappée susceptible d'indiquer le genre
+CIVILITY_HEADER_WORDS = ('genre', 'sexe', 'sex', 'gender', 'titre', 'title')
+
 # Prénoms mixtes (à éviter pour la déduction)
 UNISEX_FIRSTNAMES = {
     "dominique", "claude", "camille", "maxime", "alex", "sacha",
     "charlie", "morgan", "lou", "noa", "andrea", "ange", "alix"
 }
 
+# Correspondance genre gender_guesser → (civilité, confiance)
+GENDER_GUESSER_CIVILITY = {
+    "female": ("Mme", "medium"),
+    "male": ("M.", "medium"),
+    "mostly_female": ("Mme", "low"),
+    "mostly_male": ("M.", "low"),
+}
+
+@lru_cache(maxsize=1)
+def _gender_detector():
+    """Détecteur gender_guesser chargé une seule fois (None si indisponible)."""
+    try:
+        import gender_guesser.detector as _gg
+        return _gg.Detector(case_sensitive=False)
+    except Exception:
+        return None
+
+# Confiance selon la part du genre majoritaire dans les effectifs (naissances) du prénom
+GENDER_SHARE_HIGH = 0.95
+GENDER_SHARE_MEDIUM = 0.85
+GENDER_SHARE_LOW = 0.65
+GENDER_MIN_COUNT_HIGH = 500   # un prénom plus rare plafonne à la confiance moyenne
+GENDER_PRIOR = 1.0            # effectif ajouté à chaque genre (lissage des très petits effectifs)
+
 def _norm_firstname(x: str) -> str:
     s = str(x or "").strip()
     if not s: return ""
@@ -209,6 +651,83 @@ def _norm_firstname(x: str) -> str:
     s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
     return s.lower()
 
+def _civility_from_counts(female: np.ndarray, male: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Civilité et confiance depuis les effectifs ; ("", "low") si le prénom est mixte, ("", "") si inconnu"""
+    female = female + GENDER_PRIOR
+    male = male + GENDER_PRIOR
+    share = np.maximum(female, male) / (female + male)
+    civ = np.where(female > male, "Mme", "M.").astype(object)
+    frequent = female + male >= GENDER_MIN_COUNT_HIGH
+    conf = np.select([(share >= GENDER_SHARE_HIGH) & frequent, share >= GENDER_SHARE_MEDIUM, share >= GENDER_SHARE_LOW],
+                     ["high", "medium", "low"], "").astype(object)
+    civ[conf == ""] = ""
+    conf[conf == ""] = "low"
+    unknown = (female + male) == 2 * GENDER_PRIOR
+    civ[unknown], conf[unknown] = "", ""
+    return civ, conf
+
+def _deduce_unique_firstnames(firstnames: list) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Déduction pour des prénoms distincts : listes de référence (mixtes, puis
+    féminins/masculins), puis statistiques de prénoms sur le prénom complet
+    (« jean-pierre ») ou à défaut le premier prénom, puis gender_guesser si
+    le fichier de statistiques est absent.
+    """
+    n = len(firstnames)
+    civ = np.full(n, "", dtype=object)
+    conf = np.full(n, "", dtype=object)
+    first = [_norm_firstname(f) for f in firstnames]
+    todo = []
+    for k, f in enumerate(first):
+        if not f:
+            continue
+        if f in UNISEX_FIRSTNAMES:
+            conf[k] = "low"
+        elif f in FEMALE_FIRSTNAMES_FR:
+            civ[k], conf[k] = "Mme", "high"
+        elif f in MALE_FIRSTNAMES_FR:
+            civ[k], conf[k] = "M.", "high"
+        else:
+            todo.append(k)
+    if not todo:
+        return civ, conf
+
+    import prenoms
+    table = prenoms.name_table()
+    if table is not None:
+        female, male = prenoms.lookup([prenoms.fold_name(firstnames[k]) for k in todo], table)
+        missing = (female + male) == 0
+        if missing.any():
+            f2, m2 = prenoms.lookup([first[k] for k in np.asarray(todo)[missing]], table)
+            female[missing], male[missing] = f2, m2
+        civ[todo], conf[todo] = _civility_from_counts(female, male)
+        return civ, conf
+
+    detector = _gender_detector()
+    if detector is not None:
+        for k in todo:
+            civ[k], conf[k] = GENDER_GUESSER_CIVILITY.get(detector.get_gender(first[k]), ("", ""))
+    return civ, conf
+
+def deduce_civility_column(firstnames) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Déduit la civilité de toute une colonne de prénoms : calcul sur les
+    valeurs distinctes seulement (jointure sur la table de prénoms), puis
+    redistribution. Les indices des autres colonnes ne sont pas vérifiés
+    (voir `row_contradicts_civility`).
+
+    Returns:
+        tuple: (civilités, confiances) en tableaux alignés sur `firstnames`
+    """
+    codes, uniques = pd.factorize(pd.Series(list(firstnames), dtype=object).fillna("").astype(str))
+    civ, conf = _deduce_unique_firstnames(list(uniques))
+    return civ[codes], conf[codes]
+
+def row_contradicts_civility(civility: str, row_data: dict | None) -> bool:
+    """Vrai si une autre colonne de la ligne indique le genre opposé (« monsieur » pour Mme…)"""
+    hints = ROW_MALE_HINTS if civility == "Mme" else ROW_FEMALE_HINTS
+    return bool(row_data) and any(str(v).lower().strip() in hints for v in row_data.values())
+
 def deduce_civility_from_firstname_advanced(firstname: str, row_data: dict = None) -> tuple[str, str]:
     """
     Déduit la civilité depuis le prénom avec un niveau de confiance.
@@ -218,61 +737,10 @@ def deduce_civility_from_firstname_advanced(firstname: str, row_data: dict = Non
     """
     if not firstname:
         return "", ""
-    
-    # Normaliser le prénom
-    f = _norm_firstname(firstname)
-    if not f:
-        return "", ""
-    
-    # Si c'est un prénom mixte, on ne peut pas déduire
-    if f in UNISEX_FIRSTNAMES:
-        return "", "low"
-    
-    # Gestion des prénoms composés
-    if "-" in firstname:
-        parts = firstname.lower().split("-")
-        # Prendre le premier prénom du composé
-        f = parts[0].strip()
-    
-    # Chercher dans les listes étendues
-    if f in FEMALE_FIRSTNAMES_FR:
-        # Vérifier s'il n'y a pas d'indices contradictoires dans les autres colonnes
-        if row_data:
-            # Chercher des indices dans d'autres colonnes non mappées
-            for col_name, col_value in row_data.items():
-                val_lower = str(col_value).lower().strip()
-                # Si on trouve "monsieur" ou "m." ailleurs, c'est contradictoire
-                if val_lower in ["monsieur", "m.", "m", "mr", "homme"]:
-                    return "", "low"  # Conflit détecté
-        return "Mme", "high"
-    
-    if f in MALE_FIRSTNAMES_FR:
-        # Vérifier s'il n'y a pas d'indices contradictoires
-        if row_data:
-            for col_name, col_value in row_data.items():
-                val_lower = str(col_value).lower().strip()
-                if val_lower in ["madame", "mme", "mlle", "mademoiselle", "femme"]:
-                    return "", "low"  # Conflit détecté
-        return "M.", "high"
-    
-    # Si on a gender_guesser, l'utiliser en fallback
-    try:
-        import gender_guesser.detector as _gg
-        detector = _gg.Detector(case_sensitive=False)
-        gender = detector.get_gender(f)
-        
-        if gender == "female":
-            return "Mme", "medium"
-        elif gender == "male":
-            return "M.", "medium"
-        elif gender == "mostly_female":
-            return "Mme", "low"
-        elif gender == "mostly_male":
-            return "M.", "low"
-    except:
-        pass
-    
-    return "", ""
+    civ, conf = deduce_civility_column([firstname])
+    if civ[0] and row_contradicts_civility(civ[0], row_data):
+        return "", "low"  # Conflit détecté
+    return civ[0], conf[0]
 
 # Remplacer l'ancienne fonction deduce_civility_from_firstname
 deduce_civility_from_firstname = deduce_civility_from_firstname_advanced
@@ -301,6 +769,84 @@ def format_date(value: str) -> str:
     try: return pd.to_datetime(s, dayfirst=True).strftime('%d/%m/%Y')
     except: return s
 
+# ---------- Profil de dates (colonne entière) ----------
+DATE_PARTS_RE = r'^(\d{1,4})([/.\-])(\d{1,2})[/.\-](\d{1,4})(?:[ T].*)?$'
+
+def profile_date_column(values) -> dict:
+    """
+    Profile une colonne de dates entière (extraction regex vectorisée) et choisit
+    l'ordre jour/mois sur les preuves de la colonne : partie > 12, position de
+    l'année, séparateur dominant. À égalité (aucune preuve), JJ/MM l'emporte.
+
+    Returns:
+        dict: format (strptime), label, dayfirst, confidence (0-1),
+              ambiguous_rows (index des lignes JJ/MM indécidables), matched, total
+    """
+    s = pd.Series(values, dtype=object).dropna().astype(str).str.strip()
+    s = s[s != ""]
+    parts = s.str.extract(DATE_PARTS_RE)
+    ok = parts[0].notna()
+    a = pd.to_numeric(parts[0], errors='coerce')
+    b = pd.to_numeric(parts[2], errors='coerce')
+    year_first = ok & (parts[0].str.len() == 4)
+    year_last = ok & ~year_first & (parts[3].str.len() == 4)
+
+    day_evidence = int((year_last & (a > 12) & (b <= 12)).sum())
+    month_evidence = int((year_last & (b > 12) & (a <= 12)).sum())
+    dayfirst = day_evidence >= month_evidence
+    ambiguous = year_last & (a <= 12) & (b <= 12) & (a != b)
+    decided = day_evidence + month_evidence
+    if decided:
+        confidence = max(day_evidence, month_evidence) / decided
+    else:
+        confidence = 0.5 if ambiguous.any() else 1.0
+
+    sep = parts.loc[ok, 1].mode()
+    sep = sep.iloc[0] if len(sep) else '/'
+    if year_first.sum() > year_last.sum():
+        fmt, label = f'%Y{sep}%m{sep}%d', f'AAAA{sep}MM{sep}JJ'
+    elif dayfirst:
+        fmt, label = f'%d{sep}%m{sep}%Y', f'JJ{sep}MM{sep}AAAA'
+    else:
+        fmt, label = f'%m{sep}%d{sep}%Y', f'MM{sep}JJ{sep}AAAA'
+
+    return {
+        'format': fmt,
+        'label': label if ok.any() else None,
+        'dayfirst': dayfirst,
+        'confidence': round(confidence, 3),
+        'ambiguous_rows': s.index[ambiguous],
+        'matched': int(ok.sum()),
+        'total': len(s),
+    }
+
+def format_date_column(values: pd.Series, profile: dict | None = None) -> pd.Series:
+    """
+    Formate une colonne entière en JJ/MM/AAAA en une passe, selon le profil de
+    la colonne. Les valeurs non reconnues passent par `format_date` (ligne à ligne).
+    """
+    s = values.astype(object).where(values.notna(), "").astype(str).str.strip()
+    if profile is None:
+        profile = profile_date_column(s)
+    parts = s.str.extract(DATE_PARTS_RE)
+    year_first = parts[0].str.len() == 4
+    first, last = (parts[0], parts[2]) if profile['dayfirst'] else (parts[2], parts[0])
+    day = parts[3].where(year_first, first)
+    month = parts[2].where(year_first, last)
+    year = parts[0].where(year_first, parts[3])
+    year = year.where(year.str.len() == 4)
+    dates = pd.to_datetime(
+        pd.DataFrame({'year': pd.to_numeric(year, errors='coerce'),
+                      'month': pd.to_numeric(month, errors='coerce'),
+                      'day': pd.to_numeric(day, errors='coerce')}),
+        errors='coerce'
+    )
+    out = dates.dt.strftime('%d/%m/%Y').astype(object)
+    todo = out.isna() & (s != "")
+    out[todo] = s[todo].map(format_date)
+    out[s == ""] = ""
+    return out
+
 EMAIL_RE = re.compile(r"^[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}$", re.I)
 
 def format_email(value: str, warnings, rownum, strict: bool) -> str:
@@ -336,7 +882,15 @@ def format_country(value: str, warnings, rownum, strict: bool) -> str:
     for k,v in FALLBACK_COUNTRIES.items():
         if k in up or up in k:
             return v
-    msg = f"Ligne {rownum}: Pays non reconnu '{value}'"
+    code = fuzzy_best('country', s)
+    # Correction appliquée d'office pour une faute de frappe seulement (« Frnace ») : à deux
+    # erreurs, un autre pays réel est souvent aussi proche (« Nigeria » / « Algeria »), le code
+    # reste une suggestion. Mode strict : toute correction approximative n'est qu'une
+    # supposition, la ligne est rejetée avec la suggestion dans le message.
+    if code and not strict and fuzzy_best('country', s, max_edits=FUZZY_AUTO_EDITS):
+        warnings.append(f"Ligne {rownum}: Pays '{value}' interprété comme '{code}'")
+        return code
+    msg = f"Ligne {rownum}: Pays non reconnu '{value}'" + (f" (suggestion : '{code}')" if code else "")
     if strict: raise ValueError(msg)
     warnings.append(msg)
     return s[:2].upper() if len(s)>=2 else s
@@ -376,28 +930,42 @@ def format_siret(value: str, warnings, rownum, strict: bool) -> str:
         warnings.append(msg)
     return s
 
+USER_TYPE_KEYWORDS = (
+    ('1', ('diplome','diplôme','diplômé','alumni','ancien')),
+    ('5', ('etudiant','étudiant','eleve','élève','student','stagiaire')),
+)
+
 def suggest_user_type(val: str) -> str | None:
     v = str(val).lower()
-    if any(k in v for k in ['diplome','diplôme','diplômé','alumni','ancien']): return '1'
-    if any(k in v for k in ['etudiant','étudiant','eleve','élève','student','stagiaire']): return '5'
-    return None
+    for code, keywords in USER_TYPE_KEYWORDS:
+        if any(k in v for k in keywords): return code
+    return fuzzy_best('user_type', val)
 
 # ========== NOUVELLES FONCTIONS D'AMÉLIORATION ==========
 
+# Variantes courantes de civilité (tables construites une seule fois à l'import)
+CIVILITE_PATTERNS = {
+    'M.': frozenset({'m', 'mr', 'monsieur', 'homme', 'h', 'm.', 'masculin', 'male', 'mister'}),
+    'Mme': frozenset({'mme', 'madame', 'femme', 'f', 'mlle', 'mademoiselle', 'feminin', 'female', 'mrs', 'miss', 'ms'}),
+}
+# Motifs recherchés en sous-chaîne (longueur > 2), ordre de priorité conservé
+_CIVILITE_SUBSTRINGS = tuple(
+    (correct, tuple(sorted(p for p in patterns if len(p) > 2)))
+    for correct, patterns in CIVILITE_PATTERNS.items()
+)
+
 def suggest_civilite(val: str) -> str | None:
     """Suggère une civilité basée sur des variantes courantes"""
     v = str(val).lower().strip()
     
-    # Variantes courantes
-    CIVILITE_PATTERNS = {
-        'M.': ['m', 'mr', 'monsieur', 'homme', 'h', 'm.', 'masculin', 'male', 'mister'],
-        'Mme': ['mme', 'madame', 'femme', 'f', 'mlle', 'mademoiselle', 'feminin', 'female', 'mrs', 'miss', 'ms']
-    }
-    
-    for correct, patterns in CIVILITE_PATTERNS.items():
-        if v in patterns or any(p in v for p in patterns if len(p) > 2):
+    for correct, substrings in _CIVILITE_SUBSTRINGS:
+        if v in CIVILITE_PATTERNS[correct] or any(p in v for p in substrings):
             return correct
-    return None
+    return fuzzy_best('civilite', val)
+
+# Valeurs qui indiquent sans ambiguïté la civilité
+CLEAR_MALE = frozenset({"m", "m.", "mr", "monsieur", "homme", "masculin", "male", "mister"})
+CLEAR_FEMALE = frozenset({"f", "mme", "mlle", "madame", "mademoiselle", "femme", "feminin", "female", "mrs", "miss", "ms"})
 
 def suggest_civilite_with_confidence(val: str, firstname: str = None, row_data: dict = None) -> tuple[str, str]:
     """
@@ -409,9 +977,6 @@ def suggest_civilite_with_confidence(val: str, firstname: str = None, row_data:
     v = str(val).lower().strip()
     
     # D'abord vérifier si la valeur actuelle donne déjà une indication claire
-    CLEAR_MALE = ["m", "m.", "mr", "monsieur", "homme", "masculin", "male", "mister"]
-    CLEAR_FEMALE = ["f", "mme", "mlle", "madame", "mademoiselle", "femme", "feminin", "female", "mrs", "miss", "ms"]
-    
     if v in CLEAR_MALE:
         return "M.", "high"
     if v in CLEAR_FEMALE:
@@ -425,51 +990,120 @@ def suggest_civilite_with_confidence(val: str, firstname: str = None, row_data:
     
     return "", ""
 
+OUI_PATTERNS = frozenset({'oui', 'o', 'yes', 'y', '1', 'true', 'vrai', 'x', 'ok', 'validé', 'obtenu', 'diplômé'})
+NON_PATTERNS = frozenset({'non', 'n', 'no', '0', 'false', 'faux', 'nok', 'ko', 'pas obtenu', 'en cours'})
+OUI_SUBSTRINGS = ('oui', 'yes', 'validé', 'obtenu')
+NON_SUBSTRINGS = ('non', 'no', 'pas', 'aucun')
+
 def suggest_oui_non(val: str) -> str | None:
     """Suggère 1 ou 0 pour les champs booléens"""
     v = str(val).lower().strip()
     
-    OUI_PATTERNS = ['oui', 'o', 'yes', 'y', '1', 'true', 'vrai', 'x', 'ok', 'validé', 'obtenu', 'diplômé']
-    NON_PATTERNS = ['non', 'n', 'no', '0', 'false', 'faux', 'nok', 'ko', 'pas obtenu', 'en cours']
-    
-    if v in OUI_PATTERNS or any(p in v for p in ['oui', 'yes', 'validé', 'obtenu']):
+    if v in OUI_PATTERNS or any(p in v for p in OUI_SUBSTRINGS):
         return '1'
-    if v in NON_PATTERNS or any(p in v for p in ['non', 'no', 'pas', 'aucun']):
+    if v in NON_PATTERNS or any(p in v for p in NON_SUBSTRINGS):
         return '0'
-    return None
+    return fuzzy_best('oui_non', val)
+
+# Table étendue des pays courants
+COUNTRY_MAPPINGS = {
+    'FR': ('FRANCE', 'FR', 'FRA', 'FRENCH', 'FRANÇAIS', 'FRANCAISE'),
+    'BE': ('BELGIQUE', 'BE', 'BEL', 'BELGIUM', 'BELGE'),
+    'CH': ('SUISSE', 'CH', 'CHE', 'SWITZERLAND', 'SWISS', 'SCHWEIZ'),
+    'DE': ('ALLEMAGNE', 'DE', 'DEU', 'GERMANY', 'DEUTSCHLAND', 'ALLEMAND'),
+    'ES': ('ESPAGNE', 'ES', 'ESP', 'SPAIN', 'ESPAÑA', 'ESPAGNOL'),
+    'IT': ('ITALIE', 'IT', 'ITA', 'ITALY', 'ITALIA', 'ITALIEN'),
+    'GB': ('ROYAUME-UNI', 'GB', 'GBR', 'UK', 'UNITED KINGDOM', 'ANGLETERRE', 'ENGLAND'),
+    'US': ('ETATS-UNIS', 'US', 'USA', 'UNITED STATES', 'AMERICA', 'AMERIQUE'),
+    'CA': ('CANADA', 'CA', 'CAN', 'CANADIEN'),
+    'LU': ('LUXEMBOURG', 'LU', 'LUX', 'LUXEMBOURGEOIS'),
+    'NL': ('PAYS-BAS', 'NL', 'NLD', 'NETHERLANDS', 'HOLLANDE', 'HOLLAND'),
+    'PT': ('PORTUGAL', 'PT', 'PRT', 'PORTUGAIS'),
+    'MA': ('MAROC', 'MA', 'MAR', 'MOROCCO', 'MAROCAIN'),
+    'DZ': ('ALGERIE', 'DZ', 'DZA', 'ALGERIA', 'ALGERIEN'),
+    'TN': ('TUNISIE', 'TN', 'TUN', 'TUNISIA', 'TUNISIEN'),
+}
+# Alias exact → code (le premier pays déclaré l'emporte) et motifs en sous-chaîne
+_COUNTRY_ALIASES = {
+    p: code for code, patterns in reversed(COUNTRY_MAPPINGS.items()) for p in patterns
+}
+_COUNTRY_SUBSTRINGS = tuple(
+    (code, tuple(p for p in patterns if len(p) > 3))
+    for code, patterns in COUNTRY_MAPPINGS.items()
+)
 
 def suggest_country_code(val: str) -> str | None:
     """Suggère un code pays ISO à partir d'un nom de pays"""
     v = str(val).upper().strip()
     
-    # Table étendue des pays courants
-    COUNTRY_MAPPINGS = {
-        'FR': ['FRANCE', 'FR', 'FRA', 'FRENCH', 'FRANÇAIS', 'FRANCAISE'],
-        'BE': ['BELGIQUE', 'BE', 'BEL', 'BELGIUM', 'BELGE'],
-        'CH': ['SUISSE', 'CH', 'CHE', 'SWITZERLAND', 'SWISS', 'SCHWEIZ'],
-        'DE': ['ALLEMAGNE', 'DE', 'DEU', 'GERMANY', 'DEUTSCHLAND', 'ALLEMAND'],
-        'ES': ['ESPAGNE', 'ES', 'ESP', 'SPAIN', 'ESPAÑA', 'ESPAGNOL'],
-        'IT': ['ITALIE', 'IT', 'ITA', 'ITALY', 'ITALIA', 'ITALIEN'],
-        'GB': ['ROYAUME-UNI', 'GB', 'GBR', 'UK', 'UNITED KINGDOM', 'ANGLETERRE', 'ENGLAND'],
-        'US': ['ETATS-UNIS', 'US', 'USA', 'UNITED STATES', 'AMERICA', 'AMERIQUE'],
-        'CA': ['CANADA', 'CA', 'CAN', 'CANADIEN'],
-        'LU': ['LUXEMBOURG', 'LU', 'LUX', 'LUXEMBOURGEOIS'],
-        'NL': ['PAYS-BAS', 'NL', 'NLD', 'NETHERLANDS', 'HOLLANDE', 'HOLLAND'],
-        'PT': ['PORTUGAL', 'PT', 'PRT', 'PORTUGAIS'],
-        'MA': ['MAROC', 'MA', 'MAR', 'MOROCCO', 'MAROCAIN'],
-        'DZ': ['ALGERIE', 'DZ', 'DZA', 'ALGERIA', 'ALGERIEN'],
-        'TN': ['TUNISIE', 'TN', 'TUN', 'TUNISIA', 'TUNISIEN'],
-    }
-    
-    for code, patterns in COUNTRY_MAPPINGS.items():
-        if v in patterns or any(p in v for p in patterns if len(p) > 3):
+    code = _COUNTRY_ALIASES.get(v)
+    if code:
+        return code
+    for code, substrings in _COUNTRY_SUBSTRINGS:
+        if any(p in v for p in substrings):
             return code
     
     # Si c'est déjà un code 2 lettres, le retourner
     if len(v) == 2 and v.isalpha():
         return v
     
-    return None
+    return fuzzy_best('country', val)
+
+# ---------- Correspondance approximative ----------
+# Tolère les fautes de frappe (« Frnace », « Etudaint ») quand ni l'alias exact
+# ni la sous-chaîne ne reconnaissent la valeur. Seuil sur le score 1 - d/longueur.
+FUZZY_MIN_SCORE = 0.7
+FUZZY_AUTO_EDITS = 1      # erreurs tolérées pour une correction appliquée sans validation
+
+def _fuzzy_vocabulary(kind: str) -> dict:
+    if kind == 'country':
+        vocab = {p: code for code, patterns in COUNTRY_MAPPINGS.items() for p in patterns if len(p) > 3}
+        return {**vocab, **{k: v for k, v in FALLBACK_COUNTRIES.items() if k not in vocab}}
+    if kind == 'user_type':
+        return {k: code for code, keywords in USER_TYPE_KEYWORDS for k in keywords}
+    if kind == 'oui_non':
+        return {**{p: '1' for p in sorted(OUI_PATTERNS) if len(p) > 2},
+                **{p: '0' for p in sorted(NON_PATTERNS) if len(p) > 2}}
+    if kind == 'civilite':
+        return {p: correct for correct, patterns in CIVILITE_PATTERNS.items()
+                for p in sorted(patterns) if len(p) > 2}
+    raise ValueError(f"Vocabulaire inconnu : {kind}")
+
+@lru_cache(maxsize=None)
+def fuzzy_index(kind: str) -> FuzzyIndex:
+    """Index trigrammes d'un vocabulaire ('country', 'user_type', 'oui_non', 'civilite'), construit au premier usage"""
+    from fuzzy import FuzzyIndex
+    return FuzzyIndex(_fuzzy_vocabulary(kind))
+
+def suggest_candidates(kind: str, val, limit: int = 3) -> list[dict]:
+    """
+    Candidats classés pour une valeur non reconnue : la valeur entière d'abord,
+    sinon chacun de ses mots (« Etudaint en master »).
+
+    Returns:
+        list: [{'suggested': valeur canonique, 'matched': terme, 'score': 0-1}]
+    """
+    index = fuzzy_index(kind)
+    found = index.search(val, limit)
+    if not found:
+        best = {}
+        for word in re.findall(r"[^\W\d_]{4,}", str(val)):
+            for value, term, score in index.search(word, limit):
+                if score > best.get(value, (None, -1))[1]:
+                    best[value] = (term, score)
+        found = sorted(((v, t, sc) for v, (t, sc) in best.items()), key=lambda r: -r[2])[:limit]
+    return [{'suggested': v, 'matched': t, 'score': sc} for v, t, sc in found]
+
+def fuzzy_best(kind: str, val, min_score: float = FUZZY_MIN_SCORE, max_edits: int | None = None) -> str | None:
+    """Meilleur candidat ; `max_edits` : rejeté s'il est à plus de `max_edits` erreurs de la valeur entière"""
+    found = suggest_candidates(kind, val, limit=1)
+    if not found or found[0]['score'] < min_score:
+        return None
+    if max_edits is not None:
+        from fuzzy import edit_distance, fold
+        if edit_distance(fold(val), found[0]['matched'], max_edits) > max_edits:
+            return None
+    return found[0]['suggested']
 
 def clean_phone_number(val: str) -> str:
     """Nettoie et formate un numéro de téléphone"""
@@ -494,40 +1128,45 @@ def clean_phone_number(val: str) -> str:
     
     return cleaned
 
+# ---------- Échantillonnage pour l'analyse ----------
+SAMPLE_BUDGET = 2000        # lignes tirées pour l'analyse, quelle que soit la taille du fichier
+LOW_CARDINALITY = 50        # en dessous, comptages exacts sur la colonne complète
+
+def build_analysis_sample(df: pd.DataFrame, budget: int = SAMPLE_BUDGET, seed: int = 0) -> dict:
+    """
+    Construit l'échantillon partagé par tous les analyseurs (une fois par fichier) :
+    tirage uniforme de `budget` lignes (ordre d'origine conservé) et comptages
+    exacts (value_counts) des colonnes à faible cardinalité.
+    """
+    rows = df if len(df) <= budget else df.sample(n=budget, random_state=seed).sort_index()
+    value_counts = {}
+    for col in df.columns:
+        if rows[col].nunique(dropna=True) < LOW_CARDINALITY:
+            counts = df[col].dropna().astype(str).str.strip().value_counts()
+            if len(counts) < LOW_CARDINALITY:
+                value_counts[col] = counts
+    return {'rows': rows, 'total_rows': len(df), 'value_counts': value_counts}
+
+def _column_view(df: pd.DataFrame, col_name: str, sample: dict | None):
+    """(valeurs échantillonnées nettoyées, comptages exacts ou None, facteur d'extrapolation)"""
+    if sample is None:
+        sample = build_analysis_sample(df)
+    values = sample['rows'][col_name].dropna().astype(str).str.strip()
+    scale = sample['total_rows'] / max(len(sample['rows']), 1)
+    return values, sample['value_counts'].get(col_name), scale
+
 def detect_date_format(sample_dates: list) -> str:
-    """Détecte automatiquement le format de date utilisé"""
-    formats_to_try = [
-        ('%d/%m/%Y', 'JJ/MM/AAAA'),
-        ('%d-%m-%Y', 'JJ-MM-AAAA'),
-        ('%Y/%m/%d', 'AAAA/MM/JJ'),
-        ('%Y-%m-%d', 'AAAA-MM-JJ'),
-        ('%m/%d/%Y', 'MM/JJ/AAAA'),
-        ('%d.%m.%Y', 'JJ.MM.AAAA'),
-    ]
-    
-    format_scores = {}
-    
-    for date_str in sample_dates[:10]:  # Tester sur 10 échantillons max
-        if pd.isna(date_str) or not str(date_str).strip():
-            continue
-            
-        for fmt, name in formats_to_try:
-            try:
-                datetime.strptime(str(date_str).strip(), fmt)
-                format_scores[name] = format_scores.get(name, 0) + 1
-            except:
-                pass
-    
-    if format_scores:
-        return max(format_scores, key=format_scores.get)
-    return "Format non détecté"
+    """Détecte automatiquement le format de date utilisé (voir `profile_date_column`)"""
+    return profile_date_column(sample_dates)['label'] or "Format non détecté"
 
-def analyze_column_for_civility_hints(df: pd.DataFrame, col_name: str) -> dict:
+def analyze_column_for_civility_hints(df: pd.DataFrame, col_name: str, sample: dict | None = None) -> dict:
     """
     Analyse une colonne pour trouver des indices de civilité.
     Utile pour détecter des colonnes mal mappées qui contiendraient des infos de genre.
     """
-    col = df[col_name].dropna().astype(str).str.strip()
+    values, counts, _ = _column_view(df, col_name, sample)
+    if counts is None:
+        counts = values.value_counts()
     
     hints = {
         'male_count': 0,
@@ -535,61 +1174,63 @@ def analyze_column_for_civility_hints(df: pd.DataFrame, col_name: str) -> dict:
         'samples': []
     }
     
-    for val in col.unique()[:50]:  # Analyser max 50 valeurs uniques
+    for val, n in counts.head(50).items():  # Analyser max 50 valeurs uniques
         val_lower = val.lower()
         
         # Indices masculins
         if val_lower in ["m", "m.", "mr", "monsieur", "homme", "h", "masculin", "male"]:
-            hints['male_count'] += col[col == val].count()
+            hints['male_count'] += int(n)
             if len(hints['samples']) < 5:
                 hints['samples'].append((val, 'M.'))
         
         # Indices féminins
         elif val_lower in ["f", "mme", "mlle", "madame", "mademoiselle", "femme", "feminin", "female"]:
-            hints['female_count'] += col[col == val].count()
+            hints['female_count'] += int(n)
             if len(hints['samples']) < 5:
                 hints['samples'].append((val, 'Mme'))
     
     return hints
 
-def analyze_column_values(df: pd.DataFrame, col_name: str) -> dict:
-    """Analyse les valeurs d'une colonne pour suggérer des transformations"""
-    col = df[col_name]
-    values = col.dropna().astype(str).str.strip()
+def analyze_column_values(df: pd.DataFrame, col_name: str, sample: dict | None = None) -> dict:
+    """Analyse les valeurs d'une colonne (sur l'échantillon partagé) pour suggérer des transformations"""
+    values, exact_counts, scale = _column_view(df, col_name, sample)
+    counts = exact_counts if exact_counts is not None else values.value_counts()
     
     analysis = {
-        'total': len(col),
-        'non_empty': len(values),
-        'unique': values.nunique(),
-        'most_common': values.value_counts().head(5).to_dict() if len(values) > 0 else {},
+        'total': len(df) if sample is None else sample['total_rows'],
+        'non_empty': int(counts.sum()) if exact_counts is not None else round(len(values) * scale),
+        'unique': len(counts),
+        'most_common': counts.head(5).to_dict() if len(counts) > 0 else {},
         'suggestions': []
     }
     
     # Détection de patterns
-    if values.nunique() < 10:  # Peu de valeurs uniques = probablement catégoriel
+    if len(counts) < 10:  # Peu de valeurs uniques = probablement catégoriel
         analysis['type'] = 'categorical'
         
-        # Suggérer des mappings pour les valeurs ambiguës
-        for val in values.unique():
-            # Pour civilité
-            if col_name.lower() in ['civilite', 'civilité', 'genre', 'titre']:
-                suggestion = suggest_civilite(val)
-                if suggestion and suggestion != val:
-                    analysis['suggestions'].append({
-                        'original': val,
-                        'suggested': suggestion,
-                        'confidence': 'high'
-                    })
-            
-            # Pour booléens
-            elif any(word in col_name.lower() for word in ['obtenu', 'npai', 'validé']):
-                suggestion = suggest_oui_non(val)
-                if suggestion and suggestion != val:
-                    analysis['suggestions'].append({
-                        'original': val,
-                        'suggested': suggestion,
-                        'confidence': 'high'
-                    })
+        # Suggérer des mappings pour les valeurs ambiguës (toutes les valeurs distinctes)
+        name = col_name.lower()
+        if name in ['civilite', 'civilité', 'genre', 'titre']:
+            kind, suggest = 'civilite', suggest_civilite
+        elif any(word in name for word in ['obtenu', 'npai', 'validé']):
+            kind, suggest = 'oui_non', suggest_oui_non
+        elif any(word in name for word in ['pays', 'country', 'nationalit']):
+            kind, suggest = 'country', suggest_country_code
+        else:
+            kind = None
+        for val in (counts.index if kind else []):
+            suggestion = suggest(val)
+            if suggestion and suggestion != val:
+                # Score de la correspondance : 1 si reconnue telle quelle, < 1 si faute de frappe
+                candidates = suggest_candidates(kind, val)
+                score = next((c['score'] for c in candidates if c['suggested'] == suggestion), 1.0)
+                analysis['suggestions'].append({
+                    'original': val,
+                    'suggested': suggestion,
+                    'confidence': 'high' if score == 1.0 else 'medium',
+                    'score': score,
+                    'candidates': candidates,
+                })
     
     # Détection de dates
     elif any(word in col_name.lower() for word in ['date', 'naissance', 'obtention', 'integration']):
@@ -597,39 +1238,46 @@ def analyze_column_values(df: pd.DataFrame, col_name: str) -> dict:
         analysis['format_detected'] = detect_date_format(values.tolist())
     
     # Détection d'emails
-    elif '@' in ''.join(values.head(10).tolist()):
+    elif values.str.contains('@', regex=False).any():
         analysis['type'] = 'email'
-        invalid_emails = []
-        for val in values.head(20):  # Vérifier les 20 premiers
-            if not re.match(r"^[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}$", val, re.I):
-                invalid_emails.append(val)
-        if invalid_emails:
-            analysis['invalid_examples'] = invalid_emails[:5]
+        invalid_emails = values[~values.str.match(EMAIL_RE)]
+        if len(invalid_emails):
+            analysis['invalid_examples'] = invalid_emails.unique()[:5].tolist()
     
     # Détection de téléphones
-    elif any(re.search(r'\d{8,}', str(val)) for val in values.head(10)):
+    elif values.str.contains(r'\d{8,}').any():
         analysis['type'] = 'phone'
         # Exemples de numéros mal formatés
         needs_cleaning = []
-        for val in values.head(20):
+        for val in values:
             cleaned = clean_phone_number(val)
             if cleaned != val:
                 needs_cleaning.append({'original': val, 'cleaned': cleaned})
+                if len(needs_cleaning) == 5:
+                    break
         if needs_cleaning:
-            analysis['needs_cleaning'] = needs_cleaning[:5]
+            analysis['needs_cleaning'] = needs_cleaning
     
     return analysis
 
-def generate_data_quality_report(df: pd.DataFrame, mapping: dict) -> dict:
+def generate_data_quality_report(df: pd.DataFrame, mapping: dict, sample: dict | None = None,
+                                 total_columns: int | None = None) -> dict:
     """
     Génère un rapport d'analyse des données avec suggestions (sans score de qualité).
+    Tous les analyseurs travaillent sur le même échantillon (`build_analysis_sample`).
+    `total_columns` : largeur du fichier quand `df` n'en est qu'une projection.
     """
+    if sample is None:
+        sample = build_analysis_sample(df)
+    rows = sample['rows']
+    total_columns = len(df.columns) if total_columns is None else total_columns
     report = {
         'summary': {
-            'total_rows': len(df),
-            'total_columns': len(df.columns),
+            'total_rows': sample['total_rows'],
+            'sampled_rows': len(rows),
+            'total_columns': total_columns,
             'mapped_columns': len(mapping),
-            'unmapped_columns': len(df.columns) - len(mapping)
+            'unmapped_columns': total_columns - len(mapping)
         },
         'column_analysis': {},
         'global_suggestions': [],
@@ -643,9 +1291,9 @@ def generate_data_quality_report(df: pd.DataFrame, mapping: dict) -> dict:
     # Vérifier si on a des colonnes non mappées qui pourraient contenir des infos de civilité
     unmapped_cols = [col for col in df.columns if col not in mapping.values()]
     for col in unmapped_cols:
-        col_lower = col.lower()
-        if any(word in col_lower for word in ['genre', 'sexe', 'sex', 'gender', 'titre', 'title']):
-            hints = analyze_column_for_civility_hints(df, col)
+        col_lower = str(col).lower()
+        if any(word in col_lower for word in CIVILITY_HEADER_WORDS):
+            hints = analyze_column_for_civility_hints(df, col, sample)
             if hints['male_count'] > 0 or hints['female_count'] > 0:
                 report['civility_detection']['found_hints'] = True
                 report['civility_detection']['unmapped_civility_columns'].append({
@@ -656,7 +1304,7 @@ def generate_data_quality_report(df: pd.DataFrame, mapping: dict) -> dict:
     # Analyser chaque colonne mappée
     for template_col, source_col in mapping.items():
         if source_col in df.columns:
-            analysis = analyze_column_values(df, source_col)
+            analysis = analyze_column_values(df, source_col, sample)
             report['column_analysis'][template_col] = analysis
             
             # Pour la civilité, utiliser la détection avancée
@@ -665,11 +1313,16 @@ def generate_data_quality_report(df: pd.DataFrame, mapping: dict) -> dict:
                 prenom_col = mapping.get('Prénom*', None)
                 
                 suggestions_with_confidence = []
-                for idx, row in df.head(100).iterrows():  # Analyser les 100 premières lignes
-                    val = row[source_col] if source_col in df.columns else ""
+                seen = set()
+                for idx, row in rows.iterrows():  # Lignes de l'échantillon
+                    val = row[source_col]
                     prenom = row[prenom_col] if prenom_col and prenom_col in df.columns else ""
                     
                     if pd.notna(val) and str(val).strip():
+                        # Une seule analyse par couple (valeur, prénom)
+                        if (str(val).strip(), prenom) in seen:
+                            continue
+                        seen.add((str(val).strip(), prenom))
                         suggestion, confidence = suggest_civilite_with_confidence(
                             val, 
                             firstname=prenom,
@@ -705,7 +1358,65 @@ def generate_data_quality_report(df: pd.DataFrame, mapping: dict) -> dict:
     
     return report
 
+# ---------- Ressources partagées ----------
+def load_shared_resources() -> dict:
+    """
+    Charge les ressources en lecture seule (prénoms et statistiques de prénoms,
+    détecteur de genre, tables pays/téléphone). Appelée une fois par processus serveur pour que le premier
+    traitement d'un utilisateur ne paie pas le chargement du détecteur.
+    """
+    import prenoms
+    stats = prenoms.name_table()
+    return {
+        'female_firstnames': FEMALE_FIRSTNAMES_FR,
+        'male_firstnames': MALE_FIRSTNAMES_FR,
+        'unisex_firstnames': UNISEX_FIRSTNAMES,
+        'firstname_stats': stats,
+        # gender_guesser ne sert plus qu'en l'absence du fichier de statistiques
+        'gender_detector': _gender_detector() if stats is None else None,
+        'countries': COUNTRY_MAPPINGS,
+        'fallback_countries': FALLBACK_COUNTRIES,
+    }
+
+def referential_versions() -> tuple:
+    """
+    (chemin, mtime, taille) des référentiels lus par le formatage (codes postaux,
+    diplômes, prénoms, index SIRENE), (chemin, None) si absent : clé de cache,
+    change si l'un d'eux est remplacé.
+    """
+    import referentiels, prenoms, sirene
+    paths = (referentiels.POSTAL_REFERENTIAL, referentiels.DIPLOMA_REFERENTIAL, prenoms.NAMES_FILE,
+             os.path.join(sirene.SIRENE_DIR, sirene.KEYS_FILE), os.path.join(sirene.SIRENE_DIR, sirene.RECORDS_FILE))
+    versions = []
+    for path in paths:
+        try:
+            versions.append(referentiels._file_version(path))
+        except OSError:
+            versions.append((path, None))
+    return tuple(versions)
+
 # ---------- Process principal ----------
+def compile_value_maps(value_maps: dict | None, user_type_map: dict | None=None,
+                       plan: dict | None=None) -> dict[int, dict]:
+    """
+    Compile les tables de traduction {colonne template: {valeur: remplacement}}
+    en une table unique par position de colonne, clés normalisées (str, strip).
+    Le mapping des types utilisateur est fusionné dans la table de la colonne type.
+    """
+    plan = plan or template_plan()
+    names = plan['names']
+    tables = {}
+    merged = dict(value_maps or {})
+    if user_type_map and plan['user_type'] is not None:
+        type_col = names[plan['user_type']]
+        merged[type_col] = {**merged.get(type_col, {}), **user_type_map}
+    for t, table in merged.items():
+        if t in names and table:
+            tables[names.index(t)] = {
+                str(k).strip(): str(v) for k, v in table.items() if str(k).strip() != str(v)
+            }
+    return tables
+
 def process(
     df: pd.DataFrame, mapping: dict,
     correct_dates: bool=True, uppercase_names: bool=True,
@@ -714,113 +1425,892 @@ def process(
     strict: bool=False,
     civil_fallback: str="",                    # "", "M.", "Mme"
     default_user_type_when_missing: str | None=None,  # None / "1" / "5"
-    require_user_type_choice: bool=False
+    require_user_type_choice: bool=False,
+    value_maps: dict | None=None,              # {colonne template: {valeur source: valeur}}
+    check_postal: bool=True,
+    check_sirene: bool=True,                   # extrait SIRENE local (sirene.py), s'il existe
+    column_cache: ColumnCache | None=None,
+    template: str | None=None,                 # gabarit de sortie (templates/<nom>.json)
+    review: dict | None=None,
+    offset: int=0,                             # ligne du fichier où commence `df` (lecture par blocs)
+    date_profiles: dict | None=None            # profils jour/mois communs aux blocs (date_profiles)
 ):
-    user_type_map = user_type_map or {}
-    errors, warnings = [], []
-    out_rows = [TEMPLATE_COLUMNS, ['-']*len(TEMPLATE_COLUMNS)]
-    stats = {'total_rows':0,'valid_rows':0,'corrected_fields':0}
+    """
+    Formate le fichier colonne par colonne puis assemble sortie, stats et journal.
+    Avec `column_cache` (un par DataFrame source), seules les colonnes dont une
+    dépendance a changé depuis l'appel précédent sont recalculées.
+    Avec `review` (dict), y dépose sous 'marks' les annotations des cellules
+    de sortie (voir `write_review_workbook`).
+    Un bloc de fichier (`offset`, voir pipeline.py) est formaté comme la même
+    tranche du fichier entier : numéros de ligne du fichier, dates lues avec
+    les profils `date_profiles` établis sur le premier bloc.
+    """
+    opts = dict(correct_dates=correct_dates, uppercase_names=uppercase_names,
+                auto_civility=auto_civility, auto_user_type=auto_user_type, strict=strict,
+                civil_fallback=civil_fallback, default_user_type_when_missing=default_user_type_when_missing,
+                require_user_type_choice=require_user_type_choice, check_postal=check_postal,
+                check_sirene=check_sirene)
+    plan = template_plan(template)
+    sources = _Sources(df, mapping, compile_value_maps(value_maps, user_type_map, plan), plan,
+                       offset, date_profiles)
+    if column_cache is not None:
+        column_cache.bind(df)
+    block = _format_block(sources, opts, offset, offset + len(df), column_cache, review=review, release=True)
+    return (block['df_out'], block['stats'],
+            [msg for _, msg in block['errors']], [msg for _, msg in block['warnings']])
+
+def date_profiles(df: pd.DataFrame, mapping: dict, value_maps: dict | None = None,
+                  user_type_map: dict | None = None, template: str | None = None) -> dict:
+    """
+    Profils jour/mois des colonnes date mappées, établis sur `df` : pour un
+    fichier formaté par blocs, ceux du premier bloc valent pour tous les blocs
+    (option `date_profiles` de process).
+    """
+    plan = template_plan(template)
+    sources = _Sources(df, mapping, compile_value_maps(value_maps, user_type_map, plan), plan)
+    return {col['index']: sources.date_profile(col['index']) for col in plan['columns']
+            if col['kernel'] is _kernel_date and col['index'] in sources.names}
 
-    for ridx, (_,row) in enumerate(df.iterrows(), start=2):
-        stats['total_rows'] += 1
-        out = ['']*len(TEMPLATE_COLUMNS)
-        row_has_data = False
+# ---------- Formatage par colonne ----------
+class _Sources:
+    """
+    Colonnes d'un DataFrame source vues par position dans le gabarit, extraites à la demande.
+    `df` peut n'être qu'un bloc du fichier, commençant à la ligne `offset` : les
+    positions [start, stop) vues par les noyaux restent celles du fichier.
+    """
 
-        raw = {}
-        for i,t in enumerate(TEMPLATE_COLUMNS):
-            val = row[mapping[t]] if t in mapping and mapping[t] in df.columns else ''
-            if pd.notna(val) and str(val).strip(): row_has_data = True
-            raw[i] = val
+    def __init__(self, df: pd.DataFrame, mapping: dict, tables: dict, plan: dict | None = None,
+                 offset: int = 0, profiles: dict | None = None):
+        self.df, self.mapping, self.tables = df, mapping, tables
+        self.offset = offset
+        self.plan = plan or template_plan()
+        self.names = {i: mapping[t] for i, t in enumerate(self.plan['names'])
+                      if t in mapping and mapping[t] in df.columns}
+        self._raw, self._values, self._postal, self._sirene = {}, {}, {}, {}
+        self._profiles = dict(profiles or {})
+        self._rows = None
+        # Une seule liste vide partagée par toutes les colonnes non mappées
+        self.empty = [""] * len(df)
 
-        prenom_raw = str(raw.get(3,"") or "").strip()
+    def _window(self, values: list, start: int, stop: int) -> list:
+        start, stop = start - self.offset, stop - self.offset
+        return values if start == 0 and stop == len(values) else values[start:stop]
 
-        try:
-            for i,t in enumerate(TEMPLATE_COLUMNS):
-                s = str(raw.get(i,"") if raw.get(i) is not None else "").strip()
-                new = s
-
-                if i == 2:  # Civilité
-                    new = format_civilite(s)
-                    if not new and auto_civility and prenom_raw:
-                        ded, confidence = deduce_civility_from_firstname(prenom_raw, row.to_dict())
-                        if ded:
-                            new = ded
-                            warnings.append(f"Ligne {ridx}: Civilité déduite depuis le prénom '{prenom_raw}' → '{ded}' (confiance: {confidence})")
-                    if not new and civil_fallback in ("M.","Mme"):
-                        new = civil_fallback
-                        warnings.append(f"Ligne {ridx}: Civilité manquante, fallback '{civil_fallback}'")
-
-                elif i == 3:  # Prénom
-                    new = s.title() if s else s
-
-                elif i in [4,5]:  # Noms
-                    new = s.upper() if (s and uppercase_names) else s
-
-                elif i == 6:  # Type utilisateur
-                    if s in ['1','5']:
-                        new = s
-                    elif s in user_type_map:
-                        new = user_type_map[s]
-                        warnings.append(f"Ligne {ridx}: Type '{s}' → '{new}' (mapping)")
-                    elif auto_user_type:
-                        sug = suggest_user_type(s)
-                        if sug:
-                            new = sug
-                            warnings.append(f"Ligne {ridx}: Type '{s}' → '{sug}' (déduit)")
-                        elif mapping.get("Type d'utilisateur* (Diplômé [1] / Etudiant [5])") is None:
-                            has_company = any(str(raw.get(j,"")).strip() for j in [31,34])  # Entreprise / SIRET
-                            new = '1' if has_company else s
-
-                elif i in [7,13,14,44,45]:  # dates
-                    new = format_date(s) if (s and correct_dates) else s
-                    if strict and new and not re.match(r'^\d{2}/\d{2}/\d{4}$', new):
-                        raise ValueError(f"Ligne {ridx}: Date invalide '{s}'")
-
-                elif i in [8,9,43]:  # emails
-                    new = format_email(s, warnings, ridx, strict)
-
-                elif i in [15,23]:  # booléens
-                    new = format_boolean(s)
-
-                elif i in [22,40]:  # pays
-                    new = format_country(s, warnings, ridx, strict) if s else s
-
-                elif i in [24,25,41,42]:  # téléphones
-                    new = format_phone(s, warnings, ridx, strict) if s else s
-
-                elif i == 34:  # SIRET
-                    new = format_siret(s, warnings, ridx, strict) if s else s
-
-                out[i] = new
-                if new != s and s != "":
-                    stats['corrected_fields'] += 1
+    def frame(self, start: int, stop: int) -> pd.DataFrame:
+        """Lignes [start, stop) du DataFrame source (positions du fichier)"""
+        return self.df.iloc[start - self.offset:stop - self.offset]
+
+    def raw(self, i: int, start: int = 0, stop: int | None = None) -> list:
+        """Valeurs nettoyées (strip, "" si absente), avant traduction"""
+        if i not in self._raw:
+            if i in self.names:
+                col = self.df[self.names[i]]
+                self._raw[i] = col.astype(object).where(col.notna(), "").astype(str).str.strip().tolist()
+            else:
+                self._raw[i] = self.empty
+        return self._window(self._raw[i], start, self.offset + len(self.df) if stop is None else stop)
+
+    def values(self, i: int, start: int = 0, stop: int | None = None) -> list:
+        """Valeurs après la table de traduction de la colonne"""
+        if i not in self._values:
+            table = self.tables.get(i)
+            self._values[i] = [table.get(s, s) for s in self.raw(i)] if table else self.raw(i)
+        return self._window(self._values[i], start, self.offset + len(self.df) if stop is None else stop)
+
+    def release(self, i: int) -> None:
+        """Libère les listes d'une colonne dont plus aucune colonne restante n'a besoin"""
+        self._raw.pop(i, None)
+        self._values.pop(i, None)
+        for key in [k for k in self._postal if i in k[:2]]:
+            del self._postal[key]
+        for key in [k for k in self._sirene if k[0] == i]:
+            del self._sirene[key]
+
+    def non_empty_rows(self, start: int, stop: int) -> np.ndarray:
+        """Positions (relatives à `start`) des lignes ayant au moins une valeur mappée"""
+        has_data = np.zeros(stop - start, dtype=bool)
+        rows = self.frame(start, stop)
+        for name in set(self.names.values()):
+            col = rows[name]
+            has_data |= (col.notna() & col.astype(str).str.strip().ne("")).to_numpy(dtype=bool)
+        return np.flatnonzero(has_data)
+
+    def row(self, pos: int) -> dict:
+        """Ligne source complète (indices de civilité dans les colonnes non mappées)"""
+        if self._rows is None:
+            self._rows = (list(self.df.columns), self.df.to_numpy(dtype=object))
+        columns, data = self._rows
+        return dict(zip(columns, data[pos - self.offset]))
+
+    def date_profile(self, i: int) -> dict:
+        """
+        Profil jour/mois établi sur la colonne entière, quel que soit le bloc
+        formaté (ou fourni à la construction : `profiles`, voir `date_profiles`)
+        """
+        if i not in self._profiles:
+            self._profiles[i] = profile_date_column(pd.Series(self.values(i), dtype=object))
+        return self._profiles[i]
 
+    def postal(self, code_i: int, city_i: int | None, start: int, stop: int) -> pd.DataFrame:
+        key = (code_i, city_i, start, stop)
+        if key not in self._postal:
+            rows = self.frame(start, stop)
+            city_col = self.names.get(city_i)
+            from referentiels import check_postal_pairs
+            self._postal[key] = check_postal_pairs(rows[self.names[code_i]],
+                                                   rows[city_col] if city_col else None)
+        return self._postal[key]
+
+    def sirene(self, siret_i: int | None, start: int, stop: int) -> pd.DataFrame | None:
+        """Fiches SIRENE des SIRET de la tranche (partagées par les colonnes entreprise) ; None sans extrait"""
+        if siret_i is None or siret_i not in self.names:
+            return None
+        key = (siret_i, start, stop)
+        if key not in self._sirene:
+            import sirene
+            self._sirene[key] = sirene.lookup(self.raw(siret_i, start, stop))
+        return self._sirene[key]
+
+def _column_fingerprint(col: dict, sources: _Sources, opts: dict, referentials: tuple) -> tuple:
+    """Tout ce que lit une colonne : gabarit, référentiels, colonnes source, tables de traduction, options"""
+    names = sources.plan['names']
+    return (
+        sources.plan['version'],
+        referentials,
+        tuple((j, sources.mapping.get(names[j]), tuple(sorted(sources.tables.get(j, {}).items())))
+              for j in (col['index'], *col['depends'])),
+        tuple(opts[k] for k in col['options']),
+    )
+
+def _check_cells(fn, values: list, start: int, strict: bool, warnings: list, failures: dict) -> list:
+    """Applique un formateur (valeur, warnings, ligne, strict) ; une exception = échec de la ligne"""
+    out, msgs = [], []
+    for pos, s in enumerate(values, start):
+        if not s:
+            out.append(s)
+            continue
+        try:
+            out.append(fn(s, msgs, pos + 2, strict))
         except Exception as e:
-            errors.append(str(e))
-
-        # Post-traitement Type utilisateur manquant
-        type_idx = 6
-        if row_has_data:
-            if not out[type_idx] or out[type_idx] not in ("1","5"):
-                if require_user_type_choice and default_user_type_when_missing is None:
-                    errors.append("TYPE_UTILISATEUR_MANQUANT")
-                elif default_user_type_when_missing in ("1","5"):
-                    out[type_idx] = default_user_type_when_missing
-                    warnings.append(f"Ligne {ridx}: Type manquant → fallback '{default_user_type_when_missing}'")
-
-        if row_has_data:
-            if (not out[3]) or (not out[4]):
-                errors.append(f"Ligne {ridx}: Prénom/Nom manquant")
+            failures[pos] = str(e)
+            out.append("")
+        if msgs:
+            warnings.extend((pos, m) for m in msgs)
+            msgs.clear()
+    return out
+
+# Noyaux : un par format déclaré dans les gabarits. Chacun reçoit la colonne
+# compilée, les sources, les options et la tranche [start, stop) avec ses
+# valeurs brutes (src) et traduites (vals) ; il renvoie la liste formatée et
+# remplit `issues` : warnings et leading ([(position, message)] ; leading =
+# signalés en début de ligne, jamais masqués par un échec), failures
+# ({position: message} en mode strict).
+def _input(col: dict, role: str) -> int | None:
+    refs = col['inputs'].get(role)
+    return refs[0] if refs else None
+
+def _kernel_text(col, sources, opts, start, stop, src, vals, issues) -> list:
+    return vals
+
+def _kernel_civility(col, sources, opts, start, stop, src, vals, issues) -> list:
+    first_i = _input(col, 'firstname')
+    firstnames = sources.raw(first_i, start, stop) if first_i is not None else sources._window(sources.empty, start, stop)
+    fallback = opts['civil_fallback'] if opts['civil_fallback'] in ("M.", "Mme") else ""
+    formatted = [format_civilite(s) for s in vals]
+    deduced = {}
+    if opts['auto_civility']:
+        # Déduction en une jointure sur la colonne des prénoms, indices de ligne vérifiés ensuite
+        todo = [k for k, (new, prenom) in enumerate(zip(formatted, firstnames)) if not new and prenom]
+        civs, confs = deduce_civility_column([firstnames[k] for k in todo])
+        deduced = {k: (ded, confidence) for k, ded, confidence in zip(todo, civs, confs)
+                   if ded and not row_contradicts_civility(ded, sources.row(start + k))}
+    out = []
+    for k, (pos, new, prenom) in enumerate(zip(range(start, stop), formatted, firstnames)):
+        if k in deduced:
+            new, confidence = deduced[k]
+            issues['warnings'].append((pos, f"Ligne {pos+2}: Civilité déduite depuis le prénom '{prenom}' → '{new}' (confiance: {confidence})"))
+        if not new and fallback:
+            new = fallback
+            issues['warnings'].append((pos, f"Ligne {pos+2}: Civilité manquante, fallback '{fallback}'"))
+        out.append(new)
+    return out
+
+def _kernel_firstname(col, sources, opts, start, stop, src, vals, issues) -> list:
+    return [s.title() if s else s for s in vals]
+
+def _kernel_lastname(col, sources, opts, start, stop, src, vals, issues) -> list:
+    return [s.upper() for s in vals] if opts['uppercase_names'] else vals
+
+def _kernel_user_type(col, sources, opts, start, stop, src, vals, issues) -> list:
+    type_unmapped = sources.mapping.get(col['name']) is None
+    # Entreprise renseignée (première colonne non vide parmi les entrées 'company') → diplômé
+    companies = [""] * (stop - start)
+    for j in col['inputs'].get('company', ()):
+        companies = [a or b for a, b in zip(companies, sources.raw(j, start, stop))]
+    out = []
+    for pos, s, s0, company in zip(range(start, stop), vals, src, companies):
+        new = s
+        if s != s0:
+            issues['warnings'].append((pos, f"Ligne {pos+2}: Type '{s0}' → '{s}' (mapping)"))
+        elif s not in ('1', '5') and opts['auto_user_type']:
+            sug = suggest_user_type(s)
+            if sug:
+                new = sug
+                issues['warnings'].append((pos, f"Ligne {pos+2}: Type '{s}' → '{sug}' (déduit)"))
+            elif type_unmapped:
+                new = '1' if company else s
+        out.append(new)
+    return out
+
+def _kernel_date(col, sources, opts, start, stop, src, vals, issues) -> list:
+    i = col['index']
+    if opts['correct_dates'] and i in sources.names:
+        profile = sources.date_profile(i)
+        out = format_date_column(pd.Series(vals, dtype=object), profile).tolist()
+        out = [new if s else s for s, new in zip(vals, out)]
+        if start == 0 and profile['confidence'] < 1 and len(profile['ambiguous_rows']):
+            issues['leading'].append((-1,
+                f"Colonne '{sources.names[i]}': {len(profile['ambiguous_rows'])} dates ambiguës (jour/mois) "
+                f"interprétées en {profile['label']} (confiance: {profile['confidence']:.0%})"))
+    else:
+        out = vals
+    if opts['strict']:
+        failures = issues['failures']
+        for pos, new, s in zip(range(start, stop), out, vals):
+            if new and not re.match(r'^\d{2}/\d{2}/\d{4}$', new):
+                failures[pos] = f"Ligne {pos+2}: Date invalide '{s}'"
+        if failures:
+            out = ["" if pos in failures else new for pos, new in zip(range(start, stop), out)]
+    return out
+
+def _cell_kernel(fn):
+    """Noyau appliquant un formateur cellule par cellule (_check_cells)"""
+    def kernel(col, sources, opts, start, stop, src, vals, issues) -> list:
+        return _check_cells(fn, vals, start, opts['strict'], issues['warnings'], issues['failures'])
+    return kernel
+
+def _kernel_boolean(col, sources, opts, start, stop, src, vals, issues) -> list:
+    return [format_boolean(s) for s in vals]
+
+def _kernel_siret(col, sources, opts, start, stop, src, vals, issues) -> list:
+    """SIRET : longueur et clé de Luhn, puis existence et état dans l'extrait SIRENE"""
+    out = _check_cells(format_siret, vals, start, opts['strict'], issues['warnings'], issues['failures'])
+    found = sources.sirene(col['index'], start, stop) if opts['check_sirene'] else None
+    if found is None:
+        return out
+    flagged = {pos for pos, _ in issues['warnings']} | set(issues['failures'])
+    for k in np.flatnonzero(~found['found'].to_numpy() | ~found['active'].to_numpy()):
+        pos = start + k
+        if not out[k] or pos in flagged:
+            continue
+        if not found['found'].iat[k]:
+            issues['warnings'].append((pos, f"Ligne {pos+2}: SIRET '{out[k]}' absent de l'extrait SIRENE"))
+        else:
+            issues['warnings'].append((pos, f"Ligne {pos+2}: SIRET '{out[k]}' : établissement fermé (SIRENE)"))
+    return out
+
+def _sirene_fill(col, sources, opts, start, stop, vals, field: str) -> tuple[list, pd.DataFrame | None]:
+    """Complète les cellules vides depuis la fiche SIRENE du SIRET de la ligne (entrée 'siret')"""
+    found = sources.sirene(_input(col, 'siret'), start, stop) if opts['check_sirene'] else None
+    if found is None:
+        return vals, None
+    known = found[field].tolist()
+    return [v or ref for v, ref in zip(vals, known)], found
+
+def _sirene_disagrees(values: list, found: pd.DataFrame, field: str) -> np.ndarray:
+    """Positions où la valeur saisie et la fiche SIRENE diffèrent (forme normalisée, l'une ne contenant pas l'autre)"""
+    from referentiels import fold_text
+    given = fold_text(pd.Series(values, dtype=object)).to_numpy(dtype=object)
+    known = fold_text(found[field]).to_numpy(dtype=object)
+    return np.array([k for k, (a, b) in enumerate(zip(given, known)) if a and b and a not in b and b not in a],
+                    dtype=np.int64)
+
+def _kernel_company_name(col, sources, opts, start, stop, src, vals, issues) -> list:
+    """Nom d'entreprise : complété depuis SIRENE s'il est vide, signalé s'il diffère"""
+    out, found = _sirene_fill(col, sources, opts, start, stop, vals, 'name')
+    if found is not None:
+        for k in _sirene_disagrees(vals, found, 'name'):
+            issues['warnings'].append((start + k, f"Ligne {start+k+2}: Entreprise '{vals[k]}' différente "
+                                                  f"du nom SIRENE '{found['name'].iat[k]}'"))
+    return out
+
+def _kernel_postal(col, sources, opts, start, stop, src, vals, issues) -> list:
+    """Code postal ou ville : validés ensemble contre le référentiel (une seule jointure par couple)"""
+    i = col['index']
+    if col['format'] == 'postal_code':
+        code_i, city_i = i, _input(col, 'city')
+    else:
+        code_i, city_i = _input(col, 'postal_code'), i
+    if not opts['check_postal'] or code_i not in sources.names or (i == city_i and city_i not in sources.names):
+        return _postal_sirene(col, sources, opts, start, stop, vals, issues)
+    checked = sources.postal(code_i, city_i, start, stop)
+    computed = checked['code' if i == code_i else 'ville'].tolist()
+    out = [new if s == s0 else s for s, s0, new in zip(vals, src, computed)]
+    if i == code_i:
+        # Positions et non étiquettes : l'index source peut comporter des doublons
+        hits = np.flatnonzero(checked['statut'].to_numpy() != "")
+        flagged = checked.iloc[hits]
+        for pos, code, city, statut, attendu in zip(
+                start + hits, flagged['code'], flagged['ville'], flagged['statut'], flagged['attendu']):
+            if statut == "invalide":
+                issues['leading'].append((pos, f"Ligne {pos+2}: Code postal invalide '{code}'"))
             else:
-                stats['valid_rows'] += 1
-            out_rows.append(out)
+                issues['leading'].append((pos, f"Ligne {pos+2}: Code postal '{code}' et ville '{city}' discordants (attendu : {attendu})"))
+    return _postal_sirene(col, sources, opts, start, stop, out, issues)
 
-    df_out = pd.DataFrame(out_rows[2:], columns=out_rows[0])
-    return df_out, stats, errors, warnings
+def _postal_sirene(col, sources, opts, start, stop, vals, issues) -> list:
+    """Adresse professionnelle (entrée 'siret') : code postal / ville complétés ou comparés à SIRENE"""
+    if 'siret' not in col['inputs']:
+        return vals
+    field = 'postal' if col['format'] == 'postal_code' else 'city'
+    out, found = _sirene_fill(col, sources, opts, start, stop, vals, field)
+    if found is not None and field == 'postal':
+        for k in _sirene_disagrees(vals, found, 'postal'):
+            issues['warnings'].append((start + k, f"Ligne {start+k+2}: Code postal professionnel '{vals[k]}' "
+                                                  f"différent de SIRENE '{found['postal'].iat[k]}' ({found['city'].iat[k]})"))
+    return out
+
+def _kernel_diploma_code(col, sources, opts, start, stop, src, vals, issues) -> list:
+    """Code étape : appartenance au référentiel des diplômes, codes proches pour les inconnus"""
+    from referentiels import check_diploma_codes, diploma_index
+    index = diploma_index()
+    if index is None or col['index'] not in sources.names:
+        return vals
+    checked = check_diploma_codes(pd.Series(vals, dtype=object), index)
+    out = checked['code'].tolist()
+    for k in np.flatnonzero((checked['statut'] == "inconnu").to_numpy()):
+        pos, suggestions = start + k, checked['suggestions'].iat[k]
+        msg = f"Ligne {pos+2}: Code diplôme inconnu '{vals[k]}'" + (f" (codes proches : {suggestions})" if suggestions else "")
+        if opts['strict']:
+            issues['failures'][pos] = msg
+            out[k] = ""
+        else:
+            issues['warnings'].append((pos, msg))
+    return out
+
+def _kernel_training_mode(col, sources, opts, start, stop, src, vals, issues) -> list:
+    """Mode de formation : modes du référentiel, et modes proposés pour le code étape de la ligne"""
+    from referentiels import check_training_modes, diploma_index
+    index = diploma_index()
+    if index is None or index['modes'] is None or col['index'] not in sources.names:
+        return vals
+    code_i = _input(col, 'diploma_code')
+    codes = pd.Series(sources.values(code_i, start, stop), dtype=object) if code_i is not None else None
+    checked = check_training_modes(pd.Series(vals, dtype=object), codes, index)
+    out = checked['mode'].tolist()
+    for k in np.flatnonzero((checked['statut'] != "").to_numpy()):
+        pos = start + k
+        if checked['statut'].iat[k] == "inconnu":
+            msg = f"Ligne {pos+2}: Mode de formation inconnu '{vals[k]}'"
+        else:
+            msg = f"Ligne {pos+2}: Mode de formation '{out[k]}' non proposé pour le code '{checked['code'].iat[k]}'"
+        if opts['strict']:
+            issues['failures'][pos] = msg
+            out[k] = ""
+        else:
+            issues['warnings'].append((pos, msg))
+    return out
+
+# Format déclaré → (noyau, options de process() lues, sortie catégorielle).
+# Les options lues entrent dans l'empreinte de la colonne (ColumnCache).
+FORMATS = {
+    'text':        (_kernel_text, (), False),
+    'civility':    (_kernel_civility, ('auto_civility', 'civil_fallback'), True),
+    'firstname':   (_kernel_firstname, (), False),
+    'lastname':    (_kernel_lastname, ('uppercase_names',), False),
+    'user_type':   (_kernel_user_type, ('auto_user_type',), True),
+    'date':        (_kernel_date, ('correct_dates', 'strict'), False),
+    'email':       (_cell_kernel(format_email), ('strict',), False),
+    'boolean':     (_kernel_boolean, (), True),
+    'country':     (_cell_kernel(format_country), ('strict',), True),
+    'phone':       (_cell_kernel(format_phone), ('strict',), False),
+    'siret':       (_kernel_siret, ('strict', 'check_sirene'), False),
+    'company_name': (_kernel_company_name, ('check_sirene',), False),
+    'postal_code': (_kernel_postal, ('check_postal', 'check_sirene'), False),
+    'city':        (_kernel_postal, ('check_postal', 'check_sirene'), False),
+    'diploma_code': (_kernel_diploma_code, ('strict',), True),
+    'training_mode': (_kernel_training_mode, ('strict',), True),
+}
+
+@lru_cache(maxsize=16)
+def _compile_plan(version: tuple) -> dict:
+    from schema import load_template
+    template = load_template(version)
+    columns = []
+    for col in template['columns']:
+        if col['format'] not in FORMATS:
+            raise ValueError(f"Gabarit {template['name']!r}, colonne {col['name']!r} : "
+                             f"format inconnu {col['format']!r} ({', '.join(FORMATS)})")
+        kernel, options, categorical = FORMATS[col['format']]
+        columns.append({**col, 'kernel': kernel, 'options': options, 'categorical': categorical,
+                        'depends': tuple(j for refs in col['inputs'].values() for j in refs)})
+    user_type = [col['index'] for col in columns if col['format'] == 'user_type']
+    if len(user_type) > 1:
+        raise ValueError(f"Gabarit {template['name']!r} : une seule colonne 'user_type' possible")
+    # Colonnes lues par une colonne formatée plus loin : gardées jusque-là
+    needed_until = {}
+    for col in columns:
+        for j in col['depends']:
+            needed_until[j] = max(needed_until.get(j, j), col['index'])
+    return {'name': template['name'], 'label': template['label'], 'version': version,
+            'names': [col['name'] for col in columns], 'columns': columns,
+            'user_type': user_type[0] if user_type else None,
+            'required': tuple(col['index'] for col in columns if col['required']),
+            'required_message': template['required_message'], 'needed_until': needed_until}
+
+def template_plan(template: str | None = None) -> dict:
+    """
+    Plan d'exécution d'un gabarit : colonnes compilées (noyau, options lues,
+    dépendances), compilé une fois puis recompilé seulement si le fichier change.
+    """
+    from schema import template_version
+    return _compile_plan(template_version(template))
+
+def _format_column(col: dict, sources: _Sources, opts: dict, start: int, stop: int) -> dict:
+    """
+    Formate une colonne du gabarit sur les lignes [start, stop) avec son noyau.
+
+    Returns:
+        dict: values (liste), changed (cellules source non vides modifiées, None
+        si la colonne est la source telle quelle), warnings, leading, failures
+    """
+    src = sources.raw(col['index'], start, stop)
+    vals = sources.values(col['index'], start, stop)
+    issues = {'warnings': [], 'leading': [], 'failures': {}}
+    out = col['kernel'](col, sources, opts, start, stop, src, vals, issues)
+
+    # Cellules corrigées (valeur source non vide modifiée), hors échecs
+    if out is src:
+        changed = None
+    else:
+        before = np.asarray(src, dtype=object)
+        changed = (before != "") & (np.asarray(out, dtype=object) != before)
+        if issues['failures']:
+            changed[np.fromiter(issues['failures'], dtype=np.int64) - start] = False
+    return {'values': out, 'changed': changed, **issues}
+
+def _column_series(col: dict, values: list, sources: _Sources) -> pd.Series:
+    """Colonne de sortie compacte : catégorielle, texte Arrow, ou constante vide"""
+    if values is sources.empty:
+        return pd.Series("", index=pd.RangeIndex(len(values)), dtype=str)
+    if col['categorical']:
+        return pd.Series(pd.Categorical(values))
+    return pd.Series(values, dtype=str)
+
+def _column_values(res: dict) -> np.ndarray:
+    if 'values' in res:
+        return np.asarray(res['values'], dtype=object)
+    return res['series'].to_numpy(dtype=object)
+
+def _set_cells(res: dict, positions: np.ndarray, value: str) -> dict:
+    """Copie du résultat d'une colonne avec certaines cellules remplacées (le cache reste intact)"""
+    res = dict(res)
+    if 'series' in res:
+        series = res['series'].copy()
+        if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+            series = series.cat.add_categories([value])
+        series.iloc[positions] = value
+        res['series'] = series
+    else:
+        values = list(res['values'])
+        for k in positions:
+            values[k] = value
+        res['values'] = values
+    return res
+
+def _format_block(sources: _Sources, opts: dict, start: int, stop: int,
+                  cache: ColumnCache | None = None, build_output: bool = True,
+                  review: dict | None = None, release: bool = False) -> dict:
+    """
+    Formate les lignes [start, stop) : colonnes (depuis le cache si possible),
+    puis règles par ligne (échecs stricts, type manquant, colonnes obligatoires).
+    Chaque colonne est compactée (catégorielle / texte Arrow) dès qu'elle est
+    formatée : la sortie est assemblée sans table ligne à ligne.
+    Messages sous forme [(position, message)].
+    `release` libère les listes source d'une colonne dès que plus aucune colonne
+    restante n'en a besoin : seulement quand `sources` ne sert qu'à ce bloc
+    (sinon la fenêtre suivante reconvertirait la colonne entière).
+    """
+    plan = sources.plan
+    n_cols = len(plan['columns'])
+
+    # Lignes non vides : au moins une valeur dans une colonne mappée (ne dépend que du mapping)
+    key = (plan['version'], tuple(sorted(sources.names.items())))
+    rows = cache.get('rows', key) if cache is not None else None
+    if rows is None:
+        rows = sources.non_empty_rows(start, stop)
+        if cache is not None:
+            cache.put('rows', key, rows)
+
+    needed_until = plan['needed_until']
+    referentials = referential_versions() if cache is not None else None
+    results = []
+    for col in plan['columns']:
+        i = col['index']
+        key = _column_fingerprint(col, sources, opts, referentials) if cache is not None else None
+        res = cache.get(i, key) if cache is not None else None
+        if res is None:
+            res = _format_column(col, sources, opts, start, stop)
+            if build_output:
+                res['series'] = _column_series(col, res.pop('values'), sources)
+            if cache is not None:
+                cache.put(i, key, res)
+        results.append(res)
+        if release:
+            for j in [j for j in (i, *col['depends']) if needed_until.get(j, j) <= i]:
+                sources.release(j)
+
+    # Mode strict : une ligne en échec n'est plus formatée au-delà de la colonne fautive
+    first_failure = {}
+    for i, res in enumerate(results):
+        for pos in res['failures']:
+            first_failure.setdefault(pos, i)
+
+    errors, warnings, corrected = [], [], 0
+    for res in results:
+        warnings.extend(res['leading'])
+    for i, res in enumerate(results):
+        changed = res['changed']
+        corrected += int(changed.sum()) if changed is not None else 0
+        errors.extend((pos, msg) for pos, msg in res['failures'].items() if first_failure[pos] == i)
+        if first_failure:
+            blanked = np.array(sorted(pos - start for pos, f in first_failure.items() if f < i), dtype=np.int64)
+            if len(blanked):
+                if changed is not None:
+                    corrected -= int(changed[blanked].sum())
+                results[i] = _set_cells(res, blanked, "")
+            warnings.extend((pos, msg) for pos, msg in res['warnings'] if first_failure.get(pos, n_cols) > i)
+        else:
+            warnings.extend(res['warnings'])
+
+    # Type utilisateur manquant
+    type_i, defaulted = plan['user_type'], rows[:0]
+    if type_i is not None:
+        types = _column_values(results[type_i])[rows]
+        missing = rows[(types != "1") & (types != "5")]
+        default = opts['default_user_type_when_missing']
+        if len(missing):
+            if opts['require_user_type_choice'] and default is None:
+                errors.extend((start + k, f"Ligne {start+k+2}: TYPE_UTILISATEUR_MANQUANT") for k in missing)
+            elif default in ("1", "5"):
+                results[type_i] = _set_cells(results[type_i], missing, default)
+                defaulted = missing
+                warnings.extend((start + k, f"Ligne {start+k+2}: Type manquant → fallback '{default}'") for k in missing)
+
+    # Colonnes obligatoires
+    incomplete = np.zeros(len(rows), dtype=bool)
+    for i in plan['required']:
+        incomplete |= _column_values(results[i])[rows] == ""
+    incomplete = rows[incomplete]
+    errors.extend((start + k, f"Ligne {start+k+2}: {plan['required_message']}") for k in incomplete)
+    stats = {'total_rows': stop - start, 'valid_rows': len(rows) - len(incomplete), 'corrected_fields': corrected}
+
+    block = {'stats': stats, 'errors': errors, 'warnings': warnings}
+    if review is not None:
+        review['marks'] = _review_marks(sources, results, start, stop, rows, first_failure, defaulted, incomplete)
+    if build_output:
+        df_out = pd.DataFrame({t: res['series'] for t, res in zip(plan['names'], results)}, copy=False)
+        if len(rows) < stop - start:
+            df_out = df_out.take(rows).reset_index(drop=True)
+        block['df_out'] = df_out
+    return block
+
+class ColumnCache:
+    """
+    Colonnes formatées d'UN DataFrame source, réutilisées d'un appel de process()
+    à l'autre : une colonne n'est recalculée que si sa source, sa table de
+    traduction, une option qu'elle lit (FORMATS) ou un référentiel a changé.
+    Garde `variants` versions par colonne (basculer une option et revenir).
+    """
+
+    def __init__(self, variants: int = 2):
+        self.variants = variants
+        self._source = None
+        self._entries = {}      # colonne (ou 'rows') -> {empreinte: résultat}, du plus ancien au plus récent
+        self.hits = self.misses = 0
+
+    def bind(self, df: pd.DataFrame) -> None:
+        """Associe le cache à un DataFrame source (vidé si ce n'est plus le même)"""
+        if df is not self._source:
+            self._source, self._entries = df, {}
+
+    def get(self, i, key: tuple):
+        entries = self._entries.get(i, {})
+        res = entries.pop(key, None)
+        if res is None:
+            self.misses += 1
+            return None
+        entries[key] = res
+        self.hits += 1
+        return res
+
+    def put(self, i, key: tuple, res) -> None:
+        entries = self._entries.setdefault(i, {})
+        entries[key] = res
+        while len(entries) > self.variants:
+            del entries[next(iter(entries))]
+
+# ---------- Validation seule (dry-run) ----------
+DRY_RUN_SAMPLE = 20       # messages conservés par niveau
+DRY_RUN_BLOCK = 5000      # lignes formatées entre deux contrôles des seuils
+
+def validate(df: pd.DataFrame, mapping: dict, max_errors: int | None = None,
+             max_error_rate: float | None = None, rate_rows: int = 1000,
+             sample_size: int = DRY_RUN_SAMPLE, value_maps: dict | None = None,
+             user_type_map: dict | None = None, template: str | None = None, **options) -> dict:
+    """
+    Vérifie qu'un fichier est importable sans construire la sortie.
+    Mêmes options que process() ; arrêt anticipé dès `max_errors` erreurs
+    (contrôlé par blocs de DRY_RUN_BLOCK lignes), ou si plus de
+    `max_error_rate` (0-1) des `rate_rows` premières lignes sont en erreur.
+    Les messages sont comptés par catégorie au fil de l'eau, seul un
+    échantillon borné est conservé.
+
+    Returns:
+        dict: stats, counts (DataFrame niveau / catégorie / champ / messages),
+        samples ({'Erreur': [...], 'Avertissement': [...]}), rows_checked,
+        stopped (motif de l'arrêt anticipé, None si le fichier a été lu en entier)
+    """
+    opts = {**dict(correct_dates=True, uppercase_names=True, auto_civility=True, auto_user_type=True,
+                   strict=False, civil_fallback="", default_user_type_when_missing=None,
+                   require_user_type_choice=False, check_postal=True, check_sirene=True), **options}
+    plan = template_plan(template)
+    tables = compile_value_maps(value_maps, user_type_map, plan)
+    # Profils jour/mois établis sur le fichier entier, comme process() : communs à tous les blocs
+    profiles = date_profiles(df, mapping, value_maps, user_type_map, template) if opts['correct_dates'] else {}
+    stats = {'total_rows':0,'valid_rows':0,'corrected_fields':0}
+    counts, samples = {}, {'Erreur': [], 'Avertissement': []}
+    n_errors = 0
+    stopped = None
+
+    def tally(messages: list, level: str) -> None:
+        if not messages:
+            return
+        texts = [msg for _, msg in messages]
+        samples[level].extend(texts[:max(sample_size - len(samples[level]), 0)])
+        # Comme issues_frame : chaque gabarit de message n'est catégorisé qu'une fois
+        codes, templates = pd.factorize(pd.Series(texts, dtype="string[pyarrow]")
+                                        .str.replace(MESSAGE_VALUES_RE.pattern, "", regex=True))
+        for tpl, n in zip(templates, np.bincount(codes)):
+            key = (level, *_template_category(tpl))
+            counts[key] = counts.get(key, 0) + int(n)
+
+    # Premier bloc = les `rate_rows` premières lignes, pour mesurer le taux exactement
+    bounds = [0, rate_rows] if max_error_rate is not None else [0]
+    bounds += range(bounds[-1] + DRY_RUN_BLOCK, len(df), DRY_RUN_BLOCK)
+    for start, stop in zip(bounds, bounds[1:] + [len(df)]):
+        stop = min(stop, len(df))
+        if start >= stop:
+            continue
+        # Un _Sources par bloc : seules les lignes du bloc sont converties en listes
+        sources = _Sources(df.iloc[start:stop], mapping, tables, plan, start, profiles)
+        block = _format_block(sources, opts, start, stop, build_output=False, release=True)
+        for k in stats:
+            stats[k] += block['stats'][k]
+        tally(block['errors'], 'Erreur')
+        tally(block['warnings'], 'Avertissement')
+        n_errors += len(block['errors'])
+        if max_errors is not None and n_errors >= max_errors:
+            stopped = f"{n_errors} erreurs atteintes (seuil : {max_errors})"
+            break
+        if max_error_rate is not None and start == 0 and stats['total_rows'] >= rate_rows:
+            error_rows = len({pos for pos, _ in block['errors']})
+            if error_rows / rate_rows > max_error_rate:
+                stopped = (f"{error_rows / rate_rows:.0%} des {rate_rows} premières lignes en erreur "
+                           f"(seuil : {max_error_rate:.0%})")
+                break
+
+    counts_df = pd.DataFrame(
+        [(level, cat, field, n) for (level, cat, field), n in counts.items()],
+        columns=['niveau', 'catégorie', 'champ', 'messages'],
+    ).sort_values(['niveau', 'messages'], ascending=[False, False], ignore_index=True)
+    return {'stats': stats, 'counts': counts_df, 'samples': samples,
+            'rows_checked': stats['total_rows'], 'stopped': stopped}
+
+# ---------- Journal structuré (erreurs / avertissements) ----------
+# (motif regex, catégorie, champ concerné) — le premier motif reconnu l'emporte
+ISSUE_CATEGORIES = [
+    (r"Prénom/Nom manquant", "Données obligatoires manquantes", "Prénom / Nom"),
+    (r"TYPE_UTILISATEUR_MANQUANT", "Type utilisateur manquant", "Type utilisateur"),
+    (r"Type manquant", "Types manquants (fallback)", "Type utilisateur"),
+    (r"Type .*→", "Types convertis", "Type utilisateur"),
+    (r"Civilité déduite", "Civilités déduites", "Civilité"),
+    (r"Civilité manquante", "Civilités par défaut", "Civilité"),
+    (r"Date invalide", "Dates invalides", "Date"),
+    (r"dates ambiguës", "Dates ambiguës", "Date"),
+    (r"Email (?:suspect|invalide)", "Emails suspects", "Email"),
+    (r"Téléphone suspect", "Téléphones suspects", "Téléphone"),
+    (r"Pays non reconnu", "Pays non reconnus", "Pays"),
+    (r"Pays .*interprété", "Pays corrigés", "Pays"),
+    (r"SIRET invalide", "SIRET invalides", "SIRET"),
+    (r"SIRENE", "Contrôles SIRENE", "Entreprise"),
+    (r"Code postal", "Codes postaux / villes", "Adresse"),
+    (r"Code diplôme inconnu", "Codes diplôme inconnus", "Diplôme"),
+    (r"Mode de formation", "Modes de formation invalides", "Diplôme"),
+]
+ISSUE_COLUMNS = ['niveau', 'ligne', 'catégorie', 'champ', 'message']
+
+# Valeurs citées et nombres : retirés d'un message, il reste son gabarit
+MESSAGE_VALUES_RE = re.compile(r"'[^']*'|\d+")
+
+@lru_cache(maxsize=1024)
+def _template_category(template: str) -> tuple[str, str]:
+    return next(((cat, field) for pattern, cat, field in ISSUE_CATEGORIES if re.search(pattern, template)),
+                ('Autres', ''))
+
+def issue_category(message: str) -> tuple[str, str]:
+    """(catégorie, champ) d'un message du journal"""
+    return _template_category(MESSAGE_VALUES_RE.sub("", message))
+
+def issues_frame(errors: list, warnings: list) -> pd.DataFrame:
+    """
+    Journal sous forme de DataFrame (niveau, ligne, catégorie, champ, message),
+    trié par (catégorie, ligne) pour permettre un filtrage par tranches.
+    Les messages sans numéro de ligne (niveau colonne) ont la ligne 0.
+    """
+    messages = pd.Series(list(errors) + list(warnings), dtype="string[pyarrow]")
+    frame = pd.DataFrame({
+        'niveau': ['Erreur'] * len(errors) + ['Avertissement'] * len(warnings),
+        'ligne': pd.to_numeric(messages.str.split(':', n=1).str[0].str.removeprefix('Ligne '), errors='coerce')
+                   .fillna(0).astype('int64'),
+        'catégorie': 'Autres',
+        'champ': '',
+        'message': messages,
+    })
+    # Gabarit du message (valeurs citées et nombres retirés) : peu de gabarits
+    # distincts, catégorisés une fois chacun puis propagés par correspondance
+    codes, templates = pd.factorize(messages.str.replace(MESSAGE_VALUES_RE.pattern, "", regex=True))
+    found = [_template_category(tpl) for tpl in templates]
+    frame['catégorie'] = pd.Index([cat for cat, _ in found], dtype=object).take(codes)
+    frame['champ'] = pd.Index([field for _, field in found], dtype=object).take(codes)
+    return frame.sort_values(['catégorie', 'ligne'], kind='stable').reset_index(drop=True)
+
+def issue_index(frame: pd.DataFrame) -> dict:
+    """Bornes [début, fin) de chaque catégorie dans le journal trié (calculées une fois)"""
+    cats = frame['catégorie'].to_numpy()
+    index, start = {}, 0
+    for n in range(1, len(cats) + 1):
+        if n == len(cats) or cats[n] != cats[start]:
+            index[cats[start]] = (start, n)
+            start = n
+    return index
+
+def issue_page(frame: pd.DataFrame, index: dict, categories: list | None = None,
+               row_min: int | None = None, row_max: int | None = None,
+               page: int = 0, page_size: int = 50) -> tuple[pd.DataFrame, int]:
+    """
+    Une page du journal filtré par catégories et plage de lignes.
+    Coût O(catégories × log n + taille de page) grâce au tri par (catégorie, ligne).
+
+    Returns:
+        tuple: (page, nombre total de messages correspondant au filtre)
+    """
+    lines = frame['ligne'].to_numpy()
+    spans = []
+    for cat in (categories if categories is not None else list(index)):
+        if cat not in index:
+            continue
+        start, end = index[cat]
+        lo = start if row_min is None else start + int(lines[start:end].searchsorted(row_min, 'left'))
+        hi = end if row_max is None else start + int(lines[start:end].searchsorted(row_max, 'right'))
+        if hi > lo:
+            spans.append((lo, hi))
+    total = sum(hi - lo for lo, hi in spans)
+
+    positions, skip = [], page * page_size
+    for lo, hi in spans:
+        if skip >= hi - lo:
+            skip -= hi - lo
+            continue
+        take = min(hi - lo - skip, page_size - len(positions))
+        positions.extend(range(lo + skip, lo + skip + take))
+        skip = 0
+        if len(positions) == page_size:
+            break
+    return frame.iloc[positions], total
+
+def flagged_rows(source: pd.DataFrame, frame: pd.DataFrame, levels=('Erreur',)) -> pd.DataFrame:
+    """Lignes source concernées par le journal (ligne N = position N-2), avec leurs motifs"""
+    issues = frame[frame['niveau'].isin(levels) & (frame['ligne'] >= 2)]
+    motifs = issues.groupby('ligne')['message'].agg(' | '.join)
+    out = source.iloc[motifs.index.to_numpy() - 2].copy()
+    out.insert(0, 'Motifs', motifs.to_numpy())
+    out.insert(0, 'Ligne', motifs.index.to_numpy())
+    return out
 
 # ---------- Exports ----------
-def to_csv_bytes(df: pd.DataFrame) -> bytes:
-    return df.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
+CSV_CHUNK_ROWS = 50_000        # lignes converties en texte à la fois
+GZIP_LEVEL = 6
+ZSTD_FRAME_BYTES = 4 * 1024 * 1024
+
+class _ZstdWriter:
+    """
+    Écriture zstd par trames successives (une par ZSTD_FRAME_BYTES) : la suite
+    de trames forme un flux zstd valide, et la cible n'est jamais fermée ici.
+    """
+
+    def __init__(self, raw):
+        import pyarrow as pa
+        self._pa, self._raw, self._buffer = pa, raw, []
+        self._size = 0
+
+    def write(self, data: bytes) -> int:
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= ZSTD_FRAME_BYTES:
+            self.flush()
+        return len(data)
+
+    def flush(self) -> None:
+        if self._size:
+            self._raw.write(self._pa.compress(b"".join(self._buffer), codec='zstd', asbytes=True))
+            self._buffer, self._size = [], 0
+
+    def close(self) -> None:
+        self.flush()
+
+@contextmanager
+def open_output(target, compression: str | None = None, member: str = "import_formate.csv"):
+    """
+    Flux binaire d'écriture vers `target` (chemin ou flux), compressé à la volée
+    en gzip, zstd ou zip (un seul membre `member`) : les octets ne sont écrits
+    qu'une fois, sans copie intermédiaire non compressée.
+    """
+    if compression not in (None, *COMPRESSION_SUFFIXES):
+        raise ValueError(f"Compression '{compression}' inconnue ({', '.join(COMPRESSION_SUFFIXES)})")
+    with ExitStack() as stack:
+        if compression == 'zip':
+            zf = stack.enter_context(zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED))
+            yield stack.enter_context(zf.open(member, 'w', force_zip64=True))
+            return
+        raw = stack.enter_context(open(target, 'wb')) if isinstance(target, (str, os.PathLike)) else target
+        if compression == 'gzip':
+            raw = stack.enter_context(gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL, mtime=0))
+        elif compression == 'zstd':
+            raw = stack.enter_context(closing(_ZstdWriter(raw)))
+        yield raw
+
+def csv_chunk(df: pd.DataFrame, first: bool) -> bytes:
+    """Bloc d'un CSV UTF-8 écrit par morceaux : BOM et en-tête avec le premier seulement"""
+    text = df.to_csv(index=False, header=first)
+    return ('\ufeff' + text if first else text).encode('utf-8')
+
+def write_csv(df: pd.DataFrame, target, compression: str | None = None,
+              member: str = "import_formate.csv") -> None:
+    """CSV UTF-8 (BOM) écrit par blocs de CSV_CHUNK_ROWS lignes, compressé si demandé"""
+    with open_output(target, compression, member) as out:
+        for start in range(0, max(len(df), 1), CSV_CHUNK_ROWS):
+            out.write(csv_chunk(df.iloc[start:start + CSV_CHUNK_ROWS], start == 0))
+
+def to_csv_bytes(df: pd.DataFrame, compression: str | None = None) -> bytes:
+    bio = BytesIO()
+    write_csv(df, bio, compression)
+    return bio.getvalue()
+
+def to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    bio = BytesIO()
+    df.to_parquet(bio, index=False, compression='zstd')
+    return bio.getvalue()
 
 def to_excel_bytes(df: pd.DataFrame) -> bytes:
     bio = BytesIO()
@@ -831,3 +2321,170 @@ def to_excel_bytes(df: pd.DataFrame) -> bytes:
         )
     bio.seek(0)
     return bio.getvalue()
+
+# ---------- Classeur de revue (cellules annotées) ----------
+# Catégories d'annotation, de la plus prioritaire à la moins prioritaire (une seule par cellule)
+REVIEW_CATEGORIES = ('invalide', 'type par défaut', 'déduite', 'corrigée')
+# Catégories du journal qui désignent une valeur invalide dans la colonne qui l'émet
+REVIEW_INVALID_ISSUES = frozenset({"Emails suspects", "Téléphones suspects", "SIRET invalides", "Dates invalides",
+                                   "Pays non reconnus", "Codes postaux / villes", "Codes diplôme inconnus",
+                                   "Modes de formation invalides", "Contrôles SIRENE"})
+# Remplissage (couleur ARGB) par catégorie
+REVIEW_FILLS = {'invalide': 'FFFFC7CE', 'type par défaut': 'FFFFE699', 'déduite': 'FFDDEBF7', 'corrigée': 'FFFFF2CC'}
+REVIEW_MAX_COMMENTS = 20_000   # au-delà, cellules colorées sans commentaire (détail dans la feuille Annotations)
+REVIEW_MAX_DETAIL_ROWS = 200_000  # lignes de la feuille Annotations (cellules non commentées)
+REVIEW_CHUNK_ROWS = 10_000     # lignes converties à la fois pour l'écriture
+MARK_COLUMNS = ['ligne', 'colonne', 'catégorie', 'origine', 'message']
+
+def _review_marks(sources: _Sources, results: list, start: int, stop: int, rows: np.ndarray,
+                  first_failure: dict, defaulted: np.ndarray, incomplete: np.ndarray) -> pd.DataFrame:
+    """
+    Annotations des cellules de sortie, triées par (ligne, colonne) : ligne =
+    position dans la sortie, colonne = index dans le gabarit, catégorie
+    (REVIEW_CATEGORIES), valeur source d'origine et message du journal.
+    Les cellules vidées par un échec strict antérieur ne sont pas annotées.
+    """
+    plan, n_cols = sources.plan, len(results)
+    parts = []
+
+    def add(i: int, positions, category: str, messages="") -> None:
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions):
+            parts.append(pd.DataFrame({'ligne': positions, 'colonne': i, 'catégorie': category, 'message': messages}))
+
+    for i, res in enumerate(results):
+        blanked = {pos - start for pos, f in first_failure.items() if f < i}
+        invalid = [(pos - start, msg) for pos, msg in [*res['leading'], *res['warnings'], *res['failures'].items()]
+                   if pos >= start and pos - start not in blanked
+                   and (pos in res['failures'] or issue_category(msg)[0] in REVIEW_INVALID_ISSUES)]
+        if invalid:
+            add(i, [k for k, _ in invalid], 'invalide', [msg for _, msg in invalid])
+        out = _column_values(res)
+        if i in sources.names:
+            col = sources.frame(start, stop)[sources.names[i]]
+            blank = (col.isna() | col.astype(str).str.strip().eq("")).to_numpy(dtype=bool)
+        else:
+            blank = np.ones(stop - start, dtype=bool)
+        keep = np.ones(stop - start, dtype=bool)
+        keep[list(blanked)] = False
+        add(i, np.flatnonzero(blank & (out != "") & keep), 'déduite')
+        if res['changed'] is not None:
+            add(i, np.flatnonzero(res['changed'] & keep), 'corrigée')
+    if plan['user_type'] is not None:
+        add(plan['user_type'], defaulted, 'type par défaut', "Type manquant, valeur par défaut appliquée")
+    for i in plan['required']:
+        empty = incomplete[_column_values(results[i])[incomplete] == ""]
+        add(i, empty, 'invalide', plan['required_message'])
+
+    if not parts:
+        return pd.DataFrame(columns=MARK_COLUMNS)
+    marks = pd.concat(parts, ignore_index=True)
+    marks['catégorie'] = pd.Categorical(marks['catégorie'], categories=REVIEW_CATEGORIES, ordered=True)
+    marks = marks.sort_values(['ligne', 'colonne', 'catégorie'], kind='stable') \
+                 .drop_duplicates(['ligne', 'colonne'], ignore_index=True)
+    # Lignes vides retirées de la sortie : positions du bloc → positions de sortie
+    out_pos = np.searchsorted(rows, marks['ligne'].to_numpy())
+    marks = marks[(out_pos < len(rows)) & (rows[np.minimum(out_pos, len(rows) - 1)] == marks['ligne'])]
+    # Valeur source d'origine, lue pour les seules cellules annotées
+    origine = np.full(len(marks), "", dtype=object)
+    for i, idx in marks.groupby('colonne').indices.items():
+        if i in sources.names:
+            values = sources.frame(start, stop)[sources.names[i]].iloc[marks['ligne'].to_numpy()[idx]]
+            origine[idx] = values.astype(object).where(values.notna(), "").astype(str).str.strip().to_numpy()
+    marks.insert(3, 'origine', origine)
+    marks['ligne'] = np.searchsorted(rows, marks['ligne'].to_numpy())
+    return marks.reset_index(drop=True)
+
+def _review_comment(category: str, origine: str, message: str) -> str:
+    if category == 'corrigée':
+        return f"Valeur d'origine : {origine}"
+    if category == 'déduite':
+        return "Valeur d'origine vide (déduite)"
+    return f"{message}\nValeur d'origine : {origine}" if origine else message
+
+def review_summary(marks: pd.DataFrame, names: list) -> pd.DataFrame:
+    """Nombre de cellules annotées par catégorie et colonne du gabarit"""
+    counts = marks.groupby(['catégorie', 'colonne'], observed=True).size().reset_index(name='cellules')
+    counts['colonne'] = [names[i] for i in counts['colonne']]
+    return counts.sort_values(['catégorie', 'cellules'], ascending=[True, False], ignore_index=True)
+
+def write_review_workbook(df_out: pd.DataFrame, marks: pd.DataFrame, target) -> dict:
+    """
+    Classeur de revue : la sortie formatée avec les cellules annotées colorées
+    par catégorie et commentées (valeur d'origine, motif), une feuille de
+    synthèse et, au-delà de REVIEW_MAX_COMMENTS commentaires, la liste des
+    annotations restantes (feuille Annotations). Écrit en flux (openpyxl write_only) par tranches de lignes, avec
+    un style nommé par catégorie partagé par toutes les cellules : la mémoire
+    ne dépend que de la taille d'une tranche et du nombre de commentaires.
+
+    Returns:
+        dict: cellules annotées, commentaires et lignes de la feuille Annotations écrits
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.comments import Comment
+    from openpyxl.styles import Font, NamedStyle, PatternFill
+
+    wb = Workbook(write_only=True)
+    styles = {}
+    for category, color in REVIEW_FILLS.items():
+        style = NamedStyle(name=f"revue {category}", fill=PatternFill('solid', start_color=color))
+        wb.add_named_style(style)
+        styles[category] = style.name
+    bold = Font(bold=True)
+
+    def header(sheet, labels) -> list:
+        cells = [WriteOnlyCell(sheet, value=v) for v in labels]
+        for cell in cells:
+            cell.font = bold
+        return cells
+
+    ws = wb.create_sheet("Import Utilisateur")
+    ws.append(header(ws, df_out.columns))
+    lines = marks['ligne'].to_numpy()
+    columns = marks['colonne'].to_numpy()
+    categories = marks['catégorie'].astype(str).to_numpy()
+    origins, messages = marks['origine'].to_numpy(), marks['message'].to_numpy()
+    n_comments, m = 0, 0
+    for chunk in range(0, len(df_out), REVIEW_CHUNK_ROWS):
+        block = df_out.iloc[chunk:chunk + REVIEW_CHUNK_ROWS].to_numpy(dtype=object)
+        for r, values in enumerate(block, chunk):
+            row = [v if v != "" else None for v in values]
+            while m < len(lines) and lines[m] == r:
+                c = columns[m]
+                cell = WriteOnlyCell(ws, value=row[c])
+                cell.style = styles[categories[m]]
+                if n_comments < REVIEW_MAX_COMMENTS:
+                    cell.comment = Comment(_review_comment(categories[m], origins[m], messages[m]), "Import")
+                    n_comments += 1
+                row[c] = cell
+                m += 1
+            ws.append(row)
+
+    summary = wb.create_sheet("Synthèse")
+    summary.append(header(summary, ("Catégorie", "Colonne", "Cellules")))
+    counts = review_summary(marks, list(df_out.columns))
+    for category, total in counts.groupby('catégorie', observed=True)['cellules'].sum().items():
+        label = WriteOnlyCell(summary, value=category)
+        label.style = styles[category]
+        summary.append([label, "(toutes)", int(total)])
+    for category, column, n in counts.itertuples(index=False):
+        summary.append([category, column, int(n)])
+    # Cellules sans commentaire : valeur d'origine et motif listés à part
+    rest = slice(n_comments, n_comments + REVIEW_MAX_DETAIL_ROWS)
+    n_detail = len(lines[rest])
+    if n_detail:
+        summary.append([])
+        summary.append([f"Commentaires limités aux {n_comments} premières cellules annotées ; "
+                        f"{n_detail} suivantes dans la feuille Annotations"
+                        + (f", {len(marks) - n_comments - n_detail} non détaillées"
+                           if n_comments + n_detail < len(marks) else "")])
+        detail = wb.create_sheet("Annotations")
+        detail.append(header(detail, ("Ligne", "Colonne", "Catégorie", "Valeur d'origine", "Message")))
+        names = list(df_out.columns)
+        for line, c, category, origine, message in zip(lines[rest], columns[rest], categories[rest],
+                                                       origins[rest], messages[rest]):
+            # Ligne Excel de la cellule (en-tête en ligne 1)
+            detail.append([int(line) + 2, names[c], category, origine or None, message or None])
+    wb.save(target)
+    return {'cells': len(marks), 'comments': n_comments, 'details': n_detail}
@@ -0,0 +1,116 @@
+# fuzzy.py
+"""
+Index de correspondance approximative pour les vocabulaires canoniques
+(pays, types d'utilisateur, oui/non, civilités).
+
+Les termes sont découpés en trigrammes de caractères (index inversé) : une
+requête ne compare que les termes partageant des trigrammes avec elle, puis
+vérifie les meilleurs candidats par distance d'édition bornée
+(Damerau-Levenshtein restreinte, qui compte « Frnace » à 1 de « France »).
+Les résultats sont mémorisés par valeur distincte.
+"""
+from __future__ import annotations
+import unicodedata
+from collections import defaultdict
+
+MEMO_SIZE = 100_000   # valeurs distinctes mémorisées par index
+
+def fold(value) -> str:
+    """Minuscules, sans accents, espaces normalisés"""
+    s = unicodedata.normalize("NFD", str(value).strip().lower())
+    s = "".join(c for c in s if unicodedata.category(c) != "Mn")
+    return " ".join(s.split())
+
+def trigrams(s: str) -> set[str]:
+    padded = f"  {s} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Distance OSA (insertion, suppression, substitution, transposition), arrêt au-delà de `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i-1] != b[j-1]
+            cur[j] = min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + cost)
+            if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                cur[j] = min(cur[j], prev2[j-2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+def max_edits(length: int) -> int:
+    """Nombre d'erreurs tolérées selon la longueur du mot"""
+    return 0 if length <= 3 else 1 if length <= 5 else 2
+
+class FuzzyIndex:
+    """
+    Index trigrammes d'un vocabulaire {terme: valeur canonique}.
+    `search` renvoie les candidats classés [(valeur, terme, score 0-1)].
+    """
+
+    def __init__(self, vocabulary: dict, candidates: int = 8):
+        self.candidates = candidates
+        self._terms = []          # termes normalisés
+        self._values = []         # valeur canonique de chaque terme
+        self._sizes = []          # nombre de trigrammes de chaque terme
+        self._postings = defaultdict(list)
+        seen = set()
+        for term, value in vocabulary.items():
+            t = fold(term)
+            if not t or t in seen:
+                continue  # doublon après normalisation : le premier l'emporte
+            seen.add(t)
+            tid = len(self._terms)
+            grams = trigrams(t)
+            self._terms.append(t)
+            self._values.append(value)
+            self._sizes.append(len(grams))
+            for g in grams:
+                self._postings[g].append(tid)
+        self._memo = {}
+
+    def search(self, query, limit: int = 3) -> list[tuple]:
+        q = fold(query)
+        key = (q, limit)
+        if key not in self._memo:
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[key] = self._search(q, limit)
+        return self._memo[key]
+
+    def best(self, query, min_score: float = 0.0):
+        """Valeur canonique du meilleur candidat (None si aucun)"""
+        found = self.search(query, limit=1)
+        return found[0][0] if found and found[0][2] >= min_score else None
+
+    def _search(self, q: str, limit: int) -> list[tuple]:
+        if not q:
+            return []
+        grams = trigrams(q)
+        shared = defaultdict(int)
+        for g in grams:
+            for tid in self._postings.get(g, ()):
+                shared[tid] += 1
+        # Présélection par coefficient de Dice sur les trigrammes
+        ranked = sorted(
+            shared, key=lambda tid: -2 * shared[tid] / (len(grams) + self._sizes[tid])
+        )[:self.candidates]
+        results = []
+        for tid in ranked:
+            term = self._terms[tid]
+            limit_edits = max_edits(min(len(q), len(term)))
+            d = edit_distance(q, term, limit_edits)
+            if d <= limit_edits:
+                results.append((self._values[tid], term, round(1 - d / max(len(q), len(term)), 3)))
+        results.sort(key=lambda r: -r[2])
+        # Une seule entrée par valeur canonique (la mieux notée)
+        seen, unique = set(), []
+        for r in results:
+            if r[0] not in seen:
+                seen.add(r[0])
+                unique.append(r)
+        return unique[:limit]
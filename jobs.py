@@ -0,0 +1,156 @@
+# jobs.py
+"""
+Ordonnanceur des traitements lourds, partagé par toutes les sessions d'un
+même serveur : file d'attente par ordre d'arrivée, nombre de workers borné,
+limite de jobs simultanés par utilisateur et admission selon la mémoire
+disponible.
+
+L'ordre n'est pas strictement FIFO : un job non admissible (limite de son
+utilisateur atteinte, mémoire insuffisante) est doublé par les suivants qui,
+eux, peuvent démarrer.
+"""
+from __future__ import annotations
+import itertools, threading, time, traceback
+
+MEMORY_RESERVE_BYTES = 512 * 1024 * 1024   # marge laissée au système
+JOB_TTL_SECONDS = 3600                     # conservation d'un job terminé dont le résultat n'est jamais récupéré
+
+def available_memory() -> int | None:
+    """Mémoire disponible (octets) d'après /proc/meminfo, None si inconnue"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+class JobScheduler:
+    """
+    Exécute des fonctions dans un pool de `max_workers` threads.
+    Un job n'est démarré que si son utilisateur a moins de `per_user_limit`
+    jobs en cours et si sa mémoire estimée tient dans la mémoire disponible
+    (sauf si aucun job ne tourne, pour ne jamais bloquer la file).
+
+    MemAvailable reflète déjà ce que les jobs en cours ont alloué : seule la
+    part de leurs estimations pas encore consommée (réservé moins la baisse de
+    MemAvailable depuis le démarrage du premier d'entre eux) s'y ajoute.
+
+    Un job terminé reste consultable jusqu'à `forget` ; une session abandonnée
+    ne l'appelle jamais : les jobs terminés depuis plus de `ttl` secondes sont
+    purgés à chaque dépôt et à chaque fin de job (jamais si `ttl` est None).
+    """
+
+    def __init__(self, max_workers: int = 2, per_user_limit: int = 1,
+                 memory_reserve: int = MEMORY_RESERVE_BYTES, ttl: float | None = JOB_TTL_SECONDS):
+        self.max_workers = max_workers
+        self.per_user_limit = per_user_limit
+        self.memory_reserve = memory_reserve
+        self.ttl = ttl
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._queue = []          # ids en attente, ordre d'arrivée
+        self._jobs = {}           # id -> dict d'état
+        self._running = {}        # utilisateur -> nb de jobs en cours
+        self._reserved = 0        # mémoire estimée des jobs en cours
+        self._baseline = None     # MemAvailable au démarrage du premier job en cours
+        for n in range(max_workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{n}", daemon=True).start()
+
+    def submit(self, user: str, fn, *args, est_bytes: int = 0, **kwargs) -> int:
+        """Met un job en file et renvoie son identifiant"""
+        with self._cond:
+            self._sweep()
+            job_id = next(self._ids)
+            self._jobs[job_id] = {
+                'user': user, 'fn': fn, 'args': args, 'kwargs': kwargs, 'est_bytes': est_bytes,
+                'state': 'queued', 'submitted': time.time(), 'finished': None, 'result': None, 'error': None,
+            }
+            self._queue.append(job_id)
+            self._cond.notify_all()
+            return job_id
+
+    def status(self, job_id: int) -> dict | None:
+        """État d'un job : state, position (1 = prochain à démarrer), result, error, finished (horodatage)"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            position = self._queue.index(job_id) + 1 if job['state'] == 'queued' else 0
+            return {'state': job['state'], 'position': position,
+                    'result': job['result'], 'error': job['error'], 'finished': job['finished']}
+
+    def forget(self, job_id: int) -> None:
+        """Libère un job terminé (résultat récupéré par la session)"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job and job['state'] in ('done', 'failed'):
+                del self._jobs[job_id]
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {'queued': len(self._queue),
+                    'running': sum(self._running.values()),
+                    'workers': self.max_workers}
+
+    def _sweep(self) -> None:
+        """Purge les jobs terminés depuis plus de `ttl` secondes (verrou tenu)"""
+        if self.ttl is None:
+            return
+        limit = time.time() - self.ttl
+        for job_id in [i for i, job in self._jobs.items() if job['finished'] is not None and job['finished'] < limit]:
+            del self._jobs[job_id]
+
+    def _admissible(self, job: dict) -> bool:
+        if self._running.get(job['user'], 0) >= self.per_user_limit:
+            return False
+        if not self._running:
+            return True
+        free = available_memory()
+        if free is None:
+            return True
+        return job['est_bytes'] + self._pending(free) + self.memory_reserve <= free
+
+    def _pending(self, free: int) -> int:
+        """Part des réservations des jobs en cours pas encore allouée (estimation)"""
+        if self._baseline is None:
+            return self._reserved
+        return max(0, self._reserved - max(0, self._baseline - free))
+
+    def _next_job(self) -> int | None:
+        for job_id in self._queue:
+            if self._admissible(self._jobs[job_id]):
+                return job_id
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job_id = self._next_job()
+                while job_id is None:
+                    # Réveil périodique : la mémoire disponible peut évoluer
+                    self._cond.wait(timeout=1.0)
+                    job_id = self._next_job()
+                self._queue.remove(job_id)
+                job = self._jobs[job_id]
+                job['state'] = 'running'
+                if not self._running:
+                    self._baseline = available_memory()
+                self._running[job['user']] = self._running.get(job['user'], 0) + 1
+                self._reserved += job['est_bytes']
+            try:
+                result, error, state = job['fn'](*job['args'], **job['kwargs']), None, 'done'
+            except Exception as e:
+                result, error, state = None, e, 'failed'
+                job['traceback'] = traceback.format_exc()
+            with self._cond:
+                job.update(state=state, result=result, error=error, finished=time.time(), fn=None, args=(), kwargs={})
+                self._running[job['user']] -= 1
+                if not self._running[job['user']]:
+                    del self._running[job['user']]
+                self._reserved -= job['est_bytes']
+                if not self._running:
+                    self._baseline = None
+                self._sweep()
+                self._cond.notify_all()
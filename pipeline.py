@@ -0,0 +1,278 @@
+# pipeline.py
+"""
+Exécution en pipeline d'un gros fichier : lecture, formatage et écriture
+se recouvrent au lieu de s'enchaîner.
+
+    python pipeline.py source.csv sortie.csv.gz [--workers 3] [--chunk-rows 50000]
+
+Un thread lecteur découpe la source en blocs (`iter_table`, colonnes utiles
+seulement), un pool de workers les formate (`process` avec le décalage de
+ligne du bloc) et un thread écrivain les écrit dans l'ordre du fichier
+(CSV éventuellement compressé, ou Parquet). Les étages sont reliés par des
+files bornées, et le nombre de blocs en vol est plafonné : un étage lent
+bloque les précédents (contre-pression), la mémoire reste bornée quelle que
+soit la taille du fichier. La première erreur d'un étage arrête les autres
+et est relancée par `run_pipeline`.
+
+Chaque étage mesure son temps actif, son attente en entrée (famine) et son
+attente en sortie (contre-pression) : l'étage le plus utilisé est le goulot.
+Les formateurs sont en grande partie du Python pur (GIL) : le gain vient du
+recouvrement avec la lecture, la compression et l'écriture, qui libèrent le
+GIL, plus que du nombre de workers.
+
+Différences avec `process` sur le fichier entier : les dates ambiguës sont
+lues avec le profil jour/mois du premier bloc, le journal est ordonné
+bloc par bloc, et un CSV que pyarrow refuse en cours de lecture (lignes
+irrégulières) fait échouer le pipeline au lieu de basculer sur le moteur C.
+"""
+from __future__ import annotations
+import argparse, os, queue, threading, time
+import pandas as pd
+from batch import map_sample
+from core import (iter_table, process, source_columns, date_profiles, open_output, csv_chunk,
+                  strip_compression_suffix, template_plan)
+
+PIPELINE_WORKERS = int(os.environ.get("IMPORT_PIPELINE_WORKERS", min(3, os.cpu_count() or 1)))
+PIPELINE_CHUNK_ROWS = 50_000
+PIPELINE_QUEUE = 2          # blocs en attente par file (entre deux étages)
+POLL_SECONDS = 0.1          # réveil des attentes bloquées, pour voir un arrêt sur erreur
+
+class _Stopped(Exception):
+    """Un autre étage a échoué : l'étage courant s'arrête sans rien ajouter"""
+
+class _Stage:
+    """Compteurs d'un étage (cumulés sur ses threads)"""
+
+    def __init__(self, name: str, threads: int = 1):
+        self.name, self.threads = name, threads
+        self.busy = self.starved = self.blocked = 0.0
+        self.blocks = self.rows = 0
+        self._lock = threading.Lock()
+
+    def add(self, busy: float = 0.0, starved: float = 0.0, blocked: float = 0.0, rows: int | None = None) -> None:
+        with self._lock:
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+            if rows is not None:
+                self.blocks += 1
+                self.rows += rows
+
+    def summary(self, wall: float) -> dict:
+        return {'Étage': self.name, 'Threads': self.threads, 'Blocs': self.blocks, 'Lignes': self.rows,
+                'Actif (s)': round(self.busy, 2), 'Attente entrée (s)': round(self.starved, 2),
+                'Attente sortie (s)': round(self.blocked, 2),
+                'Utilisation': round(self.busy / (wall * self.threads), 3) if wall else 0.0}
+
+class _Pipeline:
+    """État partagé par les threads : files, fenêtre de blocs en vol, première erreur"""
+
+    def __init__(self, workers: int, queue_size: int):
+        self.inbox = queue.Queue(maxsize=queue_size)    # lecteur → workers
+        self.outbox = queue.Queue(maxsize=queue_size)   # workers → écrivain
+        # Blocs lus mais pas encore écrits : borne aussi les blocs en attente de réordonnancement
+        self.window = threading.Semaphore(2 * queue_size + workers)
+        self.stop = threading.Event()
+        self.error = None
+
+    def fail(self, error: BaseException) -> None:
+        if not self.stop.is_set():
+            self.error = error
+            self.stop.set()
+
+    def put(self, q: queue.Queue, item) -> float:
+        """Dépose `item` (bloquant tant que la file est pleine) ; renvoie le temps d'attente"""
+        t0 = time.perf_counter()
+        while True:
+            if self.stop.is_set():
+                raise _Stopped
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                return time.perf_counter() - t0
+            except queue.Full:
+                pass
+
+    def get(self, q: queue.Queue) -> tuple:
+        """(élément, temps d'attente)"""
+        t0 = time.perf_counter()
+        while True:
+            if self.stop.is_set():
+                raise _Stopped
+            try:
+                return q.get(timeout=POLL_SECONDS), time.perf_counter() - t0
+            except queue.Empty:
+                pass
+
+    def acquire(self) -> float:
+        t0 = time.perf_counter()
+        while not self.window.acquire(timeout=POLL_SECONDS):
+            if self.stop.is_set():
+                raise _Stopped
+        return time.perf_counter() - t0
+
+    def run(self, target, *args) -> threading.Thread:
+        def body():
+            try:
+                target(*args)
+            except _Stopped:
+                pass
+            except BaseException as e:
+                self.fail(e)
+        thread = threading.Thread(target=body, name=f"pipeline-{target.__name__.strip('_')}", daemon=True)
+        thread.start()
+        return thread
+
+def run_pipeline(open_source, filename: str, target, out_fmt: str = "csv", compression: str | None = None,
+                 mapping: dict | None = None, saved_mapping: dict | None = None,
+                 value_maps: dict | None = None, user_type_map: dict | None = None,
+                 workers: int = PIPELINE_WORKERS, chunk_rows: int = PIPELINE_CHUNK_ROWS,
+                 queue_size: int = PIPELINE_QUEUE, **options) -> dict:
+    """
+    Lit, formate et écrit `filename` en pipeline vers `target` (chemin ou flux).
+    `open_source()` renvoie un flux neuf à chaque lecture (échantillon de
+    mapping, puis lecture par blocs). Sans `mapping`, il est établi sur
+    l'échantillon (mapping automatique corrigé par `saved_mapping`).
+    Options de process() dans `options`.
+
+    Returns:
+        dict: stats, errors, warnings (comme process), mapping,
+        metrics (une ligne par étage), bottleneck (étage le plus utilisé), seconds
+    """
+    if out_fmt not in ("csv", "parquet"):
+        raise ValueError(f"Format '{out_fmt}' non pris en charge en pipeline (csv ou parquet)")
+    if compression and out_fmt != "csv":
+        raise ValueError("La compression ne s'applique qu'au CSV (Parquet est déjà compressé)")
+    t_start = time.perf_counter()
+    sample, auto = map_sample(open_source, filename, saved_mapping, options.get('template'))
+    mapping = auto if mapping is None else mapping
+    columns = source_columns(sample, mapping)
+    del sample
+
+    workers = max(1, workers)
+    pipe = _Pipeline(workers, queue_size)
+    reader, formatter, writer = _Stage("lecture"), _Stage("formatage", workers), _Stage("écriture")
+    profiles = {}
+    totals = {'stats': {'total_rows': 0, 'valid_rows': 0, 'corrected_fields': 0}, 'errors': [], 'warnings': []}
+
+    def _read():
+        with open_source() as f:
+            blocks, offset = iter_table(f, filename, chunk_rows, columns), 0
+            while True:
+                t0 = time.perf_counter()
+                chunk = next(blocks, None)
+                if chunk is None:
+                    break
+                if offset == 0:
+                    # Profil jour/mois commun à tous les blocs, établi avant le premier formatage
+                    profiles.update(date_profiles(chunk, mapping, value_maps, user_type_map, options.get('template')))
+                reader.add(busy=time.perf_counter() - t0, rows=len(chunk))
+                waited = pipe.acquire()
+                waited += pipe.put(pipe.inbox, (offset, chunk))
+                reader.add(blocked=waited)
+                offset += len(chunk)
+        for _ in range(workers):
+            pipe.put(pipe.inbox, None)
+
+    def _format():
+        while True:
+            item, waited = pipe.get(pipe.inbox)
+            formatter.add(starved=waited)
+            if item is None:
+                pipe.put(pipe.outbox, None)
+                return
+            offset, chunk = item
+            t0 = time.perf_counter()
+            result = process(chunk, mapping, value_maps=value_maps, user_type_map=user_type_map,
+                             offset=offset, date_profiles=profiles, **options)
+            formatter.add(busy=time.perf_counter() - t0, rows=len(chunk))
+            formatter.add(blocked=pipe.put(pipe.outbox, (offset, result)))
+
+    def _write():
+        pending, finished = {}, 0
+        stem = os.path.splitext(strip_compression_suffix(os.path.basename(filename)))[0] or "fichier"
+        with _Sink(target, out_fmt, compression, f"{stem}_formate.csv") as sink:
+            expected = 0
+            while finished < workers:
+                item, waited = pipe.get(pipe.outbox)
+                writer.add(starved=waited)
+                if item is None:
+                    finished += 1
+                    continue
+                pending[item[0]] = item[1]
+                # Écriture dans l'ordre du fichier : un bloc en avance attend les précédents
+                while expected in pending:
+                    out_df, stats, errors, warnings = pending.pop(expected)
+                    t0 = time.perf_counter()
+                    sink.write(out_df, first=expected == 0)
+                    for k in totals['stats']:
+                        totals['stats'][k] += stats[k]
+                    totals['errors'].extend(errors)
+                    totals['warnings'].extend(warnings)
+                    writer.add(busy=time.perf_counter() - t0, rows=len(out_df))
+                    expected += stats['total_rows']
+                    pipe.window.release()
+            if pending:
+                raise RuntimeError(f"Pipeline : {len(pending)} bloc(s) non écrits (bloc manquant à la ligne {expected})")
+            if writer.blocks == 0:   # source sans aucun bloc : en-tête seul
+                sink.write(pd.DataFrame(columns=template_plan(options.get('template'))['names']), first=True)
+
+    threads = [pipe.run(_read)] + [pipe.run(_format) for _ in range(workers)] + [pipe.run(_write)]
+    for thread in threads:
+        thread.join()
+    if pipe.error is not None:
+        raise pipe.error
+    wall = time.perf_counter() - t_start
+    metrics = [stage.summary(wall) for stage in (reader, formatter, writer)]
+    return {**totals, 'mapping': mapping, 'metrics': metrics, 'seconds': round(wall, 2),
+            'bottleneck': max(metrics, key=lambda m: m['Utilisation'])['Étage']}
+
+class _Sink:
+    """Écriture des blocs formatés : CSV (compressé ou non) ou Parquet (toutes colonnes en texte)"""
+
+    def __init__(self, target, out_fmt: str, compression: str | None, member: str):
+        self.target, self.out_fmt, self.compression, self.member = target, out_fmt, compression, member
+
+    def __enter__(self):
+        if self.out_fmt == "csv":
+            self._context = open_output(self.target, self.compression, self.member)
+            self._out = self._context.__enter__()
+        else:
+            self._context, self._out = None, None
+        return self
+
+    def write(self, out_df: pd.DataFrame, first: bool) -> None:
+        if self.out_fmt == "csv":
+            self._out.write(csv_chunk(out_df, first))
+            return
+        import pyarrow as pa, pyarrow.parquet as pq
+        # Colonnes catégorielles ramenées au texte : un seul schéma pour tous les blocs
+        schema = pa.schema([(str(c), pa.string()) for c in out_df.columns])
+        table = pa.Table.from_pandas(out_df, preserve_index=False).cast(schema)
+        if self._out is None:
+            self._out = pq.ParquetWriter(self.target, schema, compression='zstd')
+        self._out.write_table(table)
+
+    def __exit__(self, *exc):
+        if self._context is not None:
+            return self._context.__exit__(*exc)
+        if self._out is not None:
+            self._out.close()
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Formatage d'un fichier en pipeline (lecture / formatage / écriture)")
+    parser.add_argument("source")
+    parser.add_argument("sortie", help="fichier .csv, .csv.gz, .csv.zst, .zip ou .parquet")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=PIPELINE_CHUNK_ROWS)
+    parser.add_argument("--template", default=None)
+    args = parser.parse_args()
+    lower = args.sortie.lower()
+    fmt = "parquet" if lower.endswith((".parquet", ".pq")) else "csv"
+    comp = next((c for c, suffix in (("gzip", ".gz"), ("zstd", ".zst"), ("zip", ".zip")) if lower.endswith(suffix)), None)
+    res = run_pipeline(lambda: open(args.source, 'rb'), args.source, args.sortie, fmt, comp,
+                       workers=args.workers, chunk_rows=args.chunk_rows, template=args.template)
+    print(f"{res['stats']['total_rows']} lignes en {res['seconds']} s, {len(res['errors'])} erreurs, "
+          f"{len(res['warnings'])} avertissements → {args.sortie}")
+    print(pd.DataFrame(res['metrics']).to_string(index=False))
+    print(f"Goulot : {res['bottleneck']}")
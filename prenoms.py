@@ -0,0 +1,143 @@
+# prenoms.py
+"""
+Statistiques de prénoms (effectifs féminins / masculins) pour la déduction
+de la civilité.
+
+Le fichier `data/prenoms.npy` est un tableau structuré trié sur le prénom
+normalisé (minuscules, sans accents, séparateurs → '-') : il est ouvert en
+mémoire partagée (`np.load(mmap_mode='r')`), donc chargé en quelques
+millisecondes et partagé par tous les workers via le cache système. Une
+colonne entière est résolue en une recherche dichotomique vectorisée.
+
+Le fichier livré est construit depuis le dictionnaire de gender_guesser
+(fréquences France, à défaut celles des autres pays, avec un poids réduit).
+Pour des effectifs réels, reconstruire depuis le fichier national des
+prénoms de l'INSEE (`nat<année>.csv`) :
+
+    python prenoms.py insee nat2022.csv
+
+La variable d'environnement IMPORT_PRENOMS permet de pointer un autre fichier.
+"""
+from __future__ import annotations
+import os, re, sys, unicodedata
+from collections import defaultdict
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from referentiels import DATA_DIR, _file_version
+
+NAMES_FILE = os.environ.get("IMPORT_PRENOMS", os.path.join(DATA_DIR, "prenoms.npy"))
+NAME_BYTES = 20
+NAMES_DTYPE = np.dtype([('name', f'S{NAME_BYTES}'), ('female', '<f4'), ('male', '<f4')])
+
+def fold_name(value) -> str:
+    """Forme de recherche : minuscules ASCII, espaces et tirets → '-'"""
+    s = unicodedata.normalize("NFD", str(value or "").strip().lower())
+    s = "".join(c for c in s if unicodedata.category(c) != "Mn")
+    return re.sub(r"[^a-z]+", "-", s).strip("-")
+
+@lru_cache(maxsize=4)
+def _load_table(version: tuple) -> np.ndarray:
+    return np.load(version[0], mmap_mode='r')
+
+def name_table(path: str | None = None) -> np.ndarray | None:
+    """Table des prénoms (mémoire partagée), rechargée si le fichier change ; None si absente"""
+    try:
+        return _load_table(_file_version(path or NAMES_FILE))
+    except (OSError, ValueError):
+        return None
+
+def lookup(names, table: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Effectifs (féminin, masculin) de prénoms déjà normalisés par `fold_name`,
+    0 pour les prénoms absents (ou trop longs pour la table).
+    """
+    table = name_table() if table is None else table
+    names = list(names)
+    female = np.zeros(len(names), dtype=np.float32)
+    male = np.zeros(len(names), dtype=np.float32)
+    if table is None or not len(table) or not names:
+        return female, male
+    raw = np.array([n.encode('ascii') for n in names], dtype=object)
+    fits = np.array([0 < len(n) <= NAME_BYTES for n in raw], dtype=bool)
+    keys = raw[fits].astype(NAMES_DTYPE['name'])
+    column = table['name']
+    pos = np.minimum(np.searchsorted(column, keys), len(table) - 1)
+    found = column[pos] == keys
+    rows = np.flatnonzero(fits)[found]
+    female[rows] = table['female'][pos[found]]
+    male[rows] = table['male'][pos[found]]
+    return female, male
+
+# ---------- Construction du fichier ----------
+def write_table(counts: dict, path: str = NAMES_FILE) -> int:
+    """Écrit {prénom normalisé: [féminin, masculin]} trié ; renvoie le nombre de prénoms"""
+    items = [(n.encode('ascii'), f, m) for n, (f, m) in counts.items()
+             if n and len(n) <= NAME_BYTES and f + m > 0]
+    table = np.array(items, dtype=NAMES_DTYPE)
+    table.sort(order='name')
+    np.save(path, table, allow_pickle=False)
+    return len(table)
+
+def counts_from_insee(path: str) -> dict:
+    """Effectifs du fichier national INSEE (sexe 1 = masculin, 2 = féminin), toutes années"""
+    df = pd.read_csv(path, sep=';', dtype=str, encoding='utf-8', encoding_errors='replace')
+    name_col = next(c for c in ('preusuel', 'prenom', 'prénom') if c in df.columns)
+    count_col = next(c for c in ('nombre', 'valeur', 'effectif') if c in df.columns)
+    df = df[~df[name_col].fillna("_").str.startswith("_")]   # _PRENOMS_RARES
+    df['nom'] = [fold_name(n) for n in df[name_col]]
+    df['n'] = pd.to_numeric(df[count_col], errors='coerce').fillna(0)
+    totals = df.groupby(['nom', 'sexe'])['n'].sum().unstack(fill_value=0)
+    female = totals.get('2', pd.Series(0, index=totals.index))
+    male = totals.get('1', pd.Series(0, index=totals.index))
+    return {n: [float(f), float(m)] for n, f, m in zip(totals.index, female, male)}
+
+# Part féminine / masculine des codes de genre du dictionnaire gender_guesser
+NAM_DICT_SHARES = {"F": (1.0, 0.0), "1F": (0.9, 0.1), "?F": (0.75, 0.25), "?": (0.5, 0.5),
+                   "?M": (0.25, 0.75), "1M": (0.1, 0.9), "M": (0.0, 1.0)}
+NAM_DICT_FRANCE = 7            # rang de la France parmi les colonnes de fréquences
+NAM_DICT_TOP_COUNT = 1_600_000  # effectif du cran 10 (≈ 2 % des naissances sur un siècle en France)
+NAM_DICT_ABROAD_PENALTY = 3     # crans retirés à une fréquence mesurée hors de France
+
+def counts_from_nam_dict(path: str | None = None) -> dict:
+    """
+    Effectifs approchés depuis nam_dict.txt (gender_guesser). La fréquence y
+    est un cran hexadécimal logarithmique (chaque cran double l'effectif,
+    le cran 10 vaut environ 2 % de la population) : elle est convertie en
+    naissances équivalentes, France en priorité, sinon meilleure fréquence
+    des autres pays avec un poids réduit.
+    """
+    if path is None:
+        import gender_guesser
+        path = os.path.join(os.path.dirname(gender_guesser.__file__), "data", "nam_dict.txt")
+    counts = defaultdict(lambda: [0.0, 0.0])
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in "#=":
+                continue
+            parts = line.split()
+            shares = NAM_DICT_SHARES.get(parts[0])
+            if shares is None:
+                continue
+            freqs = line[30:-1]
+            france = freqs[NAM_DICT_FRANCE:NAM_DICT_FRANCE+1].strip()
+            if france:
+                level = int(france, 16)
+            else:
+                abroad = [int(c, 16) for c in freqs if c.strip()]
+                level = max(abroad, default=1) - NAM_DICT_ABROAD_PENALTY
+            weight = NAM_DICT_TOP_COUNT * 2.0 ** (level - 10)
+            variants = {parts[1].replace('+', r) for r in ('', '-')} if '+' in parts[1] else {parts[1]}
+            for name in {fold_name(v) for v in variants}:
+                counts[name][0] += weight * shares[0]
+                counts[name][1] += weight * shares[1]
+    return dict(counts)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("insee", "nam_dict"):
+        sys.exit("usage: python prenoms.py insee <nat.csv> [sortie.npy] | nam_dict [nam_dict.txt] [sortie.npy]")
+    source = sys.argv[2] if len(sys.argv) > 2 else None
+    output = sys.argv[3] if len(sys.argv) > 3 else NAMES_FILE
+    counts = counts_from_insee(source) if sys.argv[1] == "insee" else counts_from_nam_dict(source)
+    print(f"{write_table(counts, output)} prénoms → {output}")
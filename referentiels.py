@@ -0,0 +1,232 @@
+# referentiels.py
+"""
+Référentiels locaux utilisés pour valider les données importées.
+
+Codes postaux : fichier au format La Poste (base Hexasmal, colonnes
+`Code_postal` et `Nom_de_la_commune`, séparateur `;`). Le fichier livré dans
+`data/` ne couvre que les préfectures et les grandes villes ; pointer la
+variable d'environnement IMPORT_CP_REFERENTIAL vers la base complète pour
+une validation exhaustive. Les codes absents du référentiel ne sont jamais
+signalés comme discordants.
+
+Diplômes : codes étape (et modes de formation proposés) de l'établissement,
+en CSV ou Parquet, désignés par IMPORT_DIPLOMES_REFERENTIAL (par défaut
+`data/diplomes.csv`, non livré).
+"""
+from __future__ import annotations
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from fuzzy import MEMO_SIZE, edit_distance
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+POSTAL_REFERENTIAL = os.environ.get("IMPORT_CP_REFERENTIAL", os.path.join(DATA_DIR, "codes_postaux.csv"))
+
+def fold_text(values: pd.Series) -> pd.Series:
+    """Forme de comparaison : majuscules sans accents, ponctuation → espaces, ST → SAINT"""
+    # Calcul sur les valeurs distinctes seulement, puis redistribution
+    codes, uniques = pd.factorize(values.astype(str))
+    folded = _fold_unique(pd.Series(uniques, dtype=object))
+    return pd.Series(folded.to_numpy()[codes], index=values.index, dtype=object)
+
+def _fold_unique(s: pd.Series) -> pd.Series:
+    s = s.str.normalize('NFD').str.encode('ascii', 'ignore').str.decode('ascii').str.upper()
+    s = s.str.replace(r"[-'’.,/]", " ", regex=True)
+    s = s.str.replace(r"\bCEDEX\b.*$", "", regex=True)                 # PARIS CEDEX 08
+    s = s.str.replace(r"\s+\d+\s*(?:E|EME|ER)?\s*$", "", regex=True)   # LYON 3EME
+    s = s.str.replace(r"\bSTE\b", "SAINTE", regex=True).str.replace(r"\bST\b", "SAINT", regex=True)
+    return s.str.replace(r"\s+", " ", regex=True).str.strip()
+
+def _file_version(path: str) -> tuple:
+    st = os.stat(path)
+    return (path, st.st_mtime_ns, st.st_size)
+
+@lru_cache(maxsize=4)
+def _load_postal_index(version: tuple) -> dict:
+    path = version[0]
+    ref = pd.read_csv(path, sep=';', dtype=str, usecols=['Code_postal', 'Nom_de_la_commune'],
+                      encoding='utf-8', encoding_errors='replace')
+    ref = ref.dropna()
+    ref['Code_postal'] = ref['Code_postal'].str.strip().str.zfill(5)
+    ref['ville_norm'] = fold_text(ref['Nom_de_la_commune'])
+    pairs = ref.drop_duplicates(['Code_postal', 'ville_norm'])
+    return {
+        # (code, ville normalisée) connus : jointure vectorisée
+        'pairs': pd.MultiIndex.from_frame(pairs[['Code_postal', 'ville_norm']]),
+        # code → libellé(s) canonique(s), pour les suggestions
+        'cities': pairs.groupby('Code_postal')['Nom_de_la_commune'].agg(' / '.join),
+        'single': pairs.groupby('Code_postal').size().eq(1),
+    }
+
+def postal_index(path: str | None = None) -> dict:
+    """Index code postal → communes, rechargé seulement si le fichier change"""
+    return _load_postal_index(_file_version(path or POSTAL_REFERENTIAL))
+
+def normalize_postal_codes(codes: pd.Series) -> pd.Series:
+    """Rétablit les zéros perdus (1000 → 01000) et retire les décimales d'une lecture numérique"""
+    s = codes.astype(object).where(codes.notna(), "").astype(str).str.strip()
+    s = s.str.replace(r"\.0$", "", regex=True).str.replace(r"\s+", "", regex=True)
+    return s.where(~s.str.fullmatch(r"\d{4}"), s.str.zfill(5))
+
+def check_postal_pairs(codes: pd.Series, cities: pd.Series | None, index: dict | None = None) -> pd.DataFrame:
+    """
+    Valide un couple de colonnes code postal / ville en une jointure vectorisée.
+
+    Returns:
+        DataFrame aligné sur `codes` : code (complété), ville (complétée si le
+        code ne désigne qu'une commune), statut ('', 'invalide', 'discordant'),
+        attendu (commune(s) du référentiel pour ce code)
+    """
+    index = index or postal_index()
+    code = normalize_postal_codes(codes)
+    if cities is None:
+        city = pd.Series("", index=codes.index, dtype=object)
+    else:
+        city = cities.astype(object).where(cities.notna(), "").astype(str).str.strip()
+    known = code.isin(index['cities'].index)
+    expected = code.map(index['cities']).fillna("")
+    agrees = pd.MultiIndex.from_arrays([code, fold_text(city)]).isin(index['pairs'])
+
+    statut = pd.Series("", index=codes.index, dtype=object)
+    statut[(code != "") & ~code.str.fullmatch(r"\d{5}")] = "invalide"
+    statut[(statut == "") & known & (city != "") & ~agrees] = "discordant"
+
+    # Ville absente mais code sans ambiguïté : on complète
+    fill = (city == "") & known & code.map(index['single']).fillna(False).astype(bool)
+    city = city.where(~fill, expected)
+    return pd.DataFrame({'code': code, 'ville': city, 'statut': statut, 'attendu': expected})
+
+# ---------- Référentiel des diplômes (codes étape) ----------
+# Fichier CSV (séparateur `;`) ou Parquet : une ligne par code étape, avec
+# son libellé et, si la colonne existe, un mode de formation proposé (une
+# ligne par couple code / mode). Sans fichier, les colonnes diplôme ne sont
+# pas vérifiées.
+DIPLOMA_REFERENTIAL = os.environ.get("IMPORT_DIPLOMES_REFERENTIAL", os.path.join(DATA_DIR, "diplomes.csv"))
+DIPLOMA_FIELDS = {
+    'code': ('code_etape', 'code etape', 'code', 'reference'),
+    'libelle': ('libelle', 'libelle_etape', 'intitule', 'label'),
+    'mode': ('mode_formation', 'mode de formation', 'mode'),
+}
+SUGGEST_SCAN = 200   # codes voisins (même préfixe) comparés au code inconnu
+
+def normalize_diploma_codes(codes: pd.Series) -> pd.Series:
+    """Forme de comparaison des codes : majuscules, sans espaces"""
+    s = codes.astype(object).where(codes.notna(), "").astype(str)
+    return s.str.upper().str.replace(r"\s+", "", regex=True)
+
+def _fold_header(name: str) -> str:
+    return _fold_unique(pd.Series([str(name)], dtype=object)).iloc[0].lower()
+
+@lru_cache(maxsize=4)
+def _load_diploma_index(version: tuple) -> dict:
+    path = version[0]
+    if path.lower().endswith(".parquet"):
+        ref = pd.read_parquet(path)
+    else:
+        ref = pd.read_csv(path, sep=';', dtype=str, encoding='utf-8', encoding_errors='replace')
+    headers = {_fold_header(c): c for c in ref.columns}
+    found = {field: next((headers[n] for n in names if n in headers), None) for field, names in DIPLOMA_FIELDS.items()}
+    if found['code'] is None:
+        raise ValueError(f"Référentiel diplômes {path} : colonne code absente ({', '.join(DIPLOMA_FIELDS['code'])})")
+    ref = ref.rename(columns={c: field for field, c in found.items() if c is not None})
+    ref['code'] = normalize_diploma_codes(ref['code'])
+    ref = ref[ref['code'] != ""]
+    labels = ref.drop_duplicates('code').set_index('code')
+    codes = np.sort(labels.index.to_numpy(dtype=object))
+    index = {
+        # Appartenance : table de hachage (construite au premier appel) ; suggestions : tableau trié
+        'codes': pd.Index(codes, dtype=object),
+        'sorted': codes,
+        'labels': labels['libelle'].fillna("").astype(str) if 'libelle' in labels else pd.Series("", index=labels.index),
+        'modes': None, 'pairs': None,
+        'memo': {},
+    }
+    if 'mode' in ref:
+        modes = ref.dropna(subset=['mode'])
+        modes = modes.assign(mode=modes['mode'].astype(str).str.strip(), folded=fold_text(modes['mode'].astype(str)))
+        modes = modes[modes['folded'] != ""]
+        # Forme normalisée → libellé de référence du mode
+        index['modes'] = modes.drop_duplicates('folded').set_index('folded')['mode']
+        index['pairs'] = pd.MultiIndex.from_frame(modes[['code', 'folded']].drop_duplicates())
+    return index
+
+def diploma_index(path: str | None = None) -> dict | None:
+    """Index des codes étape, rechargé seulement si le fichier change ; None sans référentiel"""
+    try:
+        return _load_diploma_index(_file_version(path or DIPLOMA_REFERENTIAL))
+    except FileNotFoundError:
+        return None
+
+def suggest_diploma_codes(code: str, index: dict, limit: int = 3) -> list[str]:
+    """
+    Codes les plus proches d'un code inconnu : plus long préfixe commun
+    (recherche dichotomique dans les codes triés), puis distance d'édition
+    parmi les voisins de même préfixe.
+    """
+    key = (code, limit)
+    if key in index['memo']:
+        return index['memo'][key]
+    codes = index['sorted']
+    for n in range(len(code), 0, -1):
+        lo, hi = np.searchsorted(codes, [code[:n], code[:n] + "\uffff"])
+        if hi > lo:
+            break
+    else:
+        lo = hi = 0
+    if hi - lo > SUGGEST_SCAN:
+        # Préfixe très partagé : voisins immédiats du code dans l'ordre trié
+        at = int(np.searchsorted(codes, code))
+        lo, hi = max(lo, at - SUGGEST_SCAN // 2), min(hi, at + SUGGEST_SCAN // 2)
+    candidates = [str(c) for c in codes[lo:hi]]
+    limit_edits = max(2, len(code) // 3)   # au-delà, candidats départagés par l'ordre des codes
+    ranked = sorted(candidates, key=lambda c: (edit_distance(code, c, limit_edits), c))[:limit]
+    if len(index['memo']) >= MEMO_SIZE:
+        index['memo'].clear()
+    index['memo'][key] = ranked
+    return ranked
+
+def check_diploma_codes(codes: pd.Series, index: dict | None = None) -> pd.DataFrame:
+    """
+    Valide une colonne de codes étape en un passage vectorisé (appartenance à
+    l'index), suggestions calculées une fois par code inconnu distinct.
+
+    Returns:
+        DataFrame aligné sur `codes` : code (normalisé s'il est connu),
+        statut ('', 'inconnu'), libelle, suggestions (« CODE (libellé) », ...)
+    """
+    index = index or diploma_index()
+    raw = codes.astype(object).where(codes.notna(), "").astype(str).str.strip()
+    code = normalize_diploma_codes(raw)
+    known = index['codes'].get_indexer(code) >= 0
+    unknown = (code != "").to_numpy() & ~known
+    suggestions = pd.Series("", index=codes.index, dtype=object)
+    if unknown.any():
+        labels = index['labels']
+        found = {}
+        for c in pd.unique(code[unknown]):
+            found[c] = ", ".join(f"{s} ({labels[s]})" if labels[s] else s for s in suggest_diploma_codes(c, index))
+        suggestions[unknown] = code[unknown].map(found)
+    statut = pd.Series(np.where(unknown, "inconnu", ""), index=codes.index, dtype=object)
+    return pd.DataFrame({'code': code.where(known, raw), 'statut': statut,
+                         'libelle': code.map(index['labels']).fillna(""), 'suggestions': suggestions})
+
+def check_training_modes(modes: pd.Series, codes: pd.Series | None, index: dict | None = None) -> pd.DataFrame:
+    """
+    Valide une colonne de modes de formation contre les modes du référentiel
+    et, si le code étape est connu, contre les modes proposés pour ce code.
+
+    Returns:
+        DataFrame aligné sur `modes` : mode (libellé de référence s'il est
+        reconnu), statut ('', 'inconnu', 'discordant'), code
+    """
+    index = index or diploma_index()
+    raw = modes.astype(object).where(modes.notna(), "").astype(str).str.strip()
+    code = normalize_diploma_codes(codes) if codes is not None else pd.Series("", index=modes.index, dtype=object)
+    folded = fold_text(raw)
+    known = folded.isin(index['modes'].index)
+    statut = pd.Series("", index=modes.index, dtype=object)
+    statut[(raw != "") & ~known] = "inconnu"
+    offered = pd.MultiIndex.from_arrays([code, folded]).isin(index['pairs'])
+    statut[known & (index['codes'].get_indexer(code) >= 0) & ~offered] = "discordant"
+    return pd.DataFrame({'mode': raw.where(~known, folded.map(index['modes'])), 'statut': statut, 'code': code})
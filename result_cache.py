@@ -0,0 +1,155 @@
+# result_cache.py
+"""
+Cache disque des résultats de process(), adressé par contenu.
+
+La clé est un hash du fichier source, du mapping, des tables de traduction,
+de toutes les options de process(), du fichier du gabarit de sortie, des
+référentiels (codes postaux, diplômes, prénoms, index SIRENE) et du code des
+modules de formatage. Chaque entrée est un répertoire (résultat + journal en
+Parquet, stats en JSON) publié par un renommage atomique : plusieurs
+sessions peuvent lire et écrire en même temps. Des fichiers annexes (classeur
+de revue) peuvent s'y ajouter ensuite (`put_file`).
+Éviction LRU (date de dernier accès) au-delà d'un budget disque.
+"""
+from __future__ import annotations
+import hashlib, json, os, shutil, tempfile, time, uuid
+from functools import lru_cache
+import pandas as pd
+from schema import template_version
+
+CACHE_DIR = os.environ.get("IMPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "import_utilisateur_cache"))
+CACHE_MAX_BYTES = int(os.environ.get("IMPORT_CACHE_MAX_MB", "512")) * 1024 * 1024
+STALE_TMP_SECONDS = 3600
+
+# Modules dont le code décide du résultat de process()
+CODE_MODULES = ("core", "referentiels", "fuzzy", "prenoms", "sirene", "schema")
+
+@lru_cache(maxsize=1)
+def _code_version() -> str:
+    """Hash des modules de formatage : un changement des règles invalide le cache"""
+    import importlib
+    h = hashlib.sha256()
+    for name in CODE_MODULES:
+        with open(importlib.import_module(name).__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def cache_key(file_hash: str, mapping: dict, value_maps: dict | None, options: dict) -> str:
+    from core import referential_versions
+    payload = json.dumps(
+        {'file': file_hash, 'mapping': mapping, 'value_maps': value_maps or {},
+         'options': options, 'code': _code_version(),
+         # Fichier du gabarit (chemin, date, taille) : le modifier invalide le cache
+         'template': template_version(options.get('template')),
+         # Référentiels (chemin, date, taille) : en remplacer un invalide le cache
+         'referentials': referential_versions()},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _entry_size(path: str) -> int:
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+def _discard(path: str, cache_dir: str) -> None:
+    """Retire une entrée : renommage d'abord (invisible aux lecteurs), suppression ensuite"""
+    trash = os.path.join(cache_dir, f".trash-{uuid.uuid4().hex}")
+    try:
+        os.rename(path, trash)
+    except OSError:
+        return  # déjà retirée par une autre session
+    shutil.rmtree(trash, ignore_errors=True)
+
+def get(key: str, cache_dir: str = CACHE_DIR):
+    """Renvoie (df_out, stats, errors, warnings) ou None si absent/illisible"""
+    path = os.path.join(cache_dir, key)
+    try:
+        df_out = pd.read_parquet(os.path.join(path, "result.parquet"))
+        issues = pd.read_parquet(os.path.join(path, "issues.parquet"))
+        with open(os.path.join(path, "stats.json"), encoding='utf-8') as f:
+            stats = json.load(f)
+        os.utime(path)  # dernier accès, pour l'éviction LRU
+    except (OSError, ValueError):
+        return None
+    errors = issues.loc[issues['level'] == 'error', 'message'].tolist()
+    warnings = issues.loc[issues['level'] == 'warning', 'message'].tolist()
+    return df_out, stats, errors, warnings
+
+def put(key: str, result: tuple, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES) -> None:
+    """Enregistre un résultat de process() puis applique le budget disque"""
+    df_out, stats, errors, warnings = result
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = os.path.join(cache_dir, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+    try:
+        df_out.to_parquet(os.path.join(tmp, "result.parquet"), index=False, compression='zstd')
+        pd.DataFrame({
+            'level': ['error'] * len(errors) + ['warning'] * len(warnings),
+            'message': list(errors) + list(warnings),
+        }).to_parquet(os.path.join(tmp, "issues.parquet"), index=False, compression='zstd')
+        with open(os.path.join(tmp, "stats.json"), 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, default=str)
+        os.rename(tmp, os.path.join(cache_dir, key))
+    except OSError:
+        pass  # entrée déjà publiée par une autre session (ou disque plein)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    evict(cache_dir, max_bytes)
+
+def get_file(key: str, name: str, cache_dir: str = CACHE_DIR) -> bytes | None:
+    """Fichier annexe d'une entrée (ex. classeur de revue), None si absent"""
+    path = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(path, name), 'rb') as f:
+            data = f.read()
+        os.utime(path)
+    except OSError:
+        return None
+    return data
+
+def put_file(key: str, name: str, data: bytes, cache_dir: str = CACHE_DIR) -> None:
+    """Ajoute un fichier annexe à une entrée publiée (renommage atomique, ignoré si l'entrée a disparu)"""
+    path = os.path.join(cache_dir, key)
+    tmp = os.path.join(path, f".tmp-{uuid.uuid4().hex}")
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(path, name))
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def evict(cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES) -> None:
+    """Supprime les entrées les moins récemment utilisées jusqu'à respecter le budget"""
+    entries = []
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('.'):
+            # Restes d'une écriture interrompue
+            try:
+                if now - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+            continue
+        try:
+            entries.append((os.path.getmtime(path), _entry_size(path), path))
+        except OSError:
+            pass
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _discard(path, cache_dir)
+        total -= size
@@ -0,0 +1,86 @@
+# schema.py
+"""
+Gabarits de sortie déclarés en JSON (un fichier par gabarit dans `templates/`).
+
+    {"name": "import_utilisateur", "label": "...", "required_message": "Prénom/Nom manquant",
+     "columns": [{"name": "Prénom*", "format": "firstname", "required": true,
+                  "keywords": ["prénom", ...], "inputs": {...}}, ...]}
+
+Les colonnes sont listées dans l'ordre du fichier produit :
+- `format` : noyau de formatage (voir core.FORMATS), "text" par défaut ;
+- `required` : une ligne sans valeur dans ces colonnes est en erreur ;
+- `keywords` : mots-clés du mapping automatique, essayés dans l'ordre des colonnes ;
+- `inputs` : autres colonnes du gabarit lues par le noyau, par rôle
+  (prénom pour la civilité, ville pour le code postal…) ;
+- `fallback_columns` : noms exacts de colonnes source essayés en dernier
+  recours par le mapping automatique (`if_mapped` : seulement si cette
+  autre colonne du gabarit est mappée).
+
+Ajouter un gabarit = déposer un fichier JSON, sans changer le code. La
+variable d'environnement IMPORT_TEMPLATES_DIR pointe un autre répertoire.
+"""
+from __future__ import annotations
+import json, os
+from functools import lru_cache
+from referentiels import _file_version
+
+TEMPLATES_DIR = os.environ.get("IMPORT_TEMPLATES_DIR",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+DEFAULT_TEMPLATE = "import_utilisateur"
+
+def template_names(directory: str | None = None) -> list[str]:
+    """Gabarits disponibles (noms de fichiers sans extension), gabarit par défaut en premier"""
+    names = sorted(os.path.splitext(f)[0] for f in os.listdir(directory or TEMPLATES_DIR) if f.endswith(".json"))
+    return sorted(names, key=lambda n: n != DEFAULT_TEMPLATE)
+
+def template_version(name: str | None = None, directory: str | None = None) -> tuple:
+    """(chemin, mtime, taille) du fichier d'un gabarit : clé de cache, change si le fichier change"""
+    name = name or DEFAULT_TEMPLATE
+    if os.path.basename(name) != name:
+        raise ValueError(f"Nom de gabarit invalide : {name!r}")
+    path = os.path.join(directory or TEMPLATES_DIR, f"{name}.json")
+    if not os.path.exists(path):
+        raise ValueError(f"Gabarit inconnu : {name!r} (disponibles : {', '.join(template_names(directory))})")
+    return _file_version(path)
+
+@lru_cache(maxsize=16)
+def load_template(version: tuple) -> dict:
+    """
+    Lit et vérifie un gabarit ; les colonnes référencées (inputs, if_mapped)
+    sont résolues en positions.
+
+    Returns:
+        dict: name, label, required_message, columns (liste de dicts complétés :
+        index, format, required, keywords, inputs {rôle: (positions,)}, fallback_columns)
+    """
+    with open(version[0], encoding='utf-8') as f:
+        raw = json.load(f)
+    name = raw.get('name') or os.path.splitext(os.path.basename(version[0]))[0]
+    columns = raw.get('columns') or []
+    if not columns:
+        raise ValueError(f"Gabarit {name!r} : aucune colonne")
+    positions = {}
+    for i, col in enumerate(columns):
+        if not col.get('name') or col['name'] in positions:
+            raise ValueError(f"Gabarit {name!r} : colonne {i} sans nom ou en double ({col.get('name')!r})")
+        positions[col['name']] = i
+
+    def resolve(ref, where: str) -> int:
+        if ref not in positions:
+            raise ValueError(f"Gabarit {name!r} : {where} référence une colonne inconnue ({ref!r})")
+        return positions[ref]
+
+    compiled = []
+    for i, col in enumerate(columns):
+        inputs = {role: tuple(resolve(r, col['name']) for r in (refs if isinstance(refs, list) else [refs]))
+                  for role, refs in (col.get('inputs') or {}).items()}
+        fallback = col.get('fallback_columns')
+        if fallback:
+            fallback = {'names': [n.lower() for n in fallback.get('names', [])],
+                        'if_mapped': fallback.get('if_mapped') and columns[resolve(fallback['if_mapped'], col['name'])]['name']}
+        compiled.append({'index': i, 'name': col['name'], 'format': col.get('format', 'text'),
+                         'required': bool(col.get('required')), 'keywords': list(col.get('keywords') or []),
+                         'inputs': inputs, 'fallback_columns': fallback})
+    return {'name': name, 'label': raw.get('label') or name,
+            'required_message': raw.get('required_message') or "Champs obligatoires manquants",
+            'columns': compiled}
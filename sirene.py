@@ -0,0 +1,202 @@
+# sirene.py
+"""
+Extrait SIRENE local (établissements) pour vérifier les SIRET et compléter
+les champs entreprise (nom, code postal, ville de l'adresse professionnelle).
+
+L'index est un répertoire de deux tableaux numpy triés sur le SIRET :
+`siret.npy` (clés uint64 contiguës) et `etablissements.npy` (nom, code
+postal, commune, état administratif). Ils sont ouverts en mémoire partagée
+(`np.load(mmap_mode='r')`) : l'ouverture est immédiate quelle que soit la
+taille de l'extrait (des dizaines de millions d'établissements), une
+colonne entière est résolue en une recherche dichotomique vectorisée, et
+seules les pages touchées sont lues depuis le disque.
+
+Construction depuis les fichiers stock de l'INSEE (CSV), par tranches et
+sans charger l'extrait en mémoire :
+
+    python sirene.py StockEtablissement_utf8.csv [StockUniteLegale_utf8.csv] [répertoire]
+
+Le fichier des unités légales, facultatif, fournit la dénomination de
+l'entreprise ; à défaut, le nom vient de l'enseigne ou de la dénomination
+usuelle de l'établissement. La variable d'environnement IMPORT_SIRENE
+désigne le répertoire de l'index (par défaut `data/sirene`, non livré).
+"""
+from __future__ import annotations
+import os, shutil, sys, tempfile
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from referentiels import DATA_DIR, _file_version
+
+SIRENE_DIR = os.environ.get("IMPORT_SIRENE", os.path.join(DATA_DIR, "sirene"))
+KEYS_FILE, RECORDS_FILE = "siret.npy", "etablissements.npy"
+NAME_BYTES, CITY_BYTES = 60, 40
+RECORDS_DTYPE = np.dtype([('name', f'S{NAME_BYTES}'), ('postal', 'S5'), ('city', f'S{CITY_BYTES}'), ('active', 'u1')])
+UNITS_DTYPE = np.dtype([('siren', '<u4'), ('name', f'S{NAME_BYTES}')])
+BUILD_CHUNK_ROWS = 1_000_000   # lignes CSV lues (puis écrites) à la fois
+LOOKUP_COLUMNS = ['found', 'active', 'name', 'postal', 'city']
+
+@lru_cache(maxsize=4)
+def _load_index(version: tuple) -> tuple[np.ndarray, np.ndarray]:
+    directory = os.path.dirname(version[0])
+    keys = np.load(version[0], mmap_mode='r')
+    records = np.load(os.path.join(directory, RECORDS_FILE), mmap_mode='r')
+    if len(keys) != len(records):
+        raise ValueError(f"Index SIRENE incohérent dans {directory}")
+    return keys, records
+
+def sirene_index(directory: str | None = None) -> tuple[np.ndarray, np.ndarray] | None:
+    """(clés SIRET, fiches) en mémoire partagée, rechargés si l'index change ; None si absent"""
+    try:
+        return _load_index(_file_version(os.path.join(directory or SIRENE_DIR, KEYS_FILE)))
+    except (OSError, ValueError):
+        return None
+
+def _decode(values: np.ndarray) -> list[str]:
+    # Champs tronqués à l'octet près : un caractère UTF-8 coupé est ignoré
+    return [v.decode('utf-8', 'ignore') for v in values]
+
+def lookup(sirets, index: tuple | None = None) -> pd.DataFrame | None:
+    """
+    Fiches SIRENE d'une colonne de SIRET (chaînes, séparateurs tolérés).
+
+    Returns:
+        DataFrame positionnel (found, active, name, postal, city ; chaînes
+        vides si absent), None sans index
+    """
+    index = sirene_index() if index is None else index
+    if index is None:
+        return None
+    keys, records = index
+    digits = pd.Series(list(sirets), dtype=object).astype(str).str.replace(r"\D", "", regex=True)
+    valid = digits.str.fullmatch(r"\d{14}").to_numpy(dtype=bool)
+    n = len(digits)
+    out = {'found': np.zeros(n, dtype=bool), 'active': np.zeros(n, dtype=bool)}
+    for field in ('name', 'postal', 'city'):
+        out[field] = np.full(n, "", dtype=object)
+    if valid.any() and len(keys):
+        wanted = digits[valid].astype('uint64').to_numpy()
+        # Clés triées d'abord : la recherche dichotomique parcourt le fichier dans l'ordre
+        order = np.argsort(wanted, kind='stable')
+        pos = np.empty(len(wanted), dtype=np.int64)
+        pos[order] = np.minimum(np.searchsorted(keys, wanted[order]), len(keys) - 1)
+        hit = keys[pos] == wanted
+        rows = np.flatnonzero(valid)[hit]
+        found = records[pos[hit]]
+        out['found'][rows] = True
+        out['active'][rows] = found['active'] == 1
+        for field in ('name', 'postal', 'city'):
+            out[field][rows] = _decode(found[field])
+    return pd.DataFrame(out, columns=LOOKUP_COLUMNS)
+
+# ---------- Construction de l'index ----------
+def _sorted_table(chunks, dtype: np.dtype, key: str, workdir: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Trie sur `key` des fiches produites par tranches : écriture brute non
+    triée sur disque puis tri des seules clés. La mémoire dépend du nombre
+    de fiches (clés) et non de leur taille.
+
+    Returns:
+        tuple: (clés triées sans doublon, positions des fiches correspondantes, fiches brutes)
+    """
+    raw_path = os.path.join(workdir, f"{key}.raw")
+    n = 0
+    with open(raw_path, 'wb') as f:
+        for chunk in chunks:
+            chunk.tofile(f)
+            n += len(chunk)
+    raw = np.memmap(raw_path, dtype=dtype, mode='r', shape=(n,)) if n else np.zeros(0, dtype=dtype)
+    order = np.argsort(raw[key], kind='stable')
+    keys = raw[key][order]
+    # Doublons : la première fiche l'emporte
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return keys[first], order[first], raw
+
+def _write_sorted(raw: np.ndarray, order: np.ndarray, path: str, fields: list[str], dtype: np.dtype) -> None:
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(len(order),))
+    # Recopie dans l'ordre des clés, par tranches
+    for start in range(0, len(order), BUILD_CHUNK_ROWS):
+        part = raw[order[start:start + BUILD_CHUNK_ROWS]]
+        for field in fields:
+            out[field][start:start + len(part)] = part[field]
+    out.flush()
+    del out
+
+def _encode(values: pd.Series, width: int) -> np.ndarray:
+    return np.array([v.encode('utf-8')[:width] for v in values.fillna("").astype(str).str.strip()],
+                    dtype=f'S{width}')
+
+def _read_chunks(path: str, columns: list[str]):
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in columns if c in header]
+    return pd.read_csv(path, dtype=str, usecols=usecols, chunksize=BUILD_CHUNK_ROWS,
+                       encoding='utf-8', encoding_errors='replace')
+
+def _unit_chunks(path: str):
+    for df in _read_chunks(path, ['siren', 'denominationUniteLegale', 'nomUniteLegale', 'prenom1UniteLegale']):
+        df = df[df['siren'].str.fullmatch(r"\d{9}", na=False)]
+        person = (df.get('prenom1UniteLegale', pd.Series("", index=df.index)).fillna("") + " "
+                  + df.get('nomUniteLegale', pd.Series("", index=df.index)).fillna("")).str.strip()
+        name = df.get('denominationUniteLegale', pd.Series(index=df.index, dtype=object)).fillna(person)
+        chunk = np.zeros(len(df), dtype=UNITS_DTYPE)
+        chunk['siren'] = df['siren'].astype('uint32').to_numpy()
+        chunk['name'] = _encode(name, NAME_BYTES)
+        yield chunk
+
+def _establishment_chunks(path: str, units: tuple | None):
+    full = np.dtype([('siret', '<u8')] + [(f, RECORDS_DTYPE[f]) for f in RECORDS_DTYPE.names])
+    for df in _read_chunks(path, ['siret', 'codePostalEtablissement', 'libelleCommuneEtablissement',
+                                  'etatAdministratifEtablissement', 'enseigne1Etablissement',
+                                  'denominationUsuelleEtablissement']):
+        df = df[df['siret'].str.fullmatch(r"\d{14}", na=False)]
+        empty = pd.Series(np.nan, index=df.index, dtype=object)
+        name = df.get('denominationUsuelleEtablissement', empty).fillna(df.get('enseigne1Etablissement', empty))
+        chunk = np.zeros(len(df), dtype=full)
+        chunk['siret'] = df['siret'].astype('uint64').to_numpy()
+        if units is not None:
+            # Dénomination de l'unité légale (SIREN = 9 premiers chiffres), prioritaire
+            unit_keys, unit_names = units
+            siren = (chunk['siret'] // 100_000).astype('uint32')
+            pos = np.minimum(np.searchsorted(unit_keys, siren), max(len(unit_keys) - 1, 0))
+            hit = (unit_keys[pos] == siren) if len(unit_keys) else np.zeros(len(df), dtype=bool)
+            chunk['name'] = _encode(name, NAME_BYTES)
+            chunk['name'][hit] = unit_names[pos[hit]]
+        else:
+            chunk['name'] = _encode(name, NAME_BYTES)
+        chunk['postal'] = _encode(df.get('codePostalEtablissement', empty), 5)
+        chunk['city'] = _encode(df.get('libelleCommuneEtablissement', empty), CITY_BYTES)
+        chunk['active'] = (df.get('etatAdministratifEtablissement', empty).fillna("A") == "A").to_numpy()
+        yield chunk
+
+def build_index(establishments: str, units: str | None = None, directory: str = SIRENE_DIR) -> int:
+    """Construit l'index trié depuis les fichiers stock ; renvoie le nombre d'établissements"""
+    os.makedirs(directory, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="sirene_", dir=directory)
+    try:
+        unit_table = None
+        if units:
+            unit_keys, order, raw = _sorted_table(_unit_chunks(units), UNITS_DTYPE, 'siren', workdir)
+            unit_path = os.path.join(workdir, "unites.npy")
+            _write_sorted(raw, order, unit_path, ['siren', 'name'], UNITS_DTYPE)
+            del raw
+            unit_table = np.load(unit_path, mmap_mode='r')
+            unit_table = (np.ascontiguousarray(unit_table['siren']), unit_table['name'])
+        full = np.dtype([('siret', '<u8')] + [(f, RECORDS_DTYPE[f]) for f in RECORDS_DTYPE.names])
+        keys, order, raw = _sorted_table(_establishment_chunks(establishments, unit_table), full, 'siret', workdir)
+        # Fiches d'abord, clés en dernier : l'index n'est visible (version) qu'une fois complet
+        _write_sorted(raw, order, os.path.join(workdir, RECORDS_FILE), list(RECORDS_DTYPE.names), RECORDS_DTYPE)
+        np.save(os.path.join(workdir, KEYS_FILE), np.ascontiguousarray(keys, dtype='<u8'))
+        del raw, unit_table
+        os.replace(os.path.join(workdir, RECORDS_FILE), os.path.join(directory, RECORDS_FILE))
+        os.replace(os.path.join(workdir, KEYS_FILE), os.path.join(directory, KEYS_FILE))
+        return len(keys)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python sirene.py StockEtablissement.csv [StockUniteLegale.csv] [répertoire]")
+    units = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] != "-" else None
+    directory = sys.argv[3] if len(sys.argv) > 3 else SIRENE_DIR
+    print(f"{build_index(sys.argv[1], units, directory)} établissements → {directory}")
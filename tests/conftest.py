@@ -0,0 +1,4 @@
+# Modules à plat à la racine du dépôt : importables depuis les tests
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
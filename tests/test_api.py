@@ -0,0 +1,114 @@
+import http.client, json, os, threading
+from urllib.parse import quote
+import pytest
+import api
+
+CSV = ("Prénom;Nom;Email;Type;Code postal;Ville\n"
+       + "".join(f"Marie;Dupont{k};marie{k}@exemple;1;69001;Marseille\n" for k in range(20))).encode('utf-8')
+
+@pytest.fixture
+def server(tmp_path):
+    service = api.ImportService(workers=1, work_dir=str(tmp_path))
+    httpd = api.make_server(service, "127.0.0.1", 0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield service, httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+def call(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        resp = conn.getresponse()
+        data = resp.read()
+        ctype = resp.getheader('Content-Type', '')
+        return resp.status, json.loads(data) if ctype.startswith('application/json') else data
+    finally:
+        conn.close()
+
+def wait_done(port, job_id):
+    for _ in range(300):
+        status, payload = call(port, "GET", f"/jobs/{job_id}")
+        if payload['state'] in ('done', 'failed'):
+            return payload
+        threading.Event().wait(0.05)
+    raise AssertionError(payload)
+
+def test_job_lifecycle(server):
+    _, port = server
+    status, analysis = call(port, "POST", "/analyze?filename=users.csv", CSV)
+    assert status == 200 and analysis['columns'][0] == 'Prénom'
+    mapping = quote(json.dumps(analysis['mapping']))
+    status, created = call(port, "POST", f"/jobs?filename=users.csv&format=csv&mapping={mapping}", CSV)
+    assert status == 202
+    job = created['job']
+    done = wait_done(port, job)
+    assert done['state'] == 'done' and done['stats']['total_rows'] == 20
+    status, result = call(port, "GET", f"/jobs/{job}/result")
+    assert status == 200 and result.decode('utf-8-sig').count("\n") == 21
+    status, issues = call(port, "GET", f"/jobs/{job}/issues")
+    total = issues['total']
+    assert status == 200 and total == len(issues['issues']) >= 20
+    status, page = call(port, "GET", f"/jobs/{job}/issues?offset=5&limit=3")
+    assert page['total'] == total and page['offset'] == 5 and page['issues'] == issues['issues'][5:8]
+    assert call(port, "DELETE", f"/jobs/{job}") == (200, {'job': job, 'deleted': True})
+    assert call(port, "GET", f"/jobs/{job}")[0] == 404
+
+def test_missing_length_is_rejected(server):
+    _, port = server
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.putrequest("POST", "/jobs?filename=users.csv")
+    conn.endheaders()
+    resp = conn.getresponse()
+    assert resp.status == 411
+    conn.close()
+
+def test_oversized_upload_is_rejected(server, monkeypatch):
+    _, port = server
+    monkeypatch.setattr(api, 'MAX_UPLOAD_BYTES', len(CSV) - 1)
+    assert call(port, "POST", "/jobs?filename=users.csv", CSV)[0] == 413
+    # Corps chunked : la limite est vérifiée au fil de la lecture
+    chunked = f"{len(CSV):x}\r\n".encode() + CSV + b"\r\n0\r\n\r\n"
+    assert call(port, "POST", "/jobs?filename=users.csv", chunked, {'Transfer-Encoding': 'chunked'})[0] == 413
+
+def test_unfinished_job_conflicts(server):
+    service, port = server
+    release = threading.Event()
+    blocker = service.scheduler.submit("autre", release.wait)   # occupe l'unique worker
+    try:
+        status, created = call(port, "POST", "/jobs?filename=users.csv", CSV)
+        job = created['job']
+        assert status == 202 and call(port, "GET", f"/jobs/{job}")[1]['state'] == 'queued'
+        assert call(port, "GET", f"/jobs/{job}/result")[0] == 409
+        assert call(port, "GET", f"/jobs/{job}/issues")[0] == 409
+        assert call(port, "DELETE", f"/jobs/{job}")[0] == 409
+    finally:
+        release.set()
+    assert wait_done(port, job)['state'] == 'done'
+    service.scheduler.forget(blocker)
+
+def test_unknown_job_and_route(server):
+    _, port = server
+    assert call(port, "GET", "/jobs/999")[0] == 404
+    assert call(port, "GET", "/jobs/999/result")[0] == 404
+    assert call(port, "DELETE", "/jobs/999")[0] == 404
+    assert call(port, "GET", "/inconnue")[0] == 404
+
+def test_ttl_counts_from_job_end(server):
+    service, port = server
+    service.ttl = 0.3
+    release = threading.Event()
+    blocker = service.scheduler.submit("autre", release.wait)   # le job attend en file plus que le ttl
+    job = call(port, "POST", "/jobs?filename=users.csv", CSV)[1]['job']
+    threading.Event().wait(0.5)
+    release.set()
+    assert wait_done(port, job)['state'] == 'done'
+    job_dir = service._jobs[job]['dir']
+    service.expire()
+    assert call(port, "GET", f"/jobs/{job}/result")[0] == 200
+    threading.Event().wait(0.5)
+    service.expire()
+    assert call(port, "GET", f"/jobs/{job}")[0] == 404
+    assert not os.path.exists(job_dir)
+    service.scheduler.forget(blocker)
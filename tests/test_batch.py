@@ -0,0 +1,71 @@
+import os, zipfile
+from io import BytesIO
+import pandas as pd
+import batch
+import core
+
+def users_csv(names: list[str]) -> bytes:
+    return ("Prénom;Nom;Email;Type\n" + "".join(f"{p};{p.upper()}NOM;{p.lower()}@exemple.fr;1\n" for p in names)
+            ).encode('utf-8')
+
+FILES = [
+    ("equipe/a.csv", users_csv(['Marie', 'Jean'])),
+    ("b.csv", users_csv(['Paul', 'Camille', 'Léa'])),
+    ("c.xlsx", b"pas un classeur"),                  # illisible : le lot continue
+    ("a.csv", users_csv(['Louise'])),                # même nom : sortie dédoublonnée
+]
+
+def expected(data: bytes) -> pd.DataFrame:
+    df, mapping, _ = batch.read_mapped(lambda: BytesIO(data), "f.csv")
+    return core.process(df, mapping)[0]
+
+def read_entry(zf: zipfile.ZipFile, name: str) -> pd.DataFrame:
+    return pd.read_csv(zf.open(name), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+
+def test_batch_archive_one_output_per_file():
+    progress = batch.new_progress([n for n, _ in FILES])
+    archive = batch.run_batch(FILES, {}, progress=progress, workers=3)
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            assert sorted(zf.namelist()) == sorted(['a_formate.csv', 'b_formate.csv', 'a_formate_2.csv',
+                                                    batch.REPORT_NAME])
+            for entry, (name, data) in zip(['a_formate.csv', 'b_formate.csv', None, 'a_formate_2.csv'], FILES):
+                if entry:
+                    assert read_entry(zf, entry).equals(expected(data).astype(str))
+            report = read_entry(zf, batch.REPORT_NAME)
+        assert report['État'].tolist() == ['terminé', 'terminé', 'échec', 'terminé']
+        assert [row['Lignes'] for row in progress] == [2, 3, None, 1]
+        assert progress[2]['Détail']
+    finally:
+        os.remove(archive)
+
+def test_batch_combined_output_keeps_input_order():
+    archive = batch.run_batch(FILES, {}, combined=True, workers=3)
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            raw = zf.read(batch.COMBINED_NAME).decode('utf-8')
+            combined = read_entry(zf, batch.COMBINED_NAME)
+    finally:
+        os.remove(archive)
+    assert raw.count("Prénom*") == 1                   # en-tête écrit une seule fois
+    parts = [expected(data) for name, data in FILES if name != "c.xlsx"]
+    assert combined.equals(pd.concat(parts, ignore_index=True).astype(str))
+    assert combined['Prénom*'].tolist() == ['Marie', 'Jean', 'Paul', 'Camille', 'Léa', 'Louise']
+
+def test_read_mapped_projects_to_useful_columns():
+    from test_core import users_frame, USERS_MAPPING
+    df = users_frame(60)
+    for k in range(20):
+        df[f'Extra {k}'] = [f'x{k}-{j}' for j in range(60)]
+    df['Sexe'] = ''                                    # en-tête de genre : gardée
+    df['Notes'] = ['monsieur'] + [''] * 59             # indice de civilité dans l'échantillon : gardée
+    data = df.to_csv(index=False).encode('utf-8')
+    projected, mapping, width = batch.read_mapped(lambda: BytesIO(data), "f.csv", USERS_MAPPING)
+    assert width == len(df.columns) and USERS_MAPPING.items() <= mapping.items()
+    assert list(projected.columns) == list(USERS_MAPPING.values()) + ['Sexe', 'Notes']   # ordre du fichier
+    full = core.read_table(BytesIO(data), "f.csv", engine="pyarrow")
+    out, stats, errors, warnings = core.process(projected, mapping)
+    assert out.equals(core.process(full, mapping)[0])
+    assert (stats, errors, warnings) == core.process(full, mapping)[1:]
+    # L'indice « monsieur » bloque la déduction 'Mme' pour Marie (ligne 2)
+    assert out['Civilité (M. / Mme)'].iloc[0] == '' and out['Civilité (M. / Mme)'].iloc[4] == 'Mme'
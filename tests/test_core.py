@@ -0,0 +1,462 @@
+import zipfile
+from io import BytesIO
+import pytest
+import pandas as pd
+import core, prenoms
+
+POSTAL_MAPPING = {
+    'Prénom*': 'Prénom',
+    "Nom de naissance / Nom d'état-civil*": 'Nom',
+    "Type d'utilisateur* (Diplômé [1] / Etudiant [5])": 'Type',
+    'Adresse personnelle - Code postal': 'Code postal',
+    'Adresse personnelle - Ville': 'Ville',
+}
+
+def postal_frame() -> pd.DataFrame:
+    return pd.DataFrame({'Prénom': ['Marie', 'Jean', 'Paul'], 'Nom': ['a', 'b', 'c'],
+                         'Code postal': ['75001', '1234', '69001'], 'Ville': ['Paris', 'Lyon', 'Marseille'],
+                         'Type': ['1', '5', '1']})
+
+def test_process_accepts_duplicate_index():
+    df = pd.concat([postal_frame(), postal_frame()])
+    assert not df.index.is_unique
+    out, stats, errors, warnings = core.process(df, POSTAL_MAPPING, review={})
+    ref = core.process(df.reset_index(drop=True), POSTAL_MAPPING)
+    assert out.equals(ref[0]) and stats == ref[1] and errors == ref[2] and warnings == ref[3]
+    postal = [w for w in warnings if 'Code postal' in w]
+    # 69001 / Marseille discordants : ligne 4 et sa copie ligne 7, comptées par position et non par index
+    assert [w.split(':')[0] for w in postal] == ["Ligne 4", "Ligne 7"]
+
+def test_strict_country_rejects_fuzzy_correction():
+    warnings = []
+    assert core.format_country('Belgiqeu', warnings, 2, strict=False) == 'BE'
+    assert warnings == ["Ligne 2: Pays 'Belgiqeu' interprété comme 'BE'"]
+    with pytest.raises(ValueError, match="suggestion : 'BE'"):
+        core.format_country('Belgiqeu', [], 2, strict=True)
+    assert core.format_country('Belgique', [], 2, strict=True) == 'BE'
+
+def users_frame(n: int = 30) -> pd.DataFrame:
+    return pd.DataFrame({
+        'Prénom': [['Marie', 'Jean', 'Camille', ''][k % 4] for k in range(n)],
+        'Nom': [f'nom{k}' for k in range(n)],
+        'Email': [f'a{k}@b.fr' if k % 3 else 'invalide' for k in range(n)],
+        'Date': [['01/02/1990', '13/05/1985', '1990-03-04', ''][k % 4] for k in range(n)],
+        'Type': [['1', '5', 'Etudiant', ''][k % 4] for k in range(n)],
+        'Code postal': [['75001', '69001', '1000'][k % 3] for k in range(n)],
+        'Ville': [['Paris', 'Marseille', 'Lyon'][k % 3] for k in range(n)],
+    })
+
+USERS_MAPPING = {
+    'Prénom*': 'Prénom',
+    "Nom de naissance / Nom d'état-civil*": 'Nom',
+    'Email personnel 1': 'Email',
+    'Date de naissance (jj/mm/aaaa)': 'Date',
+    "Type d'utilisateur* (Diplômé [1] / Etudiant [5])": 'Type',
+    'Adresse personnelle - Code postal': 'Code postal',
+    'Adresse personnelle - Ville': 'Ville',
+}
+
+@pytest.mark.parametrize('strict', [False, True])
+def test_validate_matches_process_across_blocks(monkeypatch, strict):
+    monkeypatch.setattr(core, 'DRY_RUN_BLOCK', 7)
+    df = users_frame()
+    _, stats, errors, warnings = core.process(df, USERS_MAPPING, strict=strict)
+    report = core.validate(df, USERS_MAPPING, strict=strict, sample_size=1000)
+    assert report['stats'] == stats and report['stopped'] is None and report['rows_checked'] == len(df)
+    assert sorted(report['samples']['Erreur']) == sorted(errors)
+    assert sorted(report['samples']['Avertissement']) == sorted(warnings)
+    expected = core.issues_frame(errors, warnings).groupby(['niveau', 'catégorie', 'champ']).size()
+    got = report['counts'].set_index(['niveau', 'catégorie', 'champ'])['messages']
+    assert got.sort_index().to_dict() == expected.sort_index().to_dict()
+
+class RecordingCache(core.ColumnCache):
+    """ColumnCache qui note les colonnes recalculées"""
+
+    def __init__(self):
+        super().__init__()
+        self.missed = []
+
+    def get(self, i, key):
+        res = super().get(i, key)
+        if res is None:
+            self.missed.append(i)
+        return res
+
+def test_column_cache_recomputes_only_affected_columns():
+    df, cache = users_frame(), RecordingCache()
+    core.process(df, USERS_MAPPING, column_cache=cache)
+    cache.missed.clear()
+    out, stats, errors, warnings = core.process(df, USERS_MAPPING, column_cache=cache, uppercase_names=False)
+    affected = [col['index'] for col in core.template_plan()['columns'] if 'uppercase_names' in col['options']]
+    assert affected and cache.missed == affected
+    fresh = core.process(df, USERS_MAPPING, uppercase_names=False)
+    assert out.equals(fresh[0]) and (stats, errors, warnings) == fresh[1:]
+    assert out["Nom de naissance / Nom d'état-civil*"].iloc[0] == 'nom0'
+
+@pytest.mark.parametrize('value', ['Nigeria', 'Nigéria', 'NIGERIA'])
+def test_two_edit_country_match_is_only_suggested(value):
+    # « Nigeria » est à deux erreurs de « Algeria » : un autre pays réel, jamais réécrit d'office
+    warnings = []
+    assert core.format_country(value, warnings, 2, strict=False) != 'DZ'
+    assert warnings == [f"Ligne 2: Pays non reconnu '{value}' (suggestion : 'DZ')"]
+    with pytest.raises(ValueError, match="suggestion : 'DZ'"):
+        core.format_country(value, [], 2, strict=True)
+
+@pytest.mark.parametrize('value, code', [('Frnace', 'FR'), ('Allemagen', 'DE'), ('Algérie', 'DZ')])
+def test_single_typo_country_is_corrected(value, code):
+    warnings = []
+    assert core.format_country(value, warnings, 2, strict=False) == code
+    assert warnings == [f"Ligne 2: Pays '{value}' interprété comme '{code}'"]
+
+def text_frame() -> pd.DataFrame:
+    return pd.DataFrame({'Code postal': ['01000', '75001', None], 'Ville': ['Bourg', 'Paris', 'Évian']})
+
+@pytest.mark.parametrize('compression, suffix', [('gzip', '.csv.gz'), ('zstd', '.csv.zst'), ('zip', '.zip')])
+def test_compressed_csv_round_trip(tmp_path, compression, suffix):
+    df, path = text_frame(), tmp_path / f"clients{suffix}"
+    core.write_csv(df, path, compression, member="clients.csv")
+    with open(path, 'rb') as f:
+        assert core.detect_compression(f) == compression and f.tell() == 0
+        stream, inner = core.open_compressed(f, path.name)
+        assert inner == "clients.csv"
+        head = stream.read(20)
+        stream.seek(5)                  # retour en arrière : décompression relancée
+        assert stream.read(15) == head[5:]
+        stream.seek(0)
+        assert stream.read(3) == b'\xef\xbb\xbf'
+    with open(path, 'rb') as f:
+        back = core.read_table(f, path.name, engine="pyarrow")
+    assert back.astype(object).where(back.notna(), None).equals(df.astype(object))
+
+def test_xlsx_is_not_taken_for_a_zip(tmp_path):
+    path = tmp_path / "clients.xlsx"
+    text_frame().to_excel(path, index=False)
+    with open(path, 'rb') as f:
+        assert f.read(4) == b'PK\x03\x04'
+        assert core.detect_compression(f) is None
+        stream, inner = core.open_compressed(f, path.name)
+        assert stream is f and inner == path.name
+        assert core.read_table(f, path.name)['Ville'].tolist() == ['Bourg', 'Paris', 'Évian']
+    # Dans une vraie archive zip, le classeur est extrait comme membre de données
+    archive = tmp_path / "envoi.zip"
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.write(path, "clients.xlsx")
+    with open(archive, 'rb') as f:
+        assert core.detect_compression(f) == 'zip'
+        assert core.read_table(f, archive.name)['Ville'].tolist() == ['Bourg', 'Paris', 'Évian']
+
+DATE_MAPPING = {'Prénom*': 'Prénom', "Nom de naissance / Nom d'état-civil*": 'Nom',
+                'Date de naissance (jj/mm/aaaa)': 'Date', "Type d'utilisateur* (Diplômé [1] / Etudiant [5])": 'Type'}
+
+def date_frame(dates: list) -> pd.DataFrame:
+    n = len(dates)
+    return pd.DataFrame({'Prénom': ['Marie'] * n, 'Nom': ['x'] * n, 'Date': dates, 'Type': ['1'] * n})
+
+def test_day_month_order_is_decided_by_the_whole_column():
+    # Une seule date MM/JJ, en fin de colonne, décide pour toutes les autres
+    dates = ['03/04/1990'] * 59 + ['12/25/1990']
+    profile = core.profile_date_column(dates)
+    assert (profile['label'], profile['dayfirst'], profile['confidence']) == ('MM/JJ/AAAA', False, 1.0)
+    assert len(profile['ambiguous_rows']) == 59
+    out, _, _, warnings = core.process(date_frame(dates), DATE_MAPPING)
+    assert out['Date de naissance (jj/mm/aaaa)'].iloc[[0, 59]].tolist() == ['04/03/1990', '25/12/1990']
+    assert not [w for w in warnings if 'ambiguës' in w]
+
+def test_day_month_without_evidence_defaults_to_day_first():
+    profile = core.profile_date_column(['03/04/1990', '05/06/1991', '07/07/1992', '', None])
+    assert (profile['label'], profile['dayfirst'], profile['confidence']) == ('JJ/MM/AAAA', True, 0.5)
+    assert list(profile['ambiguous_rows']) == [0, 1]       # 07/07 se lit pareil dans les deux ordres
+    assert profile['matched'] == profile['total'] == 3
+    assert core.profile_date_column(['1990-04-03', '1991-06-05'])['label'] == 'AAAA-MM-JJ'
+
+def test_conflicting_day_month_evidence_is_reported():
+    out, _, _, warnings = core.process(date_frame(['03/04/1990', '25/12/1990', '26/12/1990', '12/25/1990']),
+                                       DATE_MAPPING)
+    assert out['Date de naissance (jj/mm/aaaa)'].iloc[0] == '03/04/1990'     # majorité JJ/MM
+    assert "Colonne 'Date': 1 dates ambiguës (jour/mois) interprétées en JJ/MM/AAAA (confiance: 67%)" in warnings
+
+def test_format_date_column_mixed_formats():
+    values = pd.Series(['03/04/1990', '1990-04-03', '3.4.1990', '', None])
+    assert core.format_date_column(values).tolist() == ['03/04/1990', '03/04/1990', '03/04/1990', '', '']
+    month_first = core.profile_date_column(['12/25/1990'])
+    assert core.format_date_column(values, month_first).tolist()[:3] == ['04/03/1990', '03/04/1990', '04/03/1990']
+
+@pytest.fixture(scope='module')
+def users_issues():
+    df = users_frame()
+    _, _, errors, warnings = core.process(df, USERS_MAPPING)
+    return df, core.issues_frame(errors, warnings)
+
+@pytest.mark.parametrize('categories, row_min, row_max, page, page_size', [
+    (None, None, None, 0, 50),
+    (None, None, None, 1, 25),                                     # dernière page incomplète
+    (None, None, None, 3, 25),                                     # au-delà de la fin
+    (['Emails suspects', 'Types convertis'], None, None, 0, 12),   # page à cheval sur deux catégories
+    (['Emails suspects', 'Types convertis'], None, None, 1, 12),
+    (['Codes postaux / villes'], 10, 20, 0, 50),                   # bornes de lignes incluses
+    (['Codes postaux / villes'], 21, 20, 0, 50),
+    (['Inconnue'], None, None, 0, 50),
+])
+def test_issue_page_matches_plain_filter(users_issues, categories, row_min, row_max, page, page_size):
+    _, frame = users_issues
+    page_df, total = core.issue_page(frame, core.issue_index(frame), categories, row_min, row_max, page, page_size)
+    keep = frame['ligne'].between(row_min if row_min is not None else 0, row_max if row_max is not None else 10**9)
+    if categories is not None:
+        keep &= frame['catégorie'].isin(categories)
+    expected = frame[keep]
+    assert total == len(expected)
+    assert page_df['message'].tolist() == expected['message'].iloc[page * page_size:(page + 1) * page_size].tolist()
+
+def test_flagged_rows_point_at_the_source_rows(users_issues):
+    df, frame = users_issues
+    df = df.set_axis(range(100, 100 + len(df)))   # ligne N = position N-2, quel que soit l'index
+    flagged = core.flagged_rows(df, frame)
+    errors = frame[frame['niveau'] == 'Erreur']
+    assert flagged['Ligne'].tolist() == sorted(errors['ligne'].unique())
+    for _, row in flagged.iterrows():
+        assert row[df.columns].tolist() == df.iloc[row['Ligne'] - 2].tolist()
+        assert row['Motifs'].split(' | ') == errors.loc[errors['ligne'] == row['Ligne'], 'message'].tolist()
+    both = core.flagged_rows(df, frame, levels=('Erreur', 'Avertissement'))
+    assert set(flagged['Ligne']) < set(both['Ligne'])
+    assert (both['Ligne'] >= 2).all()            # messages de colonne (ligne 0) exclus
+
+def test_auto_map_from_content_with_generic_headers():
+    n = 20
+    df = pd.DataFrame({
+        'Champ0': [f'p{k}@exemple.fr' for k in range(n)], 'Champ1': ['03/04/1990'] * n,
+        'Champ2': ['M.', 'Mme'] * (n // 2), 'Champ3': ['Marie', 'Jean'] * (n // 2), 'Champ4': ['75001'] * n,
+        'Unnamed: 5': ['0612345678'] * n, 'Col 6': ['FR'] * n,
+        'Infos': [f'x{k}@exemple.fr' for k in range(n)],     # en-tête parlant : jamais mappé sur le contenu seul
+    })
+    index = core.build_column_index(df)
+    assert index['generic'] == [True] * 7 + [False]
+    assert [list(found) for found in index['signals']] == [['email'], ['date'], ['civility'], ['firstname'],
+                                                           ['postal'], ['phone'], ['country'], ['email']]
+    assert core.auto_map(df, index=index) == {
+        'Email personnel 1': 'Champ0', 'Date de naissance (jj/mm/aaaa)': 'Champ1',
+        'Civilité (M. / Mme)': 'Champ2', 'Prénom*': 'Champ3', 'Adresse personnelle - Code postal': 'Champ4',
+        'Téléphone mobile personnel': 'Unnamed: 5', 'Adresse personnelle - Pays (ISO - 2 lettres)': 'Col 6',
+    }
+
+def test_auto_map_content_overrides_a_misleading_header():
+    n = 20
+    empty = pd.DataFrame({'Prénom': ['Marie'] * n, 'Mail de contact': [''] * n, 'Adresse courriel': [''] * n})
+    # En-têtes seuls : « mail » en tête l'emporte sur « courriel » en fin
+    assert core.auto_map(empty)['Email personnel 1'] == 'Mail de contact'
+    filled = empty.assign(**{'Mail de contact': ['0612345678'] * n,
+                             'Adresse courriel': [f'p{k}@exemple.fr' for k in range(n)]})
+    assert core.auto_map(filled)['Email personnel 1'] == 'Adresse courriel'
+
+REVIEW_MAPPING = {'Prénom*': 'Prénom', "Nom de naissance / Nom d'état-civil*": 'Nom', 'Email personnel 1': 'Email',
+                  "Type d'utilisateur* (Diplômé [1] / Etudiant [5])": 'Type'}
+
+@pytest.fixture
+def reviewed():
+    df = pd.DataFrame({'Prénom': ['Marie', '', 'Jean', 'Paul'], 'Nom': ['dupont', '', 'MARTIN', 'Durand'],
+                       'Email': ['marie@ex.fr', '', 'pas-un-mail', 'p@ex.fr'], 'Type': ['1', '', '', '5']})
+    review = {}
+    out = core.process(df, REVIEW_MAPPING, review=review, default_user_type_when_missing='1')[0]
+    return out, review['marks']
+
+def test_review_marks_by_category(reviewed):
+    out, marks = reviewed
+    names = list(out.columns)
+    found = {(line, names[c]): (str(cat), origine) for line, c, cat, origine in
+             marks[['ligne', 'colonne', 'catégorie', 'origine']].itertuples(index=False)}
+    nom, email = "Nom de naissance / Nom d'état-civil*", 'Email personnel 1'
+    # La ligne vide est retirée de la sortie : Jean est en ligne 1
+    assert found[(0, nom)] == ('corrigée', 'dupont') and found[(2, nom)] == ('corrigée', 'Durand')
+    assert (1, nom) not in found and (0, email) not in found
+    assert found[(1, email)] == ('invalide', 'pas-un-mail')
+    assert found[(1, "Type d'utilisateur* (Diplômé [1] / Etudiant [5])")] == ('type par défaut', '')
+    assert [found[(k, 'Civilité (M. / Mme)')] for k in range(3)] == [('déduite', '')] * 3
+    assert marks[['ligne', 'colonne']].apply(tuple, axis=1).is_monotonic_increasing
+
+def test_review_workbook_colours_and_comments(reviewed, tmp_path, monkeypatch):
+    from openpyxl import load_workbook
+    out, marks = reviewed
+    monkeypatch.setattr(core, 'REVIEW_MAX_COMMENTS', 5)
+    path = tmp_path / "revue.xlsx"
+    written = core.write_review_workbook(out, marks, path)
+    assert written == {'cells': len(marks), 'comments': 5, 'details': len(marks) - 5}
+    wb = load_workbook(path)
+    ws = wb["Import Utilisateur"]
+    names = list(out.columns)
+    email = ws.cell(row=3, column=names.index('Email personnel 1') + 1)
+    assert email.value == 'pas-un-mail' and email.fill.start_color.rgb == core.REVIEW_FILLS['invalide']
+    nom = ws.cell(row=2, column=names.index("Nom de naissance / Nom d'état-civil*") + 1)
+    assert nom.value == 'DUPONT' and nom.fill.start_color.rgb == core.REVIEW_FILLS['corrigée']
+    assert nom.comment.text == "Valeur d'origine : dupont"
+    assert ws.cell(row=2, column=names.index('Email personnel 1') + 1).fill.fill_type is None
+    # Au-delà des commentaires : détail des cellules restantes dans la feuille Annotations
+    detail = list(wb["Annotations"].iter_rows(min_row=2, values_only=True))
+    assert len(detail) == len(marks) - 5
+    assert (3, 'Email personnel 1', 'invalide', 'pas-un-mail') in {r[:4] for r in detail}
+    summary = {(r[0], r[1]): r[2] for r in wb["Synthèse"].iter_rows(min_row=2, max_col=3, values_only=True) if r[0]}
+    assert summary[('corrigée', '(toutes)')] == 2 and summary[('invalide', 'Email personnel 1')] == 1
+
+DIPLOMA_MAPPING = {'Prénom*': 'Prénom', "Nom de naissance / Nom d'état-civil*": 'Nom',
+                   "Type d'utilisateur* (Diplômé [1] / Etudiant [5])": 'Type',
+                   'Référence du diplôme (Code étape)': 'Code', 'Mode de formation': 'Mode'}
+DIPLOMA_CSV = ("Code étape;Libellé;Mode de formation\nMAS101;Master Finance;Initiale\nMAS101;Master Finance;Alternance\n"
+               "MAS102;Master Audit;Initiale\nLIC200;Licence Droit;Continue\n")
+
+def diploma_frame() -> pd.DataFrame:
+    return pd.DataFrame({'Prénom': ['Marie'] * 5, 'Nom': ['x'] * 5, 'Type': ['1'] * 5,
+                         'Code': ['mas 101', 'MAS103', 'LIC200', '', 'ZZZ'],
+                         'Mode': ['alternance', 'Initiale', 'Initiale', 'Distance', '']})
+
+@pytest.fixture
+def diploma_referential(tmp_path, monkeypatch):
+    import referentiels
+    path = tmp_path / "diplomes.csv"
+    path.write_text(DIPLOMA_CSV, encoding='utf-8')
+    monkeypatch.setattr(referentiels, 'DIPLOMA_REFERENTIAL', str(path))
+    return referentiels.diploma_index()
+
+DIPLOMA_WARNINGS = [
+    "Ligne 3: Code diplôme inconnu 'MAS103' (codes proches : MAS101 (Master Finance), MAS102 (Master Audit))",
+    "Ligne 6: Code diplôme inconnu 'ZZZ'",
+    "Ligne 4: Mode de formation 'Initiale' non proposé pour le code 'LIC200'",
+    "Ligne 5: Mode de formation inconnu 'Distance'",
+]
+
+def test_diploma_codes_and_modes_are_checked(diploma_referential):
+    out, _, errors, warnings = core.process(diploma_frame(), DIPLOMA_MAPPING)
+    # Codes et modes normalisés sur le référentiel ; inconnus gardés tels quels, signalés
+    assert out[['Référence du diplôme (Code étape)', 'Mode de formation']].values.tolist() == [
+        ['MAS101', 'Alternance'], ['MAS103', 'Initiale'], ['LIC200', 'Initiale'], ['', 'Distance'], ['ZZZ', '']]
+    assert errors == [] and [w for w in warnings if 'iplôme' in w or 'formation' in w] == DIPLOMA_WARNINGS
+    out, _, errors, _ = core.process(diploma_frame(), DIPLOMA_MAPPING, strict=True)
+    assert errors == DIPLOMA_WARNINGS
+    assert out['Référence du diplôme (Code étape)'].tolist() == ['MAS101', '', 'LIC200', '', '']
+
+def test_diploma_suggestions_use_the_shared_prefix(diploma_referential):
+    from referentiels import suggest_diploma_codes
+    assert suggest_diploma_codes('MAS10', diploma_referential) == ['MAS101', 'MAS102']
+    assert suggest_diploma_codes('LIC2000', diploma_referential, limit=1) == ['LIC200']
+    assert suggest_diploma_codes('XYZ', diploma_referential) == []
+    assert ('MAS10', 3) in diploma_referential['memo']
+
+def test_diploma_columns_pass_through_without_referential(tmp_path, monkeypatch):
+    import referentiels
+    monkeypatch.setattr(referentiels, 'DIPLOMA_REFERENTIAL', str(tmp_path / "absent.csv"))
+    out, _, errors, warnings = core.process(diploma_frame(), DIPLOMA_MAPPING, strict=True)
+    assert out['Référence du diplôme (Code étape)'].tolist() == ['mas 101', 'MAS103', 'LIC200', '', 'ZZZ']
+    assert errors == [] and not [w for w in warnings if 'iplôme' in w or 'formation' in w]
+
+def long_csv(tail: bytes) -> bytes:
+    """En-tête et 5000 lignes ASCII (plus de SNIFF_BYTES), puis `tail`"""
+    body = "Nom;Prenom;Code\n" + "".join(f"nom{k};prenom{k};0{k % 10}123\n" for k in range(5000))
+    assert len(body) > core.SNIFF_BYTES
+    return body.encode('ascii') + tail
+
+def test_preview_reads_only_the_first_rows():
+    # Ligne irrégulière en fin de fichier : jamais atteinte par l'aperçu
+    data = long_csv(b"x;y;z;champ;en trop\n")
+    preview = core.read_table(BytesIO(data), "clients.csv", nrows=20)
+    assert preview.shape == (20, 3) and preview['Nom'].iloc[-1] == 'nom19'
+    with pytest.raises(pd.errors.ParserError):
+        core.read_table(BytesIO(data), "clients.csv")
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'cp1252'])
+def test_encoding_sniffed_on_the_head_still_reads_later_accents(encoding):
+    # Début ASCII : UTF-8 supposé, repli Windows-1252 si la suite le contredit
+    data = long_csv("Élodie;Café;01000\n".encode(encoding))
+    full = core.read_table(BytesIO(data), "clients.csv")
+    assert len(full) == 5001 and full.iloc[-1][['Nom', 'Prenom']].tolist() == ['Élodie', 'Café']
+
+def test_analysis_sample_spans_the_whole_file():
+    n = 10_000
+    civility = ['M.', 'Mme'] * (n // 2)
+    civility[9990] = 'Monsieurr'                       # valeur rare, tout en fin de fichier
+    df = pd.DataFrame({'Civilité': civility, 'Année': [str(1950 + k * 50 // n) for k in range(n)]})
+    sample = core.build_analysis_sample(df)
+    rows = sample['rows']
+    assert len(rows) == core.SAMPLE_BUDGET and rows.index.is_monotonic_increasing
+    # Fichier trié par année : l'échantillon couvre toutes les années, pas seulement les premières lignes
+    assert rows['Année'].nunique() == 50
+    assert 'Monsieurr' not in rows['Civilité'].values
+    # Colonne à faible cardinalité : comptages exacts, la valeur rare reçoit sa suggestion
+    assert sample['value_counts']['Civilité']['Monsieurr'] == 1 and 'Année' not in sample['value_counts']
+    analysis = core.analyze_column_values(df, 'Civilité', sample)
+    assert analysis['non_empty'] == n and analysis['unique'] == 3
+    assert [(s['original'], s['suggested']) for s in analysis['suggestions']] == [('Monsieurr', 'M.')]
+    assert core.build_analysis_sample(df)['rows'].index.equals(rows.index)     # tirage reproductible
+
+def arrow_sources() -> dict:
+    df = pd.DataFrame({'Prénom': ['Marie', 'Jean', 'Paul'], 'Code postal': ['01000', '75001', None],
+                       'Num': ['007', '1', '2']})
+    parquet, feather = BytesIO(), BytesIO()
+    df.to_parquet(parquet, index=False)
+    df.to_feather(feather)
+    return {'clients.parquet': parquet.getvalue(), 'clients.feather': feather.getvalue(),
+            'clients.csv': df.to_csv(index=False, sep=';').encode('utf-8')}
+
+@pytest.mark.parametrize('name', ['clients.parquet', 'clients.feather', 'clients.csv'])
+def test_arrow_inputs_keep_leading_zeros(name):
+    data = arrow_sources()[name]
+    df = core.read_table(BytesIO(data), name, engine="pyarrow")
+    assert df['Code postal'].tolist()[:2] == ['01000', '75001'] and pd.isna(df['Code postal'].iloc[2])
+    assert df['Num'].tolist() == ['007', '1', '2']
+    assert core.read_table(BytesIO(data), name, nrows=2, engine="pyarrow").shape == (2, 3)
+    assert core.read_table(BytesIO(data), name, engine="pyarrow", columns=['Num', 'Absente']).columns.tolist() == ['Num']
+
+def test_c_engine_still_infers_numbers():
+    df = core.read_table(BytesIO(arrow_sources()['clients.csv']), 'clients.csv')
+    assert df['Num'].tolist() == [7, 1, 2]
+
+def test_parquet_export_round_trip():
+    out = core.process(users_frame(), USERS_MAPPING)[0]
+    back = pd.read_parquet(BytesIO(core.to_parquet_bytes(out)))
+    assert back.equals(out)
+
+def test_output_columns_are_compact():
+    df = pd.concat([users_frame(3000), pd.DataFrame({c: [''] for c in users_frame(1).columns})], ignore_index=True)
+    out, stats, _, _ = core.process(df, USERS_MAPPING)
+    assert stats['total_rows'] == 3001 and out.index.equals(pd.RangeIndex(3000))   # ligne vide retirée
+    # Aucune colonne objet : catégorielle (formats catégoriels seulement) ou texte Arrow
+    for col in core.template_plan()['columns']:
+        dtype = out[col['name']].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            assert col['categorical'], col['name']
+        else:
+            assert getattr(dtype, 'storage', None) == 'pyarrow', col['name']
+    assert isinstance(out["Type d'utilisateur* (Diplômé [1] / Etudiant [5])"].dtype, pd.CategoricalDtype)
+    assert (out["Nom d'usage / Nom marital"] == "").all()
+    assert out.memory_usage(deep=True).sum() * 4 < out.astype(object).memory_usage(deep=True).sum()
+
+CIVILITY_MAPPING = {'Prénom*': 'Prénom', "Nom de naissance / Nom d'état-civil*": 'Nom',
+                    "Type d'utilisateur* (Diplômé [1] / Etudiant [5])": 'Type', 'Civilité (M. / Mme)': 'Civilité'}
+CIVILITY = 'Civilité (M. / Mme)'
+
+@pytest.fixture
+def name_stats(tmp_path, monkeypatch):
+    path = tmp_path / "prenoms.npy"
+    prenoms.write_table({'xalvina': [5000, 10], 'bromir': [0, 40], 'kelig': [300, 300]}, str(path))
+    monkeypatch.setattr(prenoms, 'NAMES_FILE', str(path))
+
+def civility_frame() -> pd.DataFrame:
+    names = ['Marie', 'Xalvina', 'Bromir', 'Kelig', 'Zorglub', 'Xalvina', 'Paul']
+    return pd.DataFrame({'Prénom': names, 'Nom': ['x'] * 7, 'Type': ['1'] * 7,
+                         'Civilité': ['', '', '', '', '', '', 'Madame'],
+                         'Sexe': ['', '', '', '', '', 'homme', '']})
+
+def test_civility_deduced_from_first_names(name_stats):
+    out, _, _, warnings = core.process(civility_frame(), CIVILITY_MAPPING)
+    # Liste de référence, effectifs fréquents, effectifs rares, prénom mixte, inconnu,
+    # indice contraire dans une autre colonne, civilité fournie
+    assert out[CIVILITY].tolist() == ['Mme', 'Mme', 'M.', '', '', '', 'Mme']
+    assert sorted(w for w in warnings if 'Civilité' in w) == [
+        "Ligne 2: Civilité déduite depuis le prénom 'Marie' → 'Mme' (confiance: high)",
+        "Ligne 3: Civilité déduite depuis le prénom 'Xalvina' → 'Mme' (confiance: high)",
+        "Ligne 4: Civilité déduite depuis le prénom 'Bromir' → 'M.' (confiance: medium)",
+    ]
+
+def test_civility_fallback_and_opt_out(name_stats):
+    out, _, _, warnings = core.process(civility_frame(), CIVILITY_MAPPING, civil_fallback='M.')
+    assert out[CIVILITY].tolist() == ['Mme', 'Mme', 'M.', 'M.', 'M.', 'M.', 'Mme']
+    assert "Ligne 6: Civilité manquante, fallback 'M.'" in warnings
+    out, _, _, warnings = core.process(civility_frame(), CIVILITY_MAPPING, auto_civility=False)
+    assert out[CIVILITY].tolist() == [''] * 6 + ['Mme']
+    assert not [w for w in warnings if 'Civilité' in w]
@@ -0,0 +1,25 @@
+import os, py_compile, re, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Coût propre de `import core` une fois pandas chargé (microsecondes, -X importtime)
+IMPORT_BUDGET_US = 25_000
+LAZY_MODULES = {'referentiels', 'fuzzy', 'schema', 'prenoms', 'sirene', 'chardet', 'gender_guesser'}
+
+SCRIPT = """
+import sys
+import pandas
+before = set(sys.modules)
+import core
+print(' '.join(sorted(set(sys.modules) - before)))
+"""
+
+def test_import_core_stays_within_budget():
+    # Bytecode à jour : on mesure l'exécution du module, pas sa compilation
+    py_compile.compile(os.path.join(ROOT, 'core.py'))
+    run = subprocess.run([sys.executable, '-X', 'importtime', '-c', SCRIPT], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    loaded = set(run.stdout.split())
+    assert not loaded & LAZY_MODULES, loaded & LAZY_MODULES
+    assert not any(m == 'pyarrow' or m.startswith('pyarrow.') for m in loaded)
+    cumulative = int(re.search(r"^import time:\s+\d+ \|\s+(\d+) \| core$", run.stderr, re.M).group(1))
+    assert cumulative <= IMPORT_BUDGET_US, f"import core : {cumulative} µs > {IMPORT_BUDGET_US} µs"
@@ -0,0 +1,66 @@
+import threading
+import jobs
+
+GB = 1024 ** 3
+
+def wait_state(sched, job_id, state):
+    for _ in range(200):
+        if sched.status(job_id)['state'] == state:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(sched.status(job_id))
+
+def test_allocated_reservations_are_not_counted_twice(monkeypatch):
+    free = {'bytes': 8 * GB}
+    monkeypatch.setattr(jobs, 'available_memory', lambda: free['bytes'])
+    sched = jobs.JobScheduler(max_workers=2, per_user_limit=1, memory_reserve=0)
+    release = threading.Event()
+    first = sched.submit('a', release.wait, est_bytes=6 * GB)
+    wait_state(sched, first, 'running')
+    with sched._cond:
+        # Rien d'alloué encore : les 6 Go réservés restent à déduire
+        assert not sched._admissible({'user': 'b', 'est_bytes': 3 * GB})
+        # Le premier job a alloué ses 6 Go : MemAvailable en tient déjà compte
+        free['bytes'] = 2 * GB
+        assert sched._admissible({'user': 'b', 'est_bytes': 2 * GB})
+        assert not sched._admissible({'user': 'b', 'est_bytes': 3 * GB})
+    release.set()
+    wait_state(sched, first, 'done')
+    assert sched._baseline is None and sched._reserved == 0
+
+def test_blocked_job_is_overtaken():
+    sched = jobs.JobScheduler(max_workers=2, per_user_limit=1, memory_reserve=0)
+    release = threading.Event()
+    first = sched.submit('a', release.wait)
+    wait_state(sched, first, 'running')
+    second = sched.submit('a', lambda: 'a')       # limite de l'utilisateur a atteinte
+    third = sched.submit('b', lambda: 'b')
+    wait_state(sched, third, 'done')
+    assert sched.status(second)['state'] == 'queued'
+    release.set()
+    wait_state(sched, second, 'done')
+
+def test_finished_jobs_expire_after_ttl():
+    sched = jobs.JobScheduler(max_workers=1, per_user_limit=1, memory_reserve=0, ttl=0.2)
+    release = threading.Event()
+    done = sched.submit('a', lambda: 'ok')
+    wait_state(sched, done, 'done')
+    assert sched.status(done)['finished'] is not None
+    failed = sched.submit('b', lambda: 1 / 0)
+    wait_state(sched, failed, 'failed')
+    running = sched.submit('c', release.wait)
+    wait_state(sched, running, 'running')
+    threading.Event().wait(0.3)
+    sched.submit('d', lambda: None)               # la purge a lieu au dépôt
+    assert sched.status(done) is None and sched.status(failed) is None
+    # Un job en cours n'expire pas, quelle que soit son ancienneté
+    assert sched.status(running)['state'] == 'running'
+    release.set()
+    wait_state(sched, running, 'done')
+
+def test_no_expiry_without_ttl():
+    sched = jobs.JobScheduler(max_workers=1, per_user_limit=1, memory_reserve=0, ttl=None)
+    done = sched.submit('a', lambda: 'ok')
+    wait_state(sched, done, 'done')
+    sched.submit('b', lambda: None)
+    assert sched.status(done)['result'] == 'ok'
@@ -0,0 +1,107 @@
+import threading, time
+import pytest
+import core
+import pipeline
+from test_core import users_frame, USERS_MAPPING
+
+TIMEOUT = 30    # au-delà, le pipeline est considéré bloqué
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "users.csv"
+    users_frame(100).to_csv(path, index=False)
+    return path
+
+def expected_csv(path) -> bytes:
+    with open(path, 'rb') as f:
+        df = core.read_table(f, path.name, engine="pyarrow")
+    return core.to_csv_bytes(core.process(df, USERS_MAPPING)[0])
+
+def run(source, target, **kwargs) -> dict:
+    """run_pipeline dans un thread : échoue au lieu de bloquer la suite de tests"""
+    outcome = {}
+    def body():
+        try:
+            outcome['result'] = pipeline.run_pipeline(lambda: open(source, 'rb'), source.name, target,
+                                                      mapping=USERS_MAPPING, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+    thread = threading.Thread(target=body, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), "pipeline bloqué"
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+class SlowFile:
+    """Cible d'écriture lente (ou qui échoue au n-ième bloc)"""
+
+    def __init__(self, delay: float = 0.0, fail_at: int | None = None):
+        self.delay, self.fail_at, self.chunks = delay, fail_at, []
+
+    def write(self, data: bytes) -> int:
+        if self.fail_at is not None and len(self.chunks) >= self.fail_at:
+            raise OSError("disque plein")
+        time.sleep(self.delay)
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+def test_output_order_matches_process(source):
+    target = SlowFile()
+    res = run(source, target, workers=3, chunk_rows=7)
+    with open(source, 'rb') as f:
+        _, stats, errors, warnings = core.process(core.read_table(f, source.name, engine="pyarrow"), USERS_MAPPING)
+    assert b"".join(target.chunks) == expected_csv(source)
+    # Journal ordonné bloc par bloc : mêmes messages, pas forcément dans le même ordre
+    assert res['stats'] == stats and res['errors'] == errors
+    assert sorted(res['warnings']) == sorted(warnings)
+    assert res['metrics'][2]['Blocs'] == 15
+
+def test_slow_writer_applies_backpressure(source, monkeypatch):
+    in_flight, peak, lock = [0], [0], threading.Lock()
+    original = pipeline.process
+    def counting_process(chunk, *args, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        return original(chunk, *args, **kwargs)
+    monkeypatch.setattr(pipeline, 'process', counting_process)
+    target = SlowFile(delay=0.02)
+    original_write = target.write
+    def write(data):
+        with lock:
+            in_flight[0] -= 1
+        return original_write(data)
+    target.write = write
+    run(source, target, workers=2, chunk_rows=5, queue_size=1)
+    assert b"".join(target.chunks) == expected_csv(source)
+    # Blocs formatés mais pas encore écrits : jamais plus que la fenêtre 2 * queue_size + workers
+    assert peak[0] <= 2 * 1 + 2
+
+def test_reader_error_is_raised(source, monkeypatch):
+    original = pipeline.iter_table
+    def failing(*args, **kwargs):
+        blocks = original(*args, **kwargs)
+        yield next(blocks)
+        raise ValueError("lecture impossible")
+    monkeypatch.setattr(pipeline, 'iter_table', failing)
+    with pytest.raises(ValueError, match="lecture impossible"):
+        run(source, SlowFile(), workers=2, chunk_rows=7)
+
+def test_worker_error_is_raised(source, monkeypatch):
+    original = pipeline.process
+    def failing(chunk, *args, offset=0, **kwargs):
+        if offset >= 21:
+            raise RuntimeError("formatage impossible")
+        return original(chunk, *args, offset=offset, **kwargs)
+    monkeypatch.setattr(pipeline, 'process', failing)
+    with pytest.raises(RuntimeError, match="formatage impossible"):
+        run(source, SlowFile(), workers=3, chunk_rows=7)
+
+def test_writer_error_is_raised(source):
+    with pytest.raises(OSError, match="disque plein"):
+        run(source, SlowFile(fail_at=2), workers=2, chunk_rows=7, queue_size=1)
@@ -0,0 +1,39 @@
+import os
+import numpy as np, pandas as pd
+import core, prenoms, referentiels, result_cache
+
+def test_key_changes_with_referential(tmp_path, monkeypatch):
+    ref = tmp_path / "codes_postaux.csv"
+    ref.write_text("Code_postal;Nom_de_la_commune\n75001;PARIS\n", encoding='utf-8')
+    monkeypatch.setattr(referentiels, 'POSTAL_REFERENTIAL', str(ref))
+    key = result_cache.cache_key("f", {'a': 'b'}, None, {'strict': False})
+    assert result_cache.cache_key("f", {'a': 'b'}, None, {'strict': False}) == key
+    ref.write_text("Code_postal;Nom_de_la_commune\n75001;PARIS\n69001;LYON\n", encoding='utf-8')
+    assert result_cache.cache_key("f", {'a': 'b'}, None, {'strict': False}) != key
+
+def test_column_cache_follows_referential(tmp_path, monkeypatch):
+    names = tmp_path / "prenoms.npy"
+    monkeypatch.setattr(prenoms, 'NAMES_FILE', str(names))
+    df = pd.DataFrame({'Prénom': ['Camille'], 'Nom': ['x'], 'Type': ['1']})
+    mapping = {'Prénom*': 'Prénom', "Nom de naissance / Nom d'état-civil*": 'Nom',
+               "Type d'utilisateur* (Diplômé [1] / Etudiant [5])": 'Type'}
+    cache = core.ColumnCache()
+    core.process(df, mapping, column_cache=cache)
+    core.process(df, mapping, column_cache=cache)
+    assert cache.hits == cache.misses
+    hits = cache.hits
+    np.save(names, np.zeros(0, dtype=prenoms.NAMES_DTYPE))
+    core.process(df, mapping, column_cache=cache)
+    # Seules les lignes non vides (qui ne lisent aucun référentiel) restent valables
+    assert cache.hits == hits + 1
+
+def test_annex_file_joins_published_entry(tmp_path):
+    cache_dir = str(tmp_path)
+    result = (pd.DataFrame({'a': ['x']}), {'total_rows': 1}, [], ["Ligne 2: avertissement"])
+    result_cache.put_file("k", "review.xlsx", b"absent", cache_dir=cache_dir)   # entrée pas encore publiée
+    assert result_cache.get_file("k", "review.xlsx", cache_dir=cache_dir) is None
+    result_cache.put("k", result, cache_dir=cache_dir)
+    result_cache.put_file("k", "review.xlsx", b"classeur", cache_dir=cache_dir)
+    assert result_cache.get_file("k", "review.xlsx", cache_dir=cache_dir) == b"classeur"
+    assert result_cache.get("k", cache_dir=cache_dir)[3] == result[3]
+    assert sorted(os.listdir(tmp_path / "k")) == ["issues.parquet", "result.parquet", "review.xlsx", "stats.json"]
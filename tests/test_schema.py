@@ -0,0 +1,68 @@
+import json
+import pytest
+import pandas as pd
+import core
+import schema
+
+CONTACTS = {
+    'name': 'contacts', 'required_message': 'Nom manquant',
+    'columns': [
+        {'name': 'Civilité', 'format': 'civility', 'inputs': {'firstname': 'Prénom'}},
+        {'name': 'Prénom', 'format': 'firstname', 'keywords': ['prénom']},
+        {'name': 'Nom', 'format': 'lastname', 'required': True, 'keywords': ['nom'],
+         'fallback_columns': {'names': ['Name'], 'if_mapped': 'Prénom'}},
+        {'name': 'Remarque'},
+    ],
+}
+
+def write_template(directory, name: str, content: dict) -> tuple:
+    (directory / f"{name}.json").write_text(json.dumps(content), encoding='utf-8')
+    return schema.template_version(name, str(directory))
+
+def test_template_compiles_to_plan(tmp_path, monkeypatch):
+    version = write_template(tmp_path, 'contacts', CONTACTS)
+    plan = core._compile_plan(version)
+    assert plan['names'] == ['Civilité', 'Prénom', 'Nom', 'Remarque']
+    assert plan['required'] == (2,) and plan['required_message'] == 'Nom manquant'
+    civility, _, nom, remarque = plan['columns']
+    assert civility['inputs'] == {'firstname': (1,)} and civility['depends'] == (1,)
+    assert nom['fallback_columns'] == {'names': ['name'], 'if_mapped': 'Prénom'}
+    assert remarque['format'] == 'text' and remarque['keywords'] == []
+    # Le prénom, lu par la civilité placée avant lui, est gardé jusqu'à sa propre colonne
+    assert plan['needed_until'] == {1: 1}
+
+    monkeypatch.setattr(schema, 'TEMPLATES_DIR', str(tmp_path))
+    df = pd.DataFrame({'Prénom': ['Marie', 'Jean'], 'Nom': ['Dupont', '']})
+    out, stats, errors, _ = core.process(df, {'Prénom': 'Prénom', 'Nom': 'Nom'}, template='contacts')
+    assert list(out.columns) == plan['names']
+    assert out['Civilité'].tolist() == ['Mme', 'M.'] and out['Nom'].tolist() == ['DUPONT', '']
+    assert errors == ['Ligne 3: Nom manquant'] and stats['valid_rows'] == 1
+
+@pytest.mark.parametrize('change, message', [
+    ({'columns': []}, "aucune colonne"),
+    ({'columns': [{'name': 'A'}, {'name': 'A'}]}, r"colonne 1 sans nom ou en double \('A'\)"),
+    ({'columns': [{'format': 'text'}]}, "colonne 0 sans nom"),
+    ({'columns': [{'name': 'A', 'inputs': {'firstname': 'B'}}]}, r"A référence une colonne inconnue \('B'\)"),
+    ({'columns': [{'name': 'A', 'fallback_columns': {'names': ['x'], 'if_mapped': 'B'}}]},
+     "référence une colonne inconnue"),
+    ({'columns': [{'name': 'A', 'format': 'adresse'}]}, r"colonne 'A' : format inconnu 'adresse'"),
+    ({'columns': [{'name': 'A', 'format': 'user_type'}, {'name': 'B', 'format': 'user_type'}]},
+     "une seule colonne 'user_type'"),
+])
+def test_invalid_template_is_rejected(tmp_path, change, message):
+    version = write_template(tmp_path, 'faux', {**CONTACTS, **change})
+    with pytest.raises(ValueError, match=message):
+        core._compile_plan(version)
+
+def test_unknown_template_names(tmp_path):
+    write_template(tmp_path, 'contacts', CONTACTS)
+    with pytest.raises(ValueError, match=r"Gabarit inconnu : 'autre' \(disponibles : contacts\)"):
+        schema.template_version('autre', str(tmp_path))
+    with pytest.raises(ValueError, match="Nom de gabarit invalide"):
+        schema.template_version('../contacts', str(tmp_path))
+
+def test_edited_template_is_recompiled(tmp_path):
+    first = core._compile_plan(write_template(tmp_path, 'contacts', CONTACTS))
+    edited = {**CONTACTS, 'columns': CONTACTS['columns'] + [{'name': 'Ville ou commune'}]}
+    second = core._compile_plan(write_template(tmp_path, 'contacts', edited))
+    assert second['names'] == first['names'] + ['Ville ou commune']
@@ -0,0 +1,68 @@
+import pytest
+import pandas as pd
+import core
+import sirene
+
+def siret(base: str) -> str:
+    """Complète 13 chiffres par la clé de Luhn"""
+    return next(base + d for d in "0123456789" if core._luhn_ok(base + d))
+
+ACTIVE, CLOSED, OWN_NAME, MISSING = (siret(b) for b in ("1234567890001", "1234567890002",
+                                                         "5550000000001", "9999999990001"))
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    etab = pd.DataFrame({
+        'siret': [ACTIVE, CLOSED, OWN_NAME, ACTIVE],       # doublon : la première fiche l'emporte
+        'codePostalEtablissement': ['69003', '75008', '13001', '00000'],
+        'libelleCommuneEtablissement': ['LYON 3E ARRONDISSEMENT', 'PARIS 8', 'MARSEILLE', 'AILLEURS'],
+        'etatAdministratifEtablissement': ['A', 'F', 'A', 'A'],
+        'enseigne1Etablissement': [None, None, 'BOULANGERIE DU PORT', None],
+    })
+    units = pd.DataFrame({'siren': ['123456789'], 'denominationUniteLegale': ['SOCIÉTÉ EXEMPLE SAS']})
+    etab.to_csv(tmp_path / "etab.csv", index=False)
+    units.to_csv(tmp_path / "unites.csv", index=False)
+    directory = tmp_path / "sirene"
+    assert sirene.build_index(str(tmp_path / "etab.csv"), str(tmp_path / "unites.csv"), str(directory)) == 3
+    monkeypatch.setattr(sirene, 'SIRENE_DIR', str(directory))
+    return directory
+
+def test_lookup_hits_misses_and_closed(index_dir):
+    spaced = f"{ACTIVE[:3]} {ACTIVE[3:6]} {ACTIVE[6:9]} {ACTIVE[9:]}"
+    found = sirene.lookup([spaced, CLOSED, OWN_NAME, MISSING, "", "123", None])
+    assert found['found'].tolist() == [True, True, True, False, False, False, False]
+    assert found['active'].tolist() == [True, False, True, False, False, False, False]
+    # Dénomination de l'unité légale prioritaire, enseigne à défaut
+    assert found['name'].tolist()[:4] == ['SOCIÉTÉ EXEMPLE SAS', 'SOCIÉTÉ EXEMPLE SAS', 'BOULANGERIE DU PORT', '']
+    assert found[['postal', 'city']].values.tolist()[:2] == [['69003', 'LYON 3E ARRONDISSEMENT'], ['75008', 'PARIS 8']]
+
+def test_lookup_without_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(sirene, 'SIRENE_DIR', str(tmp_path / "absent"))
+    assert sirene.sirene_index() is None and sirene.lookup([ACTIVE]) is None
+
+SIRENE_MAPPING = {'Prénom*': 'Prénom', "Nom de naissance / Nom d'état-civil*": 'Nom',
+                  "Type d'utilisateur* (Diplômé [1] / Etudiant [5])": 'Type',
+                  'Entreprise - Code SIRET': 'SIRET', 'Entreprise - Nom': 'Entreprise',
+                  'Adresse professionnelle - Code postal': 'CP pro', 'Adresse professionnelle - Ville': 'Ville pro'}
+
+def company_frame() -> pd.DataFrame:
+    return pd.DataFrame({'Prénom': ['Marie'] * 4, 'Nom': ['x'] * 4, 'Type': ['1'] * 4,
+                         'SIRET': [ACTIVE, CLOSED, MISSING, OWN_NAME],
+                         'Entreprise': ['', 'Exemple', '', 'Autre enseigne'],
+                         'CP pro': ['', '', '', '13002'], 'Ville pro': ['', '', '', '']})
+
+def test_process_checks_and_completes_company_fields(index_dir):
+    out, _, _, warnings = core.process(company_frame(), SIRENE_MAPPING)
+    assert out['Entreprise - Nom'].tolist() == ['SOCIÉTÉ EXEMPLE SAS', 'Exemple', '', 'Autre enseigne']
+    assert out['Adresse professionnelle - Code postal'].tolist() == ['69003', '75008', '', '13002']
+    assert out['Adresse professionnelle - Ville'].tolist()[:2] == ['LYON 3E ARRONDISSEMENT', 'PARIS 8']
+    assert sorted(w for w in warnings if 'SIRENE' in w) == [
+        f"Ligne 3: SIRET '{CLOSED}' : établissement fermé (SIRENE)",
+        f"Ligne 4: SIRET '{MISSING}' absent de l'extrait SIRENE",
+        "Ligne 5: Code postal professionnel '13002' différent de SIRENE '13001' (MARSEILLE)",
+        "Ligne 5: Entreprise 'Autre enseigne' différente du nom SIRENE 'BOULANGERIE DU PORT'",
+    ]
+    # Contrôle désactivé : colonnes telles quelles
+    out, _, _, warnings = core.process(company_frame(), SIRENE_MAPPING, check_sirene=False)
+    assert out['Entreprise - Nom'].tolist() == ['', 'Exemple', '', 'Autre enseigne']
+    assert not [w for w in warnings if 'SIRENE' in w]